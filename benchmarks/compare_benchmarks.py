@@ -0,0 +1,41 @@
+# Compares two result files written by pipeline_benchmark.py, e.g. before
+# and after a change or a Fiji update:
+#   python benchmarks/compare_benchmarks.py before.json after.json
+#
+# For every image size, prints the median time of both runs, the speedup
+# and the stages whose mean time changed by more than the tolerance, and
+# warns when the measured networks differ.
+
+import json
+import sys
+
+from collections import OrderedDict
+
+
+def load(path):
+    with open(path) as handle:
+        report = json.load(handle, object_pairs_hook=OrderedDict)
+    return(OrderedDict([((row["width"], row["height"], row["depth"]), row) for row in report["results"]]))
+
+
+def compare(before_path, after_path, tolerance=0.1):
+    before, after = load(before_path), load(after_path)
+    print("%16s %12s %12s %10s" % ("size", "before (s)", "after (s)", "speedup"))
+    for size in before:
+        if size not in after:
+            continue
+        a, b = before[size], after[size]
+        print("%16s %12.3f %12.3f %10.2f" % ("%sx%sx%s" % size, a["time median (s)"], b["time median (s)"],
+                                             a["time median (s)"] / max(b["time median (s)"], 1e-9)))
+        for stage in a["stages"]:
+            if stage not in b["stages"]:
+                continue
+            old, new = a["stages"][stage]["mean time (s)"], b["stages"][stage]["mean time (s)"]
+            if abs(new - old) > tolerance * max(old, 1e-3):
+                print("%16s %12.3f %12.3f %10.2f  %s" % ("", old, new, old / max(new, 1e-9), stage))
+        if a["measured"] != b["measured"]:
+            print("%16s results differ: %s" % ("", ", ".join([key for key in a["measured"]
+                                                              if a["measured"][key] != b["measured"].get(key)])))
+
+if __name__ == "__main__":
+    compare(sys.argv[1], sys.argv[2])
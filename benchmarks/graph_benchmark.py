@@ -0,0 +1,183 @@
+# Compares the per-object graph loop MiNA used to tabulate skeleton graphs
+# with mina.graph.CompactGraph on synthetic skeleton graphs.
+#
+# The synthetic graphs mimic the AnalyzeSkeleton API (getGraph, getVertices,
+# getEdges, ...) with plain python objects and mina.graph is pure python, so
+# this runs in jython or CPython:
+#   python benchmarks/graph_benchmark.py [n_edges ...]
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import mina.graph
+
+
+class Point():
+    def __init__(self, x, y, z):
+        self.x, self.y, self.z = x, y, z
+
+
+class Vertex():
+    def __init__(self, x, y, z):
+        self.points = [Point(x, y, z)]
+
+    def getPoints(self):
+        return self
+
+    def get(self, index):
+        return self.points[index]
+
+
+class Edge():
+    def __init__(self, v1, v2, length):
+        self.v1, self.v2, self.length = v1, v2, length
+
+    def getV1(self):
+        return self.v1
+
+    def getV2(self):
+        return self.v2
+
+    def getLength(self):
+        return self.length
+
+
+class Graph():
+    def __init__(self):
+        self.vertices = []
+        self.edges = []
+        self.loops = 0
+
+    def getVertices(self):
+        return self.vertices
+
+    def getEdges(self):
+        return self.edges
+
+
+class SkeletonResult():
+    def __init__(self, graphs):
+        self.graphs = graphs
+
+    def getGraph(self):
+        return self.graphs
+
+    def getBranches(self):
+        # Differs from the edge count, so the tables must carry these counts through
+        return [len(graph.edges) - graph.loops for graph in self.graphs]
+
+
+def synthetic_skeleton(n_edges, network_size=50, loop_fraction=0.1, seed=0):
+    '''
+    Random trees of about network_size branches, some with extra loops.
+    '''
+    rng = random.Random(seed)
+    graphs = []
+    while n_edges > 0:
+        graph = Graph()
+        size = min(n_edges, rng.randint(1, 2 * network_size))
+        graph.vertices.append(Vertex(rng.random() * 1000, rng.random() * 1000, rng.random() * 10))
+        for i in range(size):
+            parent = rng.choice(graph.vertices)
+            if i > 1 and rng.random() < loop_fraction:
+                child = rng.choice(graph.vertices)
+                graph.loops += 1
+            else:
+                p = parent.points[0]
+                child = Vertex(p.x + rng.random(), p.y + rng.random(), p.z)
+                graph.vertices.append(child)
+            graph.edges.append(Edge(parent, child, 1.0 + rng.random() * 5.0))
+        graphs.append(graph)
+        n_edges -= size
+    return SkeletonResult(graphs)
+
+
+def object_tables(skel_result):
+    '''
+    The graph loop of graph_tables before CompactGraph.
+    '''
+    branch_columns = ["network", "branch", "v1", "v2", "branch length",
+                      "v1 x", "v1 y", "v1 z", "v2 x", "v2 y", "v2 z",
+                      "euclidean distance", "tortuosity"]
+    network_columns = ["network", "branches", "vertices", "junctions", "end points",
+                       "summed branch length", "donut"]
+    branches = dict([(column, []) for column in branch_columns])
+    networks = dict([(column, []) for column in network_columns])
+    tree_branches = list(skel_result.getBranches())
+    vertex_ids = {}
+    for network, graph in enumerate(skel_result.getGraph()):
+        summed_length = 0.0
+        edges = graph.getEdges()
+        degrees = {}
+        for index, edge in enumerate(edges):
+            length = edge.getLength()
+            summed_length += length
+            ends = []
+            for vertex in [edge.getV1(), edge.getV2()]:
+                if vertex in degrees:
+                    degrees[vertex] += 1
+                else:
+                    degrees[vertex] = 1
+                if vertex not in vertex_ids:
+                    vertex_ids[vertex] = len(vertex_ids)
+                p = vertex.getPoints().get(0)
+                ends.append((p.x, p.y, p.z))
+            distance = sum([(a - b) ** 2.0 for a, b in zip(ends[0], ends[1])]) ** 0.5
+            branches["network"].append(network)
+            branches["branch"].append(index)
+            branches["v1"].append(vertex_ids[edge.getV1()])
+            branches["v2"].append(vertex_ids[edge.getV2()])
+            branches["branch length"].append(length)
+            for name, point in zip(["v1", "v2"], ends):
+                branches[name + " x"].append(point[0])
+                branches[name + " y"].append(point[1])
+                branches[name + " z"].append(point[2])
+            branches["euclidean distance"].append(distance)
+            if distance > 0:
+                branches["tortuosity"].append(length / distance)
+            else:
+                branches["tortuosity"].append(float("nan"))
+        counts = list(degrees.values())
+        networks["network"].append(network)
+        networks["branches"].append(tree_branches[network])
+        networks["vertices"].append(len(graph.getVertices()))
+        networks["junctions"].append(len([c for c in counts if c > 2]))
+        networks["end points"].append(len([c for c in counts if c == 1]))
+        networks["summed branch length"].append(summed_length)
+        networks["donut"].append(1 if len(edges) >= 1 and min(counts) > 1 else 0)
+    return branches, networks
+
+
+def timed(function, *args):
+    start = time.time()
+    result = function(*args)
+    return(time.time() - start, result)
+
+
+def run(sizes):
+    print("%10s %10s %18s %18s %18s" % ("edges", "networks", "object loop (s)",
+                                        "compact build (s)", "compact tables (s)"))
+    for n in sizes:
+        skel_result = synthetic_skeleton(n)
+
+        legacy, (expected_branches, expected_networks) = timed(object_tables, skel_result)
+        build, graph = timed(mina.graph.CompactGraph.fromSkeletonResult, skel_result)
+        tables, (branches, networks) = timed(graph.tables)
+
+        # vertex ids are numbered differently, everything else must match
+        for column in ["network", "branch", "branch length", "v1 x", "v2 z"]:
+            assert expected_branches[column] == branches[column], column
+        for column in expected_networks:
+            assert expected_networks[column] == networks[column], column
+
+        print("%10d %10d %18.4f %18.4f %18.4f" % (n, graph.n_networks, legacy, build, tables))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run([int(n) for n in sys.argv[1:]])
+    else:
+        run([10 ** 5, 10 ** 6])
@@ -0,0 +1,167 @@
+#@ String(label="2D sizes (width = height):", value="256,512,1024,2048") sizes_2D
+#@ String(label="3D sizes (width x depth):", value="128x16,256x32") sizes_3D
+#@ Integer(label="Networks per 256 x 256 pixels:", value=16) network_density
+#@ Integer(label="Donuts per 256 x 256 pixels:", value=2) donut_density
+#@ Integer(label="Maximum branches per network:", value=9) max_branches
+#@ Float(label="Branch density (0-1):", value=0.6) branch_density
+#@ Float(label="Tubule thickness (pixels):", value=3.0) thickness
+#@ Float(label="Noise (standard deviation):", value=30.0) noise
+#@ String(label="Thresholding op:", value="otsu") threshold_method
+#@ Integer(label="Repeats:", value=3) repeats
+#@ Integer(label="Seed:", value=0) seed
+#@ Integer(label="Tiled check block size (0 to skip):", value=96) tiled_size
+#@ String(label="Results file (.json):", value="") output_path
+
+#@ OpService ops
+
+# Runs the morphology analysis (mina.analysis.analyze_image) on synthetic
+# networks of increasing size and writes the throughput, the time and peak
+# heap usage of every stage and the error against the ground truth to a
+# JSON file, so that runs before and after a change can be compared.
+#
+# Unless tiled_size is 0, every image is also analyzed in blocks of
+# tiled_size pixels (mina.tiled.analyze_tiled) and the stitched result is
+# compared with the in-memory one; the run fails if they differ.
+#
+# The networks are generated from the seed, so every run analyzes the same
+# images. Run headless with:
+#   ImageJ --headless --run benchmarks/pipeline_benchmark.py 'sizes_2D="512,1024",output_path="before.json"'
+
+import json
+import os
+import time
+
+from collections import OrderedDict
+
+from ij import IJ
+from java.lang import Runtime, System
+
+import mina.analysis
+import mina.profiling
+import mina.statistics
+import mina.synthetic
+import mina.tiled
+
+
+def parse_sizes():
+    sizes = []
+    for size in sizes_2D.split(","):
+        if size.strip() != "":
+            sizes.append((int(size), int(size), 1))
+    for size in sizes_3D.split(","):
+        if size.strip() != "":
+            width, depth = [int(value) for value in size.lower().split("x")]
+            sizes.append((width, width, depth))
+    return(sizes)
+
+
+def measured(parameters, branches, networks):
+    return({"networks": len(networks["network"]),
+            "branches": len(branches["network"]),
+            "junctions": sum(networks["junctions"]),
+            "end points": sum(networks["end points"]),
+            "donuts": sum(networks["donut"]),
+            "summed branch length": sum(branches["branch length"]),
+            "footprint": parameters["mitochondrial footprint"]})
+
+
+# The tiled branch lengths follow the voxel path, which differs slightly from
+# AnalyzeSkeleton at junctions, every other count must match exactly
+TILED_LENGTH_TOLERANCE = 0.05
+
+
+def tiled_check(imp, result):
+    parameters, branches, networks = mina.tiled.analyze_tiled(imp, ops, threshold_method, tile_size=tiled_size,
+                                                              tile_depth=max(1, tiled_size // 4), tables=True)
+    tiled = measured(parameters, branches, networks)
+    differences = OrderedDict([(key, (tiled[key] - result[key]) / float(result[key])
+                                if result[key] else float(tiled[key] != result[key]))
+                               for key in result])
+    matches = all([abs(difference) <= (TILED_LENGTH_TOLERANCE if key == "summed branch length" else 0)
+                   for key, difference in differences.items()])
+    return(OrderedDict([("block size", tiled_size), ("blocks", parameters["blocks"]),
+                        ("measured", tiled), ("relative difference", differences), ("matches", matches)]))
+
+
+def benchmark(width, height, depth):
+    tiles = width * height / (256.0 * 256.0)
+    networks = mina.synthetic.synthetic_networks(width, height, depth,
+                                                 networks=max(1, int(network_density * tiles)),
+                                                 branches=max_branches, branch_density=branch_density,
+                                                 donuts=int(donut_density * tiles), thickness=thickness,
+                                                 seed=seed)
+    imp, footprint = mina.synthetic.render_networks(networks, noise=noise, seed=seed)
+    truth = networks.truth()
+    truth["footprint"] = footprint
+
+    times = []
+    profiles = []
+    for repeat in range(repeats):
+        profiler = mina.profiling.Profiler()
+        start = time.time()
+        parameters, branches, tables = mina.analysis.analyze_image(imp, ops, threshold_method, tables=True,
+                                                                   profiler=profiler)
+        times.append(time.time() - start)
+        profiles.append(profiler)
+    result = measured(parameters, branches, tables)
+
+    seconds = mina.statistics.median(times)
+    row = OrderedDict([("width", width), ("height", height), ("depth", depth),
+                       ("pixels", width * height * depth),
+                       ("time median (s)", seconds),
+                       ("time min (s)", min(times)),
+                       ("megapixels per second", width * height * depth / seconds / 1e6),
+                       ("branches per second", result["branches"] / seconds),
+                       ("stages", mina.profiling.aggregate_profiles(profiles)),
+                       ("truth", truth),
+                       ("measured", result),
+                       ("relative error", OrderedDict([(key, (result[key] - truth[key]) / float(truth[key])
+                                                        if truth[key] else float("nan"))
+                                                       for key in truth]))])
+    if tiled_size > 0:
+        row["tiled"] = tiled_check(imp, result)
+    return(row)
+
+
+def run():
+    runtime = Runtime.getRuntime()
+    report = OrderedDict([("date", time.strftime("%Y-%m-%d %H:%M:%S")),
+                          ("imagej", IJ.getFullVersion()),
+                          ("java", System.getProperty("java.version")),
+                          ("processors", runtime.availableProcessors()),
+                          ("max heap (MB)", runtime.maxMemory() / 1024 ** 2),
+                          ("settings", OrderedDict([("network density", network_density),
+                                                    ("donut density", donut_density),
+                                                    ("max branches", max_branches),
+                                                    ("branch density", branch_density),
+                                                    ("thickness", thickness), ("noise", noise),
+                                                    ("thresholding op", threshold_method),
+                                                    ("repeats", repeats), ("seed", seed)])),
+                          ("results", [])])
+
+    print("%16s %12s %10s %12s %12s %8s %12s" % ("size", "time (s)", "MP/s", "branches", "truth", "tiled",
+                                                 "slowest stage"))
+    mismatches = []
+    for width, height, depth in parse_sizes():
+        row = benchmark(width, height, depth)
+        report["results"].append(row)
+        slowest = list(row["stages"].keys())[0]
+        size = "%sx%sx%s" % (width, height, depth)
+        tiled = "-"
+        if "tiled" in row:
+            tiled = "ok" if row["tiled"]["matches"] else "DIFFERS"
+            if not row["tiled"]["matches"]:
+                mismatches.append(size)
+        print("%16s %12.3f %10.2f %12d %12d %8s %12s" % (size, row["time median (s)"],
+                                                         row["megapixels per second"], row["measured"]["branches"],
+                                                         row["truth"]["branches"], tiled, slowest))
+
+    path = output_path or "mina-benchmark-%s.json" % time.strftime("%Y%m%d-%H%M%S")
+    with open(path, "w") as handle:
+        handle.write(json.dumps(report, indent=1))
+    print("Results written to %s" % os.path.abspath(path))
+    if mismatches:
+        raise AssertionError("the tiled analysis differs from the in-memory one for %s" % ", ".join(mismatches))
+
+if (__name__=="__main__") or (__name__=="__builtin__"):
+    run()
@@ -0,0 +1,66 @@
+# Compares the median (selection) and quantiles (one sort) of mina.statistics with
+# sorting the data once and indexing it.
+#
+# mina.statistics is pure python, so this runs in jython or CPython:
+#   python benchmarks/statistics_benchmark.py [size ...]
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import mina.statistics
+
+
+def sorted_median(data):
+    data = sorted(data)
+    n = len(data)
+    if n % 2 == 1:
+        return data[n // 2]
+    i = n // 2
+    return (data[i - 1] + data[i]) / 2.0
+
+
+def sorted_quantiles(data, qs):
+    # One sort shared by every quantile, then indexing
+    data = sorted(data)
+    result = []
+    for q in qs:
+        position = q * (len(data) - 1)
+        lower = int(position)
+        upper = min(lower + 1, len(data) - 1)
+        result.append(data[lower] + (data[upper] - data[lower]) * (position - lower))
+    return result
+
+
+def timed(function, *args):
+    start = time.time()
+    result = function(*args)
+    return(time.time() - start, result)
+
+
+def run(sizes):
+    qs = [0.05, 0.25, 0.5, 0.75, 0.95]
+    print("%10s %16s %16s %22s %22s" % ("n", "sort median (s)", "select median (s)",
+                                        "5 quantiles sort (s)", "5 quantiles mina (s)"))
+    for n in sizes:
+        data = [random.expovariate(1.0) for i in range(n)]
+
+        sort_median, expected = timed(sorted_median, data)
+        select_median, actual = timed(mina.statistics.median, data)
+        assert expected == actual
+
+        sort_quantiles, expected = timed(sorted_quantiles, data, qs)
+        select_quantiles, actual = timed(mina.statistics.quantiles, data, qs)
+        assert all(abs(a - b) < 1e-12 for a, b in zip(expected, actual))
+
+        print("%10d %16.4f %16.4f %22.4f %22.4f" % (n, sort_median, select_median,
+                                                    sort_quantiles, select_quantiles))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run([int(n) for n in sys.argv[1:]])
+    else:
+        run([10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7])
@@ -0,0 +1,69 @@
+#@ String(label="Row counts:", value="1000,100000,1000000") row_counts
+#@ Integer(label="Numeric columns:", value=10) n_columns
+
+# Compares writing and reading a SimpleSheet cell by cell (the former
+# writeRows/getColumn path) against the columnar writeColumns/getColumns path,
+# and times appending the same rows to a table in 10 blocks.
+#
+# Run headless with:
+#   ImageJ --headless --run benchmarks/tables_benchmark.py 'row_counts="1000,100000"'
+
+import random
+import time
+
+from collections import OrderedDict
+
+import mina.tables
+
+
+def make_columns(rows):
+    columns = OrderedDict()
+    for c in range(n_columns):
+        columns["column %s" % c] = [random.random() for r in range(rows)]
+    return(columns)
+
+
+def write_by_cell(table, columns, rows):
+    for row in range(rows):
+        table.rt.incrementCounter()
+        for key, value in columns.items():
+            table.rt.addValue(key, value[row])
+
+
+def append_chunks(table, columns, rows, chunks=10):
+    # Appending per image grows an existing table, e.g. "Mito Branches"
+    size = rows // chunks
+    for start in range(0, rows, size):
+        table.writeColumns(OrderedDict([(key, value[start:start + size]) for key, value in columns.items()]))
+
+
+def timed(function, *args):
+    start = time.time()
+    result = function(*args)
+    return(time.time() - start, result)
+
+
+def run(row_counts):
+    print("%10s %14s %14s %10s %14s %14s %14s %10s" % ("rows", "write cell (s)", "write bulk (s)", "speedup",
+                                                        "append 10 (s)", "read cell (s)", "read bulk (s)",
+                                                        "speedup"))
+    for rows in [int(n) for n in row_counts.split(",")]:
+        columns = make_columns(rows)
+
+        by_cell = mina.tables.SimpleSheet("benchmark-by-cell-%s" % rows)
+        write_cell, _ = timed(write_by_cell, by_cell, columns, rows)
+        bulk = mina.tables.SimpleSheet("benchmark-bulk-%s" % rows)
+        write_bulk, _ = timed(bulk.writeColumns, columns)
+        appended = mina.tables.SimpleSheet("benchmark-append-%s" % rows)
+        write_append, _ = timed(append_chunks, appended, columns, rows)
+        assert list(appended.rt.getColumnAsDoubles(0)) == list(bulk.rt.getColumnAsDoubles(0))
+
+        read_cell, _ = timed(lambda: [by_cell.getColumn(key) for key in columns])
+        read_bulk, _ = timed(bulk.getColumns, *columns.keys())
+
+        print("%10d %14.3f %14.3f %9.1fx %14.3f %14.3f %14.3f %9.1fx" % (
+              rows, write_cell, write_bulk, write_cell / max(write_bulk, 1e-9), write_append,
+              read_cell, read_bulk, read_cell / max(read_bulk, 1e-9)))
+
+if (__name__=="__main__") or (__name__=="__builtin__"):
+    run(row_counts)
@@ -0,0 +1,2 @@
+from ._analysis import channel_view, channel_histogram, threshold_level, apply_threshold, threshold_image, footprint, mitochondrial_footprint, skeletonize, analyze_skeleton, graph_tables, graph_summary, graph_parameters, analyze_image, analyze_frames
+from ._sweep import THRESHOLD_METHODS, threshold_sweep
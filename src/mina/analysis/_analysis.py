@@ -0,0 +1,578 @@
+import threading
+
+from collections import OrderedDict
+
+from ij import IJ, ImagePlus, ImageStack
+from ij.gui import Roi
+from ij.measure import Measurements
+from ij.plugin import Duplicator
+from ij.process import ByteProcessor, ImageProcessor, ImageStatistics
+
+from java.awt import Rectangle
+from java.lang import Math
+
+from net.imglib2.histogram import Histogram1d, Real1dBinMapper
+
+from net.imglib2.img.display.imagej import ImageJFunctions
+
+from sc.fiji.analyzeSkeleton import AnalyzeSkeleton_
+
+import mina.cache
+import mina.concurrency
+import mina.graph
+import mina.profiling
+import mina.statistics
+
+
+def _channel_processors(imp):
+    '''
+    Produce the processors of every plane of the current channel (all slices
+    and frames) one at a time without copying them, so virtual stacks are
+    never loaded as a whole.
+    '''
+    stack = imp.getStack()
+    channel = imp.getChannel()
+    for t in range(imp.getNFrames()):
+        for z in range(imp.getNSlices()):
+            yield stack.getProcessor(imp.getStackIndex(channel, z+1, t+1))
+
+
+def _roi_bounds(imp):
+    '''
+    Return the bounds of the area ROI of an image, clipped to the image, or
+    None if it has none.
+    '''
+    roi = imp.getRoi()
+    if roi is None or not roi.isArea():
+        return(None)
+    return(roi.getBounds().intersection(Rectangle(0, 0, imp.getWidth(), imp.getHeight())))
+
+
+def _crop_roi(imp, view, bounds):
+    '''
+    Give a view cropped to the ROI bounds of imp the ROI moved to its origin if
+    it is not a rectangle, as the Duplicator does.
+    '''
+    roi = imp.getRoi()
+    if roi is not None and roi.isArea() and roi.getType() != Roi.RECTANGLE:
+        roi = roi.clone()
+        roi.setLocation(roi.getXBase() - bounds.x, roi.getYBase() - bounds.y)
+        view.setRoi(roi)
+
+
+def channel_view(imp, channel=None, frame=None):
+    '''
+    Return the slices of one channel and frame of an image as a new image
+    sharing the pixel arrays of the original, rather than a copy made by the
+    Duplicator.
+
+    The view must be treated as read-only: changing its pixels changes the
+    original image. Use a copy for anything that filters the image in place
+    (preprocessing). If the image has an area ROI, the planes are cropped to
+    its bounds like the Duplicator does, and those are copies.
+
+    Parameters
+    ----------
+    imp : ij.ImagePlus
+        The image.
+    channel, frame : int
+        The channel and frame (1-based). Default to the current ones.
+
+    Return
+    ------
+    view : ij.ImagePlus
+        A single channel, single frame image with the calibration and title of
+        the original.
+    '''
+    if channel is None:
+        channel = imp.getChannel()
+    if frame is None:
+        frame = imp.getFrame()
+    bounds = _roi_bounds(imp)
+    stack = imp.getStack()
+    planes = None
+    for z in range(imp.getNSlices()):
+        index = imp.getStackIndex(channel, z+1, frame)
+        ip = stack.getProcessor(index)
+        if bounds is not None:
+            ip.setRoi(bounds)
+            ip = ip.crop()
+        if planes is None:
+            planes = ImageStack(ip.getWidth(), ip.getHeight())
+        planes.addSlice(stack.getSliceLabel(index), ip)
+    view = ImagePlus(imp.getTitle(), planes)
+    view.setDimensions(1, imp.getNSlices(), 1)
+    view.setCalibration(imp.getCalibration().copy())
+    if bounds is not None:
+        _crop_roi(imp, view, bounds)
+    return(view)
+
+
+def channel_histogram(imp, bins=256):
+    '''
+    Compute the histogram of the current channel one plane at a time.
+
+    The histogram matches the one ImageJ Ops computes for a whole image
+    (image.histogram): the bins span the minimum to the maximum of the
+    channel. Every plane is wrapped in place, so no copy of the image is
+    made, and virtual stacks are read one plane at a time.
+
+    Parameters
+    ----------
+    imp : ij.ImagePlus
+        The image. Only the current channel is used.
+    bins : int
+        The number of bins.
+
+    Return
+    ------
+    histogram : net.imglib2.histogram.Histogram1d
+        The histogram of the channel.
+    '''
+    minimum = float("inf")
+    maximum = float("-inf")
+    for ip in _channel_processors(imp):
+        stats = ImageStatistics.getStatistics(ip, Measurements.MIN_MAX, None)
+        minimum = min(minimum, stats.min)
+        maximum = max(maximum, stats.max)
+
+    histogram = Histogram1d(Real1dBinMapper(minimum, maximum, bins, False))
+    for ip in _channel_processors(imp):
+        histogram.addData(ImageJFunctions.wrapReal(ImagePlus("", ip)))
+    return(histogram)
+
+
+def threshold_level(histogram, ops, threshold_method):
+    '''
+    Return the threshold level of an ImageJ Ops method for a histogram.
+
+    Parameters
+    ----------
+    histogram : net.imglib2.histogram.Histogram1d
+        The histogram returned by channel_histogram. It can be reused to
+        compute the level of several methods.
+    ops : net.imagej.ops.OpService
+        The op service used to compute the threshold level.
+    threshold_method : str
+        The name of the threshold op (e.g. "otsu").
+
+    Return
+    ------
+    level : float
+        The threshold level. Foreground pixels are strictly above it.
+    '''
+    return(ops.run("threshold.%s" % threshold_method, histogram).getRealDouble())
+
+
+def apply_threshold(imp, level):
+    '''
+    Binarize the current channel of an image with a threshold level.
+
+    Every plane is masked directly, so the only allocation the size of the
+    image is the 8-bit binary itself. The image is left unchanged.
+
+    Parameters
+    ----------
+    imp : ij.ImagePlus
+        The image to threshold. Only the current channel is used.
+    level : float
+        The threshold level. Pixels strictly above it are foreground, as for
+        the threshold.apply op.
+
+    Return
+    ------
+    binary : ij.ImagePlus
+        The binary image (foreground 255) with the calibration of the input.
+    '''
+    if imp.getBitDepth() == 32:
+        lower = Math.nextUp(level)
+    else:
+        lower = Math.floor(level) + 1
+
+    binary_stack = ImageStack(imp.getWidth(), imp.getHeight())
+    for ip in _channel_processors(imp):
+        # A shallow clone shares the pixels but not the threshold, so several
+        # threads can threshold the same image at different levels
+        view = ip.clone()
+        view.setThreshold(lower, max(ip.maxValue(), lower), ImageProcessor.NO_LUT_UPDATE)
+        mask = view.createMask()
+        if mask is None:
+            mask = ByteProcessor(imp.getWidth(), imp.getHeight())
+        binary_stack.addSlice(mask)
+
+    binary = ImagePlus("binary", binary_stack)
+    binary.setCalibration(imp.getCalibration())
+    binary.setDimensions(1, imp.getNSlices(), imp.getNFrames())
+    return(binary)
+
+
+def threshold_image(imp, ops, threshold_method):
+    '''
+    Binarize the current channel of an image using an ImageJ Ops threshold.
+
+    The threshold level is computed by the op from a histogram streamed over
+    the planes of the channel (see channel_histogram) and the planes are
+    then masked in a single pass (see apply_threshold), rather than copying
+    the channel into an ImgLib2 image and wrapping the op's output.
+
+    Parameters
+    ----------
+    imp : ij.ImagePlus
+        The image to threshold. Only the current channel is used.
+    ops : net.imagej.ops.OpService
+        The op service used to compute the threshold level.
+    threshold_method : str
+        The name of the threshold op (e.g. "otsu").
+
+    Return
+    ------
+    binary : ij.ImagePlus
+        The binary image with the calibration of the input.
+    '''
+    level = threshold_level(channel_histogram(imp), ops, threshold_method)
+    return(apply_threshold(imp, level))
+
+
+def footprint(binary):
+    '''
+    Measure the foreground of a binary image slice by slice in a single pass.
+
+    Each slice is read once and its foreground pixels (any non-zero value)
+    are counted from a single histogram, rather than computing the area and
+    the area fraction statistics separately.
+
+    Parameters
+    ----------
+    binary : ij.ImagePlus
+        The binary image as returned by threshold_image.
+
+    Return
+    ------
+    total : float
+        The calibrated area (2D) or volume (3D) of the foreground.
+    slice_areas : list of float
+        The calibrated foreground area of every slice.
+    '''
+    calibration = binary.getCalibration()
+    pixel_area = calibration.pixelWidth * calibration.pixelHeight
+    stack = binary.getStack()
+
+    slice_areas = []
+    for slice in range(1, stack.getSize()+1):
+        ip = stack.getProcessor(slice)
+        foreground = ip.getPixelCount() - ip.getHistogram()[0]
+        slice_areas.append(foreground * pixel_area)
+
+    total = sum(slice_areas)
+    if len(slice_areas) > 1:
+        total *= calibration.pixelDepth
+    return(total, slice_areas)
+
+
+def mitochondrial_footprint(binary):
+    '''
+    Return the area (2D) or volume (3D) occupied by signal in a binary image.
+
+    Parameters
+    ----------
+    binary : ij.ImagePlus
+        The binary image as returned by threshold_image.
+
+    Return
+    ------
+    footprint : float
+        The calibrated area or volume of the foreground.
+    '''
+    return(footprint(binary)[0])
+
+
+def skeletonize(binary, in_place=False):
+    '''
+    Return a skeletonized copy of a binary image (Skeletonize 2D/3D).
+
+    If in_place is True, the binary image itself is skeletonized and
+    returned instead, which saves a copy of the image when the binary is not
+    needed anymore (i.e. once its footprint has been measured).
+    '''
+    skeleton = binary if in_place else Duplicator().run(binary)
+    IJ.run(skeleton, "Skeletonize (2D/3D)", "")
+    return(skeleton)
+
+
+def analyze_skeleton(skeleton):
+    '''
+    Run AnalyzeSkeleton on a skeleton image and return its SkeletonResult.
+    '''
+    skel = AnalyzeSkeleton_()
+    skel.setup("", skeleton)
+    return(skel.run())
+
+
+def graph_tables(skel_result, calibration=None):
+    '''
+    Tabulate every branch and network of a skeleton analysis.
+
+    The skeleton graph is converted once into a mina.graph.CompactGraph and
+    the tables are computed from its arrays.
+
+    Parameters
+    ----------
+    skel_result : sc.fiji.analyzeSkeleton.SkeletonResult
+        The result of the skeleton analysis.
+    calibration : ij.measure.Calibration
+        The calibration used to scale the vertex coordinates. If None, the
+        coordinates are in pixels.
+
+    Return
+    ------
+    branches : collections.OrderedDict
+        A list of values per column with one row per branch: the network and
+        branch index, the ids of both vertices, the branch length, the
+        coordinates of both vertices, the euclidean distance between them and
+        the tortuosity (branch length / euclidean distance).
+    networks : collections.OrderedDict
+        A list of values per column with one row per network: the network
+        index, the number of branches, vertices, junctions and end points, the
+        summed branch length and whether the network is a donut (1) or not (0).
+    '''
+    return(mina.graph.CompactGraph.fromSkeletonResult(skel_result, calibration).tables())
+
+
+def graph_summary(branches, networks):
+    '''
+    Summarize the branch and network tables returned by graph_tables.
+
+    Return
+    ------
+    parameters : collections.OrderedDict
+        The branch length (including its quartiles), summed branch length and
+        network branch summaries along with the number of donuts.
+    '''
+    # Only the branch length reports its quartiles, the others only need the median
+    summaries = [("branch length", branches["branch length"], [0.25, 0.5, 0.75]),
+                 ("summed branch lengths", networks["summed branch length"], [0.5]),
+                 ("network branches", networks["branches"], [0.5])]
+
+    parameters = OrderedDict()
+    for name, data, qs in summaries:
+        # The columns already hold the values, so the accumulator only keeps
+        # the moments and the quantiles are computed from the columns
+        acc = mina.statistics.Accumulator(data, keep_values=False)
+        values = mina.statistics.quantiles(data, qs)
+        parameters[name + " mean"] = acc.mean()
+        parameters[name + " median"] = values[len(values) // 2]
+        if len(values) == 3:
+            parameters[name + " 1st quartile"] = values[0]
+            parameters[name + " 3rd quartile"] = values[2]
+        parameters[name + " stdev"] = acc.stdev()
+    parameters["donuts"] = sum(networks["donut"])
+    return(parameters)
+
+
+def graph_parameters(skel_result):
+    '''
+    Compute the branch and network parameters from a skeleton analysis.
+
+    Parameters
+    ----------
+    skel_result : sc.fiji.analyzeSkeleton.SkeletonResult
+        The result of the skeleton analysis.
+
+    Return
+    ------
+    parameters : collections.OrderedDict
+        The branch length, summed branch length and network branch summaries
+        along with the number of donuts.
+    '''
+    return(graph_summary(*graph_tables(skel_result)))
+
+
+def analyze_image(imp, ops, threshold_method, preprocess=None, tables=False, cache=None,
+                  topology=None, profiler=None):
+    '''
+    Run the full morphology analysis on an image owned by the caller.
+
+    The image is thresholded, its footprint measured, skeletonized and the
+    skeleton graph summarized. No windows are opened, so the function can be
+    called from worker threads as long as each thread passes its own image.
+
+    Parameters
+    ----------
+    imp : ij.ImagePlus
+        The image to analyze. It may be modified by the preprocess function.
+    ops : net.imagej.ops.OpService
+        The op service used for thresholding.
+    threshold_method : str
+        The name of the threshold op (e.g. "otsu").
+    preprocess : callable
+        An optional function applied in place to the image before
+        thresholding (e.g. a mina.filters.Pipeline). If it returns a dict of
+        stage timings, they are added to the parameters.
+    tables : bool
+        Should the branch and network tables (see graph_tables) be returned
+        along with the parameters?
+    cache : mina.cache.IntermediateCache
+        An optional cache of intermediates. On a hit, preprocessing,
+        thresholding and skeletonization are skipped. Only the footprint and
+        the tables are stored, not the images. Only used when preprocess is
+        None or can be serialized (i.e. has a dumps method).
+    topology : list of str
+        Optional topology metrics to add (see mina.graph.topology_metrics),
+        e.g. ["cycle rank", "diameter"].
+    profiler : mina.profiling.Profiler
+        If given, the time and peak heap usage of every stage (cache,
+        preprocessing, thresholding, footprint, skeletonization, skeleton
+        analysis, graph metrics and topology) are recorded in it.
+
+    Return
+    ------
+    parameters : collections.OrderedDict
+        The preprocessing timings (if any), the mitochondrial footprint, the
+        graph parameters and the topology metrics (if any). If
+        tables is True, a tuple of the parameters, branches and networks is
+        returned instead.
+    '''
+    parameters = OrderedDict()
+    if profiler is None:
+        profiler = mina.profiling.Profiler(memory=False)
+
+    key = None
+    if cache is not None and (preprocess is None or hasattr(preprocess, "dumps")):
+        with profiler.stage("cache"):
+            # Entries hold the preprocessing timings since "analyze_image 2", older ones are not used
+            key = mina.cache.image_key(imp, "analyze_image 2", imp.getChannel(), threshold_method,
+                                       preprocess.dumps() if preprocess is not None else None)
+            entry = cache.get(key, images=False)
+        if entry is not None:
+            # The same columns as a miss, so rows from hits and misses fit one table
+            for stage in entry["timings"]:
+                parameters["preprocessing %s time (s)" % stage] = 0.0
+            parameters["mitochondrial footprint"] = entry["footprint"]
+            parameters.update(graph_summary(entry["branches"], entry["networks"]))
+            if topology:
+                with profiler.stage("topology"):
+                    graph = mina.graph.CompactGraph.fromTables(entry["branches"], entry["networks"])
+                    parameters.update(mina.graph.topology_metrics(graph, topology))
+            if tables:
+                return((parameters, entry["branches"], entry["networks"]))
+            return(parameters)
+
+    timings = None
+    if preprocess is not None:
+        with profiler.stage("preprocessing"):
+            timings = preprocess(imp)
+        if not isinstance(timings, dict):
+            timings = None
+        else:
+            for stage, seconds in timings.items():
+                parameters["preprocessing %s time (s)" % stage] = seconds
+
+    with profiler.stage("thresholding"):
+        binary = threshold_image(imp, ops, threshold_method)
+
+    with profiler.stage("footprint"):
+        parameters["mitochondrial footprint"] = mitochondrial_footprint(binary)
+
+    # The binary is not needed once the footprint has been measured, so it
+    # is skeletonized in place
+    with profiler.stage("skeletonization"):
+        skeleton = skeletonize(binary, in_place=True)
+    with profiler.stage("skeleton analysis"):
+        skel_result = analyze_skeleton(skeleton)
+    with profiler.stage("graph metrics"):
+        graph = mina.graph.CompactGraph.fromSkeletonResult(skel_result, binary.getCalibration())
+        branches, networks = graph.tables()
+        parameters.update(graph_summary(branches, networks))
+    if topology:
+        with profiler.stage("topology"):
+            parameters.update(mina.graph.topology_metrics(graph, topology))
+    if key is not None:
+        # Only the tables and footprint are read back (see above), so no images are stored
+        with profiler.stage("cache"):
+            cache.put(key, parameters["mitochondrial footprint"], branches, networks, timings=timings)
+    if tables:
+        return((parameters, branches, networks))
+    return(parameters)
+
+
+def analyze_frames(imp, ops, threshold_method, preprocess=None, workers=None, tables=False):
+    '''
+    Analyze every frame of a time-lapse (2D+t or 3D+t) image.
+
+    The frames are processed concurrently. Without preprocessing, every frame
+    is analyzed through a view of its planes (see channel_view). Otherwise
+    each worker thread copies the planes of its frame into a buffer it
+    allocated once and reuses for every frame it processes, so memory stays
+    bounded by the number of workers rather than the number of frames. Rows
+    are produced as soon as each frame completes. Like channel_view, frames
+    are cropped to the bounds of the ROI of the image, if any.
+
+    Parameters
+    ----------
+    imp : ij.ImagePlus
+        The time-lapse image. The current channel is analyzed.
+    ops : net.imagej.ops.OpService
+        The op service used for thresholding.
+    threshold_method : str
+        The name of the threshold op (e.g. "otsu").
+    preprocess : callable
+        An optional function applied in place to each frame before
+        thresholding.
+    workers : int
+        The number of worker threads. Defaults to the number of processors.
+    tables : bool
+        Should the branch and network tables of each frame be returned as
+        well?
+
+    Return
+    ------
+    rows : generator of collections.OrderedDict
+        One row per frame, in order of completion, holding the frame number,
+        its timestamp (from the frame interval of the calibration) and time
+        unit followed by the parameters of analyze_image. If tables is True,
+        tuples of the row, branches and networks are produced instead.
+    '''
+    calibration = imp.getCalibration()
+    stack = imp.getStack()
+    channel = imp.getChannel()
+    slices = imp.getNSlices()
+    bounds = _roi_bounds(imp)
+    if bounds is None:
+        bounds = Rectangle(0, 0, imp.getWidth(), imp.getHeight())
+    buffers = threading.local()
+
+    def frame_buffer():
+        if getattr(buffers, "imp", None) is None:
+            planes = ImageStack(bounds.width, bounds.height)
+            for z in range(slices):
+                planes.addSlice(stack.getProcessor(1).createProcessor(bounds.width, bounds.height))
+            buffers.imp = ImagePlus("frame", planes)
+            buffers.imp.setCalibration(calibration)
+            _crop_roi(imp, buffers.imp, bounds)
+        return(buffers.imp)
+
+    def analyze_frame(frame):
+        if preprocess is None:
+            buffer = channel_view(imp, channel, frame)
+        else:
+            buffer = frame_buffer()
+            planes = buffer.getStack()
+            for z in range(slices):
+                source = stack.getProcessor(imp.getStackIndex(channel, z+1, frame))
+                planes.getProcessor(z+1).insert(source, -bounds.x, -bounds.y)
+        buffer.setTitle("%s frame %s" % (imp.getTitle(), frame))
+
+        row = OrderedDict([("frame", frame),
+                           ("timestamp", (frame - 1) * calibration.frameInterval),
+                           ("time unit", calibration.getTimeUnit())])
+        result = analyze_image(buffer, ops, threshold_method, preprocess, tables)
+        if tables:
+            result, branches, networks = result
+            row.update(result)
+            return((row, branches, networks))
+        row.update(result)
+        return(row)
+
+    frames = range(1, imp.getNFrames()+1)
+    for index, row in mina.concurrency.map_completed(analyze_frame, frames, workers):
+        yield(row)
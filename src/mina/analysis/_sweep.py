@@ -0,0 +1,76 @@
+from collections import OrderedDict
+
+import mina.concurrency
+
+from ._analysis import (channel_histogram, threshold_level, apply_threshold, mitochondrial_footprint,
+                        skeletonize, analyze_skeleton, graph_tables, graph_summary)
+
+
+# Every global threshold op of ImageJ Ops
+THRESHOLD_METHODS = ["huang", "ij1", "intermodes", "isoData", "li", "maxEntropy",
+                     "maxLikelihood", "mean", "minError", "minimum", "moments", "otsu",
+                     "percentile", "renyiEntropy", "rosin", "shanbhag", "triangle", "yen"]
+
+
+def threshold_sweep(imp, ops, methods=None, preprocess=None, workers=None, tables=False):
+    '''
+    Analyze an image with several thresholding methods.
+
+    The image is preprocessed and its histogram computed once. Every
+    method's level is derived from that shared histogram and the methods are
+    then binarized, skeletonized and summarized concurrently, so comparing
+    methods costs one preprocessing pass rather than one per method.
+
+    Parameters
+    ----------
+    imp : ij.ImagePlus
+        The image to analyze. The current channel is used. It may be
+        modified by the preprocess function.
+    ops : net.imagej.ops.OpService
+        The op service used for thresholding.
+    methods : list of str
+        The names of the threshold ops. Defaults to THRESHOLD_METHODS.
+    preprocess : callable
+        An optional function applied in place to the image before
+        thresholding (e.g. a mina.filters.Pipeline).
+    workers : int
+        The number of worker threads. Defaults to the number of processors.
+    tables : bool
+        Should the branch and network tables of each method be returned as
+        well?
+
+    Return
+    ------
+    rows : list of collections.OrderedDict
+        One row per method, in the order of the methods, holding the
+        thresholding op, its threshold level, the mitochondrial footprint and
+        the graph parameters (see analyze_image). Methods that fail have an
+        "error" message instead. If tables is True, tuples of the row,
+        branches and networks (None on failure) are returned instead.
+    '''
+    if methods is None:
+        methods = THRESHOLD_METHODS
+    if preprocess is not None:
+        preprocess(imp)
+
+    calibration = imp.getCalibration()
+    histogram = channel_histogram(imp)
+
+    def analyze_method(method):
+        row = OrderedDict([("thresholding op", method)])
+        branches = networks = None
+        try:
+            row["threshold level"] = threshold_level(histogram, ops, method)
+            binary = apply_threshold(imp, row["threshold level"])
+            row["mitochondrial footprint"] = mitochondrial_footprint(binary)
+            skel_result = analyze_skeleton(skeletonize(binary, in_place=True))
+            branches, networks = graph_tables(skel_result, calibration)
+            row.update(graph_summary(branches, networks))
+            row["error"] = ""
+        except Exception as e:
+            row["error"] = str(e)
+        if tables:
+            return((row, branches, networks))
+        return(row)
+
+    return(mina.concurrency.map_parallel(analyze_method, list(methods), workers))
@@ -0,0 +1 @@
+from ._batch import SKETCH_SUFFIX, sidecar_path, find_images, estimate_path_heap, analyze_path, run_batch, aggregate_sketches
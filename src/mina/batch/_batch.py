@@ -0,0 +1,370 @@
+import fnmatch
+import glob
+import hashlib
+import os
+import time
+
+from collections import OrderedDict
+
+from ij import IJ
+from ij.io import Opener
+
+import mina.analysis
+import mina.concurrency
+import mina.filters
+import mina.graph
+import mina.profiling
+import mina.statistics
+import mina.tables
+import mina.tiled
+
+
+SKETCH_SUFFIX = ".branch-lengths.sketch.json"
+
+# The stages profiled by analyze_path, in the order of the profile columns
+PROFILE_STAGES = ["opening", "cache", "preprocessing", "thresholding", "footprint", "skeletonization",
+                  "skeleton analysis", "graph metrics", "topology", "tiled analysis"]
+
+
+def sidecar_path(directory, path, suffix):
+    '''
+    Return the path of a file saved next to the results of an image (e.g. its
+    branch length sketch) in a directory.
+
+    The name is the file name of the image followed by a hash of its full
+    path, so images with the same name in different folders (e.g. found
+    recursively) do not overwrite each other's files.
+
+    Parameters
+    ----------
+    directory : str
+        The directory holding the files.
+    path : str
+        The path of the image.
+    suffix : str
+        The suffix of the file, e.g. SKETCH_SUFFIX.
+    '''
+    digest = hashlib.md5(os.path.abspath(str(path)).encode("utf-8")).hexdigest()[:10]
+    return(os.path.join(str(directory), "%s.%s%s" % (os.path.basename(str(path)), digest, suffix)))
+
+
+def find_images(directory, pattern="*.tif", recursive=False):
+    '''
+    List the image files in a directory that match a glob pattern.
+
+    Parameters
+    ----------
+    directory : str or java.io.File
+        The directory to search.
+    pattern : str
+        A glob pattern for the file names (e.g. "*.tif"). Several patterns
+        can be given separated by ";".
+    recursive : bool
+        Should sub-directories be searched as well?
+
+    Return
+    ------
+    paths : list of str
+        The sorted paths of the matching files.
+
+    Example
+    -------
+    >>> from mina.batch import find_images
+    >>> find_images("/data/plate_01", "*.tif;*.tiff")
+    ['/data/plate_01/A01.tif', '/data/plate_01/A02.tif']
+    '''
+    directory = str(directory)
+    patterns = [p.strip() for p in pattern.split(";") if p.strip() != ""]
+
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            if any(fnmatch.fnmatch(name, p) for p in patterns):
+                paths.append(os.path.join(root, name))
+        if not recursive:
+            break
+    return(sorted(paths))
+
+
+def estimate_path_heap(path, tile_size=None, in_place=True):
+    '''
+    Estimate the peak heap usage of analyzing an image file (see
+    mina.profiling.estimate_heap) without loading it.
+
+    The dimensions of TIFF files are read from their header. For other
+    formats the file size is used as the number of (8-bit) pixels, which
+    underestimates compressed files. In tiled mode only one block, with its
+    overlap, is in memory at a time.
+    '''
+    try:
+        info = Opener.getTiffFileInfo(path)
+    except Exception:
+        info = None
+    if not info:
+        return(mina.profiling.estimate_heap(os.path.getsize(path), 1, 1, 1, in_place))
+    width, height = info[0].width, info[0].height
+    slices = max(info[0].nImages, len(info))
+    if tile_size:
+        # The block size, depth and overlap used by analyze_path
+        margin = 2 * mina.tiled.TILE_OVERLAP
+        width = min(width, tile_size + margin)
+        height = min(height, tile_size + margin)
+        slices = min(slices, mina.tiled.TILE_DEPTH + margin)
+    return(mina.profiling.estimate_heap(width, height, slices, info[0].getBytesPerPixel(), in_place))
+
+
+def analyze_path(path, ops, threshold_method, preprocess=None, tables=False,
+                 sketch_directory=None, cache=None, tile_size=None, topology=None,
+                 profile_directory=None, profile_memory=True, budget=None):
+    '''
+    Open an image from disk without displaying it and analyze it.
+
+    Parameters
+    ----------
+    path : str
+        The path of the image file.
+    ops : net.imagej.ops.OpService
+        The op service used for thresholding.
+    threshold_method : str
+        The name of the threshold op (e.g. "otsu").
+    preprocess : callable
+        An optional function applied in place to the image before
+        thresholding.
+    tables : bool
+        Should the branch and network tables be returned as well?
+    sketch_directory : str
+        If given, a QuantileSketch of the branch lengths is saved to this
+        directory as "<file name>.branch-lengths.sketch.json" so that
+        experiment-wide quantiles can be computed with aggregate_sketches.
+    cache : mina.cache.IntermediateCache
+        An optional cache of intermediates (see mina.analysis.analyze_image).
+    tile_size : int
+        If given, the image is opened as a virtual stack and analyzed in
+        blocks of this size (see mina.tiled.analyze_tiled). Preprocessing and
+        the cache are not used in this mode.
+    topology : list of str
+        Optional topology metrics (see mina.graph.topology_metrics).
+    profile_directory : str
+        If given, the time and peak heap usage of every stage (see
+        mina.profiling.Profiler) are added to the row and saved to this
+        directory as "<file name>.profile.json", so that they can be
+        summarized with mina.profiling.aggregate_profiles.
+    profile_memory : bool
+        Should the peak heap usage be profiled as well? It covers the whole
+        JVM, so it is only meaningful when one image is analyzed at a time.
+    budget : mina.profiling.MemoryBudget
+        If given, the estimated heap usage of the image (see
+        estimate_path_heap) is reserved from the budget before the image is
+        opened, waiting for other images to complete if needed, and added to
+        the row. Images estimated to need more than the whole budget fail.
+
+    Return
+    ------
+    row : collections.OrderedDict
+        The image path and title, the analysis parameters, the stage profile
+        (if any), an error message (empty on success) and the processing
+        time. If the analysis failed,
+        the parameters are missing. If tables is True, a tuple of the row,
+        the branch table and the network table (None on failure) is returned
+        instead.
+    '''
+    start = time.time()
+    row = OrderedDict([("image path", path), ("image title", os.path.basename(path))])
+    branches = networks = None
+    profiler = mina.profiling.Profiler(memory=profile_memory and profile_directory is not None)
+    reserved = 0
+    try:
+        if budget is not None:
+            estimate = estimate_path_heap(path, tile_size)
+            row["estimated heap (MB)"] = estimate / float(1024 ** 2)
+            reserved = budget.acquire(estimate)
+        with profiler.stage("opening"):
+            if tile_size:
+                imp = IJ.openVirtual(path)
+            else:
+                imp = Opener().openImage(path)
+        if imp is None:
+            raise IOError("Could not open %s" % path)
+        row["image title"] = imp.getTitle()
+        row["thresholding op"] = threshold_method
+        if tile_size:
+            with profiler.stage("tiled analysis"):
+                result = mina.tiled.analyze_tiled(imp, ops, threshold_method, tile_size,
+                                                  tables=True)
+            if topology:
+                graph = mina.graph.CompactGraph.fromTables(result[1], result[2])
+                result[0].update(mina.graph.topology_metrics(graph, topology))
+            if not (tables or sketch_directory is not None):
+                result = result[0]
+        else:
+            result = mina.analysis.analyze_image(imp, ops, threshold_method, preprocess,
+                                                 tables or sketch_directory is not None, cache,
+                                                 topology, profiler)
+        if tables or sketch_directory is not None:
+            result, branches, networks = result
+        row.update(result)
+        if sketch_directory is not None:
+            sketch = mina.statistics.QuantileSketch(data=branches["branch length"])
+            with open(sidecar_path(sketch_directory, path, SKETCH_SUFFIX), "w") as handle:
+                handle.write(sketch.dumps())
+        imp.flush()
+        row["error"] = ""
+    except Exception as e:
+        row["error"] = str(e)
+    finally:
+        # Also released for Java errors such as OutOfMemoryError, which are not Exceptions
+        if reserved:
+            budget.release(reserved)
+    if profile_directory is not None:
+        row.update(profiler.parameters(PROFILE_STAGES))
+        profiler.save(sidecar_path(profile_directory, path, mina.profiling.PROFILE_SUFFIX))
+    row["processing time (s)"] = time.time() - start
+    if tables:
+        return((row, branches, networks))
+    return(row)
+
+
+def run_batch(paths, ops, threshold_method, workers=None, preprocess=None,
+              sink=None, extra_columns=None, branch_sink=None, network_sink=None,
+              sketch_directory=None, cache=None, tile_size=None, topology=None,
+              profile_directory=None, memory_limit=None):
+    '''
+    Analyze many images concurrently and stream the results to one table.
+
+    Every worker thread opens its own copy of the image from disk, so nothing
+    relies on the WindowManager and no windows are shown while processing.
+    Rows are written to the sink as soon as each image completes.
+
+    Parameters
+    ----------
+    paths : list of str
+        The image files to analyze (see find_images).
+    ops : net.imagej.ops.OpService
+        The op service used for thresholding.
+    threshold_method : str
+        The name of the threshold op (e.g. "otsu").
+    workers : int
+        The number of worker threads. Defaults to the number of processors.
+    preprocess : callable
+        An optional function applied in place to each image before
+        thresholding.
+    sink : result sink
+        Where the rows are written (see mina.tables.openSink). Defaults to a
+        throttled "Mito Morphology Batch" table window. The sink is flushed,
+        but not closed, when the batch completes.
+    extra_columns : dict or collections.OrderedDict
+        Additional values (e.g. the parsed user comment) written to every row.
+    branch_sink : result sink
+        If given, the branch table of every image (see
+        mina.analysis.graph_tables) is written to it, prefixed by the image
+        path.
+    network_sink : result sink
+        If given, the network table of every image is written to it, prefixed
+        by the image path.
+    sketch_directory : str
+        If given, a branch length QuantileSketch is saved there for every
+        image (see analyze_path and aggregate_sketches).
+    cache : mina.cache.IntermediateCache
+        An optional cache of intermediates, so images that were already
+        analyzed with the same settings are not processed again.
+    tile_size : int
+        If given, every image is analyzed in blocks of this size without
+        loading it into memory (see analyze_path).
+    topology : list of str
+        Optional topology metrics added to every row (see
+        mina.graph.topology_metrics).
+    profile_directory : str
+        If given, the stage profile of every image is added to its row and
+        saved there (see analyze_path and mina.profiling.aggregate_profiles).
+        The peak heap usage is only profiled when a single worker is used.
+    memory_limit : int
+        If given, the estimated heap usage of the images analyzed at the same
+        time is kept below this number of bytes (see analyze_path and
+        mina.profiling.MemoryBudget), so more workers can be used safely.
+
+    Return
+    ------
+    rows : list of collections.OrderedDict
+        The result row of each image in the order of the paths.
+    '''
+    if sink is None:
+        sink = mina.tables.SheetSink("Mito Morphology Batch")
+
+    def write(row):
+        if extra_columns:
+            sink.writeRow(row, extra_columns)
+        else:
+            sink.writeRow(row)
+
+    # Failed rows are held back until a complete row has fixed the columns
+    tables = branch_sink is not None or network_sink is not None
+
+    rows = [None] * len(paths)
+    held_back = []
+    profile_memory = workers == 1 or len(paths) == 1
+    if not profile_memory and isinstance(preprocess, mina.filters.Pipeline):
+        # The images are filtered concurrently already, so each one is filtered in its worker thread
+        preprocess = mina.filters.Pipeline(preprocess.stages, workers=1)
+    budget = mina.profiling.MemoryBudget(memory_limit) if memory_limit else None
+    completed = mina.concurrency.map_completed(
+        lambda path: analyze_path(path, ops, threshold_method, preprocess, tables,
+                                  sketch_directory, cache, tile_size, topology,
+                                  profile_directory, profile_memory, budget),
+        paths, workers)
+    for index, row in completed:
+        if tables:
+            row, branches, networks = row
+            for table_sink, table in [(branch_sink, branches), (network_sink, networks)]:
+                if table_sink is not None and table is not None and len(table["network"]) > 0:
+                    image = OrderedDict([("image path", row["image path"])])
+                    table_sink.writeRows(mina.tables.repeatDictValues(image, len(table["network"])), table)
+        rows[index] = row
+        if row["error"] != "" and held_back is not None:
+            held_back.append(row)
+            continue
+        write(row)
+        if held_back:
+            for failed in held_back:
+                write(failed)
+        held_back = None
+    for failed in held_back or []:
+        write(failed)
+    for table_sink in [sink, branch_sink, network_sink]:
+        if table_sink is not None:
+            table_sink.flush()
+    return(rows)
+
+
+def aggregate_sketches(sketches, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+    '''
+    Merge the branch length sketches saved by a batch into experiment-wide
+    quantiles.
+
+    Parameters
+    ----------
+    sketches : iterable of str, or str
+        The paths of the sketches, e.g. those of the images of one batch
+        (see sidecar_path), or a directory to merge all the sketches in.
+    quantiles : iterable of float
+        The quantiles to report.
+
+    Return
+    ------
+    summary : collections.OrderedDict
+        The number of images and branches, the minimum and maximum and the
+        approximate branch length at each quantile.
+    '''
+    if isinstance(sketches, type("")) or not hasattr(sketches, "__iter__"):
+        sketches = sorted(glob.glob(os.path.join(str(sketches), "*" + SKETCH_SUFFIX)))
+    loaded = []
+    for path in sketches:
+        with open(str(path)) as handle:
+            loaded.append(mina.statistics.QuantileSketch.loads(handle.read()))
+    merged = mina.statistics.merge_sketches(loaded)
+
+    summary = OrderedDict([("images", len(loaded)), ("branches", merged.count),
+                           ("branch length min", merged.minimum),
+                           ("branch length max", merged.maximum)])
+    for q, value in zip(quantiles, merged.quantiles(quantiles)):
+        summary["branch length p%g" % (q * 100)] = value
+    return(summary)
@@ -0,0 +1 @@
+from ._cache import IntermediateCache, CachedSkeletonResult, image_key, default_cache
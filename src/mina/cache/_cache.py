@@ -0,0 +1,273 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+
+from collections import OrderedDict
+
+from ij import Prefs
+from ij.io import FileSaver, Opener
+
+from java.nio import ByteBuffer
+from java.security import MessageDigest
+
+from sc.fiji.analyzeSkeleton import Point
+
+
+# The Prefs keys used to enable the cache for interactive runs
+PREFS_DIRECTORY = "mina.cache.directory"
+PREFS_MAX_BYTES = "mina.cache.max_bytes"
+
+
+def _plane_bytes(ip):
+    '''
+    Return the pixels of an ImageProcessor as a java byte array.
+    '''
+    pixels = ip.getPixels()
+    kind = pixels.typecode
+    if kind == "b":
+        return(pixels)
+    if kind == "h":
+        buffer = ByteBuffer.allocate(len(pixels) * 2)
+        buffer.asShortBuffer().put(pixels)
+    elif kind == "f":
+        buffer = ByteBuffer.allocate(len(pixels) * 4)
+        buffer.asFloatBuffer().put(pixels)
+    else:
+        buffer = ByteBuffer.allocate(len(pixels) * 4)
+        buffer.asIntBuffer().put(pixels)
+    return(buffer.array())
+
+
+def image_key(imp, *parameters):
+    '''
+    Return a content hash of an image and the parameters applied to it.
+
+    The key covers the dimensions, bit depth, calibration and the pixels of
+    every plane, so it changes whenever the input or any of the parameters
+    that affect the cached intermediates change.
+
+    Parameters
+    ----------
+    imp : ij.ImagePlus
+        The image, before any preprocessing.
+    parameters :
+        Any JSON serializable values (e.g. the preprocessing pipeline, the
+        threshold method and the ridge detection settings).
+
+    Return
+    ------
+    key : str
+        A hexadecimal SHA-1 digest.
+    '''
+    digest = MessageDigest.getInstance("SHA-1")
+    calibration = imp.getCalibration()
+    header = [list(imp.getDimensions()), imp.getBitDepth(),
+              [calibration.pixelWidth, calibration.pixelHeight, calibration.pixelDepth],
+              list(parameters)]
+    digest.update(bytearray(json.dumps(header, sort_keys=True).encode("utf-8")))
+
+    stack = imp.getStack()
+    for i in range(stack.getSize()):
+        digest.update(_plane_bytes(stack.getProcessor(i+1)))
+    return("".join(["%02x" % (b & 0xff) for b in digest.digest()]))
+
+
+class CachedSkeletonResult():
+    def __init__(self, end_points, junctions):
+        '''
+        Stand-in for a SkeletonResult holding only the points used by
+        mina_view.overlay_2D.
+        '''
+        self.end_points = [Point(*p) for p in end_points]
+        self.junctions = [Point(*p) for p in junctions]
+
+    def getListOfEndPoints(self):
+        return(self.end_points)
+
+    def getListOfJunctionVoxels(self):
+        return(self.junctions)
+
+
+class IntermediateCache():
+    def __init__(self, directory, max_bytes=2 * 1024 ** 3):
+        '''
+        Construct an on-disk cache of binary and skeleton intermediates.
+
+        Each entry is a directory named by its key (see image_key) holding the
+        binary and skeleton as TIFF files and the graph (branch and network
+        tables, footprint, end points and junctions) as JSON. When the cache
+        grows beyond max_bytes, the least recently used entries are removed.
+
+        Parameters
+        ----------
+        directory : str or java.io.File
+            The directory holding the cache. It is created if needed.
+        max_bytes : int
+            The maximum size of the cache on disk.
+
+        Example
+        -------
+        >>> from mina.cache import IntermediateCache, image_key
+        >>> cache = IntermediateCache("/tmp/mina-cache")
+        >>> key = image_key(imp, "otsu")
+        >>> entry = cache.get(key)
+        '''
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def _path(self, key):
+        return(os.path.join(self.directory, key))
+
+    def get(self, key, images=True):
+        '''
+        Return a cached entry or None if the key is not cached.
+
+        Parameters
+        ----------
+        key : str
+            The key returned by image_key.
+        images : bool
+            Should the binary and skeleton images be loaded?
+
+        Return
+        ------
+        entry : dict
+            The "footprint", "branches", "networks", the preprocessing
+            "timings" and a "skel_result" (CachedSkeletonResult) along with
+            the "binary" and "skeleton" images (None if not stored or not
+            requested). Entries removed by another thread while being read
+            are a miss.
+        '''
+        path = self._path(key)
+        graph_path = os.path.join(path, "graph.json")
+        if not os.path.exists(graph_path):
+            return(None)
+        try:
+            with open(graph_path) as handle:
+                graph = json.load(handle, object_pairs_hook=OrderedDict)
+        except (IOError, OSError, ValueError):
+            return(None)
+
+        entry = {"footprint": graph["footprint"],
+                 "branches": graph["branches"],
+                 "networks": graph["networks"],
+                 "timings": graph.get("timings", OrderedDict()),
+                 "skel_result": CachedSkeletonResult(graph["end points"], graph["junctions"]),
+                 "binary": None,
+                 "skeleton": None}
+        if images:
+            for name in ["binary", "skeleton"]:
+                image_path = os.path.join(path, name + ".tif")
+                if os.path.exists(image_path):
+                    entry[name] = Opener().openImage(image_path)
+
+        # Mark the entry as recently used, unless it was just evicted
+        try:
+            os.utime(path, None)
+        except OSError:
+            return(None)
+        return(entry)
+
+    def put(self, key, footprint, branches, networks, skel_result=None,
+            binary=None, skeleton=None, timings=None):
+        '''
+        Store the intermediates of an analysis.
+
+        The entry is written to a temporary directory and then moved into
+        place, so concurrent readers never see a partial entry.
+
+        Parameters
+        ----------
+        key : str
+            The key returned by image_key.
+        footprint : float
+            The mitochondrial footprint.
+        branches, networks : collections.OrderedDict
+            The tables returned by mina.analysis.graph_tables.
+        skel_result : sc.fiji.analyzeSkeleton.SkeletonResult
+            If given, the end points and junction voxels are stored.
+        binary, skeleton : ij.ImagePlus
+            Optional images to store.
+        timings : dict
+            The preprocessing stage timings, if any.
+        '''
+        end_points = []
+        junctions = []
+        if skel_result is not None:
+            end_points = [[p.x, p.y, p.z] for p in skel_result.getListOfEndPoints()]
+            junctions = [[p.x, p.y, p.z] for p in skel_result.getListOfJunctionVoxels()]
+
+        temporary = self._path(".%s-%s" % (key, uuid.uuid4().hex))
+        os.makedirs(temporary)
+        with open(os.path.join(temporary, "graph.json"), "w") as handle:
+            json.dump(OrderedDict([("footprint", footprint), ("branches", branches),
+                                   ("networks", networks), ("end points", end_points),
+                                   ("junctions", junctions), ("timings", timings or OrderedDict())]), handle)
+        for name, imp in [("binary", binary), ("skeleton", skeleton)]:
+            if imp is not None:
+                saver = FileSaver(imp)
+                image_path = os.path.join(temporary, name + ".tif")
+                if imp.getStackSize() > 1:
+                    saver.saveAsTiffStack(image_path)
+                else:
+                    saver.saveAsTiff(image_path)
+
+        with self._lock:
+            path = self._path(key)
+            if os.path.exists(path):
+                shutil.rmtree(temporary, True)
+            else:
+                os.rename(temporary, path)
+            self._evict()
+
+    def size(self):
+        '''
+        Return the size of the cache on disk in bytes.
+        '''
+        return(sum([size for path, used, size in self._entries()]))
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = self._path(name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            size = sum([os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)])
+            entries.append((path, os.path.getmtime(path), size))
+        return(entries)
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        total = sum([size for path, used, size in entries])
+        while entries and total > self.max_bytes:
+            path, used, size = entries.pop(0)
+            shutil.rmtree(path, True)
+            total -= size
+
+    def clear(self):
+        '''
+        Remove every entry from the cache.
+        '''
+        with self._lock:
+            for path, used, size in self._entries():
+                shutil.rmtree(path, True)
+
+
+def default_cache():
+    '''
+    Return the cache configured in the ImageJ preferences or None.
+
+    The cache is enabled for interactive runs by setting the preference
+    "mina.cache.directory" (and optionally "mina.cache.max_bytes"), e.g. with
+    the macro call("ij.Prefs.set", "mina.cache.directory", "/path/to/cache").
+    '''
+    directory = Prefs.get(PREFS_DIRECTORY, "")
+    if directory == "":
+        return(None)
+    max_bytes = int(Prefs.get(PREFS_MAX_BYTES, 2 * 1024 ** 3))
+    return(IntermediateCache(directory, max_bytes))
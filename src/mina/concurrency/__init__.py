@@ -0,0 +1 @@
+from ._concurrency import default_workers, map_parallel, map_completed
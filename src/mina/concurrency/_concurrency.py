@@ -0,0 +1,117 @@
+from java.lang import Runtime
+from java.util.concurrent import Callable, ExecutorCompletionService, Executors
+
+
+class _Task(Callable):
+    '''
+    Wraps a python function and its argument as a java Callable.
+    '''
+    def __init__(self, function, item, index=None):
+        self.function = function
+        self.item = item
+        self.index = index
+
+    def call(self):
+        if self.index is None:
+            return(self.function(self.item))
+        return((self.index, self.function(self.item)))
+
+
+def default_workers():
+    '''
+    Return the number of worker threads to use when none is specified.
+
+    Return
+    ------
+    workers : int
+        The number of processors available to the JVM.
+    '''
+    return(Runtime.getRuntime().availableProcessors())
+
+
+def map_parallel(function, items, workers=None):
+    '''
+    Apply a function to every item using a pool of worker threads.
+
+    The results are returned in the same order as the items. When a single
+    worker is requested (or there is only one item) the function is simply
+    called in the current thread.
+
+    Parameters
+    ----------
+    function : callable
+        A function taking a single item as its only argument.
+    items : iterable
+        The items to process.
+    workers : int
+        The number of worker threads. If None or less than 1, the number of
+        available processors is used.
+
+    Return
+    ------
+    results : list
+        The return value of the function for each item.
+
+    Example
+    -------
+    >>> from mina.concurrency import map_parallel
+    >>> map_parallel(lambda x: x * 2, [1, 2, 3], workers=2)
+    [2, 4, 6]
+    '''
+    items = list(items)
+    if workers is None or workers < 1:
+        workers = default_workers()
+    workers = min(workers, len(items))
+    if workers <= 1:
+        return([function(item) for item in items])
+
+    pool = Executors.newFixedThreadPool(workers)
+    try:
+        futures = pool.invokeAll([_Task(function, item) for item in items])
+        return([future.get() for future in futures])
+    finally:
+        pool.shutdown()
+
+
+def map_completed(function, items, workers=None):
+    '''
+    Apply a function to every item and yield the results as they complete.
+
+    Unlike map_parallel, results are produced as soon as any worker finishes
+    so they can be consumed (e.g. written to disk) while the remaining items
+    are still being processed.
+
+    Parameters
+    ----------
+    function : callable
+        A function taking a single item as its only argument.
+    items : iterable
+        The items to process.
+    workers : int
+        The number of worker threads. If None or less than 1, the number of
+        available processors is used.
+
+    Return
+    ------
+    results : generator of tuple
+        The index of the item and the return value of the function, in order
+        of completion.
+    '''
+    items = list(items)
+    if workers is None or workers < 1:
+        workers = default_workers()
+    workers = min(workers, len(items))
+    if workers <= 1:
+        for index, item in enumerate(items):
+            yield((index, function(item)))
+        return
+
+    pool = Executors.newFixedThreadPool(workers)
+    try:
+        service = ExecutorCompletionService(pool)
+        for index, item in enumerate(items):
+            service.submit(_Task(function, item, index))
+        for i in range(len(items)):
+            yield(tuple(service.take().get()))
+    finally:
+        pool.shutdownNow()
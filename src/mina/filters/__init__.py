@@ -1 +1,2 @@
-from ._filters import median, unsharp, clahe
+from ._filters import median, median_3D, unsharp, clahe
+from ._pipeline import Pipeline
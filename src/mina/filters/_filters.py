@@ -1,69 +1,148 @@
-from ij import IJ, ImageStack, ImagePlus, WindowManager
+from ij import ImagePlus, WindowManager
 from ij.gui import GenericDialog
-from ij.plugin import Duplicator
+from ij.plugin import Filters3D
+from ij.plugin.filter import BackgroundSubtracter, RankFilters, UnsharpMask
 import sys
 
-from java.lang import NullPointerException
+from mpicbg.ij.clahe import Flat
 
-def median(imp, median_radius):
+import mina.concurrency
+
+
+def _processors(imp):
     '''
-    Applies a median filter to a 2D or 3D image
+    Return the processors of every plane of an image.
     '''
-    if imp.getNSlices() > 1:
-        stack = imp.getImageStack()
-        for i in range(imp.getNSlices()):
-            frame = ImagePlus(stack.getSliceLabel(i+1), stack.getProcessor(i+1))
-            IJ.run(frame, "Median...", "radius=%s" % (median_radius))
-    else:    
-        IJ.run(imp, "Median...", "radius=%s" % (median_radius))
+    stack = imp.getStack()
+    return([stack.getProcessor(i+1) for i in range(stack.getSize())])
+
 
-def unsharp(imp, unsharp_radius, unsharp_weight):
+def median_slice(ip, median_radius):
     '''
-    Applies unsharp mask to a 2D or 3D image
+    Applies a median filter to a single ImageProcessor in place
     '''
-    if imp.getNSlices() > 1:
-        stack = imp.getImageStack()
-        for i in range(imp.getNSlices()):
-            frame = ImagePlus(stack.getSliceLabel(i+1), stack.getProcessor(i+1))
-            IJ.run(frame, "Unsharp Mask...", "radius=%s mask=%s" % (unsharp_radius, unsharp_weight))
-    else:
-        IJ.run(imp, "Unsharp Mask...", "radius=%s mask=%s" % (unsharp_radius, unsharp_weight))
+    RankFilters().rank(ip, median_radius, RankFilters.MEDIAN)
+
 
-def clahe(imp, clahe_block, clahe_bins, clahe_slope, clahe_mask):
+def unsharp_slice(ip, unsharp_radius, unsharp_weight):
     '''
-    Applies Enhance Local Contrast (CLAHE) to a 2D or 3D image
+    Applies unsharp mask to a single ImageProcessor in place
     '''
-    try:
-        img_mask = Duplicator().run(WindowManager.getImage(clahe_mask), 1, 1)
-        new_title = "CLAHE_mina_mask_13423"
-        img_mask.setTitle(new_title)
-        img_mask.show()
-        clahe_mask = new_title
-    except NullPointerException:
-        if clahe_mask != "*None*":
-            d = GenericDialog("CLAHE")
-            d.addMessage(clahe_mask + " is not currently open.")
-            d.showDialog()
-            sys.exit(0)
+    fp = None
+    for channel in range(ip.getNChannels()):
+        fp = ip.toFloat(channel, fp)
+        fp.snapshot()
+        UnsharpMask().sharpenFloat(fp, unsharp_radius, unsharp_weight)
+        ip.setPixels(channel, fp)
+
+
+def clahe_slice(ip, clahe_block, clahe_bins, clahe_slope, mask=None):
+    '''
+    Applies Enhance Local Contrast (CLAHE) to a single ImageProcessor in place
+
+    The mask is a ByteProcessor of the same size or None.
+    '''
+    # CLAHE only accepts an ImagePlus, the plane is wrapped without copying. The block radius,
+    # bins and accurate (not fast) instance match the "Enhance Local Contrast (CLAHE)" command.
+    frame = ImagePlus("", ip)
+    Flat.getInstance().run(frame, (int(clahe_block) - 1) // 2, int(clahe_bins) - 1, float(clahe_slope), mask, False)
+
+
+def gaussian_slice(ip, sigma):
+    '''
+    Applies a Gaussian blur to a single ImageProcessor in place
+    '''
+    ip.blurGaussian(sigma)
+
+
+def subtract_background_slice(ip, radius, paraboloid=False):
+    '''
+    Applies rolling ball (or paraboloid) background subtraction to a single
+    ImageProcessor in place
+    '''
+    BackgroundSubtracter().rollingBallBackground(ip, radius, False, False, paraboloid, True, True)
+
+
+def clahe_mask(clahe_mask, imp):
+    '''
+    Returns the mask processor for CLAHE given the title of an open image
+
+    Returns None for "*None*". Raises a ValueError if the image is not open or
+    its size does not match the image being filtered, so it can be used
+    headless and from worker threads.
+    '''
+    if clahe_mask == "*None*":
+        return(None)
+    img_mask = WindowManager.getImage(clahe_mask)
+    if img_mask is None:
+        raise ValueError(clahe_mask + " is not currently open.")
+    mask = img_mask.getStack().getProcessor(1).convertToByteProcessor()
+    if mask.getWidth() != imp.getWidth() or mask.getHeight() != imp.getHeight():
+        raise ValueError("Mask should have the same width and hight as the image it is being applied to.")
+    return(mask)
 
+
+def load_clahe_mask(clahe_mask_title, imp):
+    '''
+    Returns the mask processor for CLAHE given the title of an open image
+
+    Returns None for "*None*". Shows a dialog and exits if the image is not
+    open or its size does not match the image being filtered.
+    '''
     try:
-        if imp.getNSlices() > 1:
-            stack = imp.getImageStack()
-            for i in range(imp.getNSlices()):
-                frame = ImagePlus(stack.getSliceLabel(i+1), stack.getProcessor(i+1))
-                IJ.run(frame, "Enhance Local Contrast (CLAHE)", "blocksize=%s histogram=%s maximum=%s mask=%s" % (clahe_block, clahe_bins, clahe_slope, clahe_mask))
-        else:
-            IJ.run(imp, "Enhance Local Contrast (CLAHE)", "blocksize=%s histogram=%s maximum=%s mask=%s" % (clahe_block, clahe_bins, clahe_slope, clahe_mask))
-    except:
+        return(clahe_mask(clahe_mask_title, imp))
+    except ValueError as e:
         d = GenericDialog("CLAHE")
-        d.addMessage("Mask should have the same width and hight as the image it is being applied to.")
+        d.addMessage(str(e))
         d.showDialog()
-        print("\nMask should have the same width and hight as the image it is being applied to.")
+        print("\n" + str(e))
         sys.exit(0)
-    
-    try:
-        img_mask.close()
-    except:
-        pass
 
 
+def median_3D(imp, median_radius):
+    '''
+    Applies a 3D median filter to a stack, with the z radius scaled by the
+    voxel calibration
+    '''
+    calibration = imp.getCalibration()
+    z_radius = median_radius * calibration.pixelWidth / calibration.pixelDepth
+    imp.setStack(Filters3D.filter(imp.getStack(), Filters3D.MEDIAN,
+                                  median_radius, median_radius, z_radius))
+
+
+def median(imp, median_radius, workers=None, use_3D=False):
+    '''
+    Applies a median filter to a 2D or 3D image
+
+    The slices of a stack are filtered concurrently. If use_3D is True, a true
+    3D median is used instead, with the z radius scaled by the voxel
+    calibration.
+    '''
+    if use_3D and imp.getNSlices() > 1:
+        median_3D(imp, median_radius)
+        return
+
+    mina.concurrency.map_parallel(lambda ip: median_slice(ip, median_radius),
+                                  _processors(imp), workers)
+
+
+def unsharp(imp, unsharp_radius, unsharp_weight, workers=None):
+    '''
+    Applies unsharp mask to a 2D or 3D image
+
+    The slices of a stack are filtered concurrently.
+    '''
+    mina.concurrency.map_parallel(lambda ip: unsharp_slice(ip, unsharp_radius, unsharp_weight),
+                                  _processors(imp), workers)
+
+
+def clahe(imp, clahe_block, clahe_bins, clahe_slope, clahe_mask, workers=None):
+    '''
+    Applies Enhance Local Contrast (CLAHE) to a 2D or 3D image
+
+    The slices of a stack are filtered concurrently. The mask is given by the
+    title of an open image or "*None*".
+    '''
+    mask = load_clahe_mask(clahe_mask, imp)
+    mina.concurrency.map_parallel(lambda ip: clahe_slice(ip, clahe_block, clahe_bins, clahe_slope, mask),
+                                  _processors(imp), workers)
@@ -0,0 +1,192 @@
+import json
+import time
+
+from collections import OrderedDict
+
+import mina.concurrency
+
+from ._filters import (median_slice, unsharp_slice, clahe_slice, gaussian_slice,
+                       subtract_background_slice, median_3D, clahe_mask)
+
+
+# Slice filters are applied to each plane independently and can be fused with
+# their neighbours, stack filters need the whole stack at once.
+SLICE_FILTERS = {"median": median_slice,
+                 "unsharp": unsharp_slice,
+                 "clahe": clahe_slice,
+                 "gaussian": gaussian_slice,
+                 "subtract_background": subtract_background_slice}
+STACK_FILTERS = {"median_3D": median_3D}
+
+
+class Pipeline():
+    def __init__(self, stages=None, workers=None):
+        '''
+        Construct an ordered pipeline of preprocessing filters.
+
+        A pipeline is defined once (e.g. from the GUI settings or a file) and
+        can then be run on any number of images. Consecutive slice filters are
+        fused: every worker applies all of them to its plane before moving on,
+        so a stack is traversed and dispatched to the thread pool once per
+        group of stages rather than once per filter.
+
+        Parameters
+        ----------
+        stages : list of dict
+            The stages as dicts holding the "filter" name and its parameters.
+            The available filters are median (radius), unsharp (radius,
+            weight), clahe (block, bins, slope, mask), gaussian (sigma),
+            subtract_background (radius, paraboloid) and median_3D (radius).
+        workers : int
+            The number of worker threads used when the pipeline is called as
+            a preprocess function. Defaults to the number of processors; use
+            1 when images are already processed concurrently. It is not part
+            of the saved definition.
+
+        Example
+        -------
+        >>> from mina.filters import Pipeline
+        >>> pipeline = Pipeline().add("median", radius=2).add("unsharp", radius=1, weight=0.6)
+        >>> timings = pipeline.run(imp)
+        '''
+        self.workers = workers
+        self.stages = []
+        for stage in stages or []:
+            stage = dict(stage)
+            self.add(stage.pop("filter"), **stage)
+
+    def add(self, name, **parameters):
+        '''
+        Append a filter stage and return the pipeline.
+        '''
+        if name not in SLICE_FILTERS and name not in STACK_FILTERS:
+            raise ValueError("unknown filter %s, choose from %s" % (
+                name, ", ".join(sorted(list(SLICE_FILTERS) + list(STACK_FILTERS)))))
+        stage = OrderedDict([("filter", name)])
+        for key in sorted(parameters):
+            stage[key] = parameters[key]
+        self.stages.append(stage)
+        return(self)
+
+    def __len__(self):
+        return(len(self.stages))
+
+    def _stage_names(self):
+        names = []
+        for index, stage in enumerate(self.stages):
+            names.append("%s %s" % (index + 1, stage["filter"]))
+        return(names)
+
+    def _slice_function(self, stage, imp):
+        name = stage["filter"]
+        if name == "median":
+            return(lambda ip: median_slice(ip, stage["radius"]))
+        if name == "unsharp":
+            return(lambda ip: unsharp_slice(ip, stage["radius"], stage["weight"]))
+        if name == "clahe":
+            mask = clahe_mask(stage.get("mask", "*None*"), imp)
+            return(lambda ip: clahe_slice(ip, stage["block"], stage["bins"], stage["slope"], mask))
+        if name == "gaussian":
+            return(lambda ip: gaussian_slice(ip, stage["sigma"]))
+        if name == "subtract_background":
+            return(lambda ip: subtract_background_slice(ip, stage["radius"],
+                                                        stage.get("paraboloid", False)))
+
+    def groups(self):
+        '''
+        Return the stages grouped for execution.
+
+        Return
+        ------
+        groups : list of list of int
+            The indices of the stages run together. Consecutive slice filters
+            share a group, stack filters are always on their own.
+        '''
+        groups = []
+        for index, stage in enumerate(self.stages):
+            if (stage["filter"] in SLICE_FILTERS and groups and
+                    self.stages[groups[-1][-1]]["filter"] in SLICE_FILTERS):
+                groups[-1].append(index)
+            else:
+                groups.append([index])
+        return(groups)
+
+    def run(self, imp, workers=None):
+        '''
+        Apply every stage in order to an image in place.
+
+        Raises a ValueError if a CLAHE mask is not open or does not match the
+        size of the image.
+
+        Parameters
+        ----------
+        imp : ij.ImagePlus
+            The image to filter. All of its planes are filtered.
+        workers : int
+            The number of worker threads. Defaults to the number of processors.
+
+        Return
+        ------
+        timings : collections.OrderedDict
+            The time spent in each stage in seconds. For fused stages this is
+            the time summed over all of the planes (i.e. thread time).
+        '''
+        names = self._stage_names()
+        timings = OrderedDict([(name, 0.0) for name in names])
+        stack = imp.getStack()
+
+        for group in self.groups():
+            first = self.stages[group[0]]
+            if first["filter"] in STACK_FILTERS:
+                start = time.time()
+                STACK_FILTERS[first["filter"]](imp, first["radius"])
+                timings[names[group[0]]] += time.time() - start
+                stack = imp.getStack()
+                continue
+
+            functions = [(names[i], self._slice_function(self.stages[i], imp)) for i in group]
+
+            def filter_plane(index):
+                ip = stack.getProcessor(index + 1)
+                spent = []
+                for name, function in functions:
+                    start = time.time()
+                    function(ip)
+                    spent.append(time.time() - start)
+                return(spent)
+
+            for spent in mina.concurrency.map_parallel(filter_plane, range(stack.getSize()), workers):
+                for (name, function), seconds in zip(functions, spent):
+                    timings[name] += seconds
+        return(timings)
+
+    def __call__(self, imp):
+        return(self.run(imp, self.workers))
+
+    def dumps(self):
+        '''
+        Serialize the pipeline to a JSON string.
+        '''
+        return(json.dumps({"stages": self.stages}))
+
+    @classmethod
+    def loads(cls, text):
+        '''
+        Construct a Pipeline from a JSON string returned by dumps.
+        '''
+        return(cls(json.loads(text, object_pairs_hook=OrderedDict)["stages"]))
+
+    def save(self, path):
+        '''
+        Write the pipeline definition to a JSON file.
+        '''
+        with open(str(path), "w") as handle:
+            handle.write(self.dumps())
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Read a pipeline definition from a JSON file written by save.
+        '''
+        with open(str(path)) as handle:
+            return(cls.loads(handle.read()))
@@ -0,0 +1,2 @@
+from ._graph import CompactGraph
+from ._topology import TOPOLOGY_METRICS, cycle_ranks, diameters, topology_metrics
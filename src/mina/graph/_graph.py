@@ -0,0 +1,316 @@
+import array
+
+from collections import OrderedDict
+
+
+BRANCH_COLUMNS = ["network", "branch", "v1", "v2", "branch length",
+                  "v1 x", "v1 y", "v1 z", "v2 x", "v2 y", "v2 z",
+                  "euclidean distance", "tortuosity"]
+NETWORK_COLUMNS = ["network", "branches", "vertices", "junctions", "end points",
+                   "summed branch length", "donut"]
+
+
+class CompactGraph():
+    def __init__(self):
+        '''
+        Construct an empty array-backed skeleton graph.
+
+        Vertices and edges are numbered from 0 and stored in flat arrays of
+        primitives rather than as Java or Python objects: the vertex
+        coordinates and network, and the two vertices, length and network of
+        every edge. Derived structures (degrees, CSR adjacency) are computed
+        on demand in single passes over these arrays and cached.
+
+        Use fromSkeletonResult or fromTables to build a graph, or add
+        vertices and edges directly.
+
+        The "branches" column of the network table is the number of edges
+        of each network, unless network_branches is set. fromSkeletonResult
+        sets it to the branch counts of AnalyzeSkeleton (getBranches), which
+        MiNA has always reported and which can differ from the edge count.
+
+        Example
+        -------
+        >>> from mina.graph import CompactGraph
+        >>> graph = CompactGraph()
+        >>> a = graph.addVertex(0, 0, 0)
+        >>> b = graph.addVertex(3, 4, 0)
+        >>> graph.addEdge(a, b, 6.0)
+        0
+        >>> list(graph.degrees())
+        [1, 1]
+        '''
+        self.x = array.array("d")
+        self.y = array.array("d")
+        self.z = array.array("d")
+        self.vertex_network = array.array("i")
+        self.v1 = array.array("i")
+        self.v2 = array.array("i")
+        self.length = array.array("d")
+        self.edge_network = array.array("i")
+        self.n_networks = 0
+        self.network_branches = None
+        self._degrees = None
+        self._csr = None
+
+    @property
+    def n_vertices(self):
+        return(len(self.x))
+
+    @property
+    def n_edges(self):
+        return(len(self.v1))
+
+    def addVertex(self, x, y, z, network=0):
+        '''
+        Append a vertex and return its index.
+        '''
+        self.x.append(x)
+        self.y.append(y)
+        self.z.append(z)
+        self.vertex_network.append(network)
+        self.n_networks = max(self.n_networks, network + 1)
+        self._degrees = self._csr = None
+        return(len(self.x) - 1)
+
+    def addEdge(self, v1, v2, length, network=None):
+        '''
+        Append an edge between two vertex indices and return its index.
+
+        The network defaults to the network of v1.
+        '''
+        if network is None:
+            network = self.vertex_network[v1]
+        self.v1.append(v1)
+        self.v2.append(v2)
+        self.length.append(length)
+        self.edge_network.append(network)
+        self._degrees = self._csr = None
+        return(len(self.v1) - 1)
+
+    @classmethod
+    def fromSkeletonResult(cls, skel_result, calibration=None):
+        '''
+        Convert the graphs of an AnalyzeSkeleton result in a single pass.
+
+        Each Java Vertex is looked up once to get its index, after which no
+        Java objects are kept.
+
+        Parameters
+        ----------
+        skel_result : sc.fiji.analyzeSkeleton.SkeletonResult
+            The result of the skeleton analysis.
+        calibration : ij.measure.Calibration
+            The calibration used to scale the vertex coordinates. If None, the
+            coordinates are in pixels.
+        '''
+        if calibration is None:
+            sx = sy = sz = 1.0
+        else:
+            sx, sy, sz = calibration.pixelWidth, calibration.pixelHeight, calibration.pixelDepth
+
+        graph = cls()
+        x, y, z, vertex_network = graph.x, graph.y, graph.z, graph.vertex_network
+        v1, v2, length, edge_network = graph.v1, graph.v2, graph.length, graph.edge_network
+        vertex_ids = {}
+        graphs = skel_result.getGraph()
+        for network, skeleton_graph in enumerate(graphs):
+            for vertex in skeleton_graph.getVertices():
+                vertex_ids[vertex] = len(x)
+                p = vertex.getPoints().get(0)
+                x.append(p.x * sx)
+                y.append(p.y * sy)
+                z.append(p.z * sz)
+                vertex_network.append(network)
+            for edge in skeleton_graph.getEdges():
+                v1.append(vertex_ids[edge.getV1()])
+                v2.append(vertex_ids[edge.getV2()])
+                length.append(edge.getLength())
+                edge_network.append(network)
+        graph.n_networks = len(graphs)
+        graph.network_branches = array.array("i", list(skel_result.getBranches()))
+        return(graph)
+
+    @classmethod
+    def fromTables(cls, branches, networks=None):
+        '''
+        Build a graph from the branch table returned by graph_tables.
+
+        Vertices are renumbered in order of appearance. Networks without any
+        branch only appear in the network table, so it is needed to restore
+        their (isolated) vertices, which get nan coordinates.
+
+        Parameters
+        ----------
+        branches : collections.OrderedDict
+            The branch table (network, v1, v2, branch length and the vertex
+            coordinates).
+        networks : collections.OrderedDict
+            The network table, used for the networks without branches.
+        '''
+        graph = cls()
+        index = {}
+        for row in range(len(branches["network"])):
+            network = int(branches["network"][row])
+            ends = []
+            for name in ["v1", "v2"]:
+                vertex = branches[name][row]
+                if vertex not in index:
+                    index[vertex] = graph.addVertex(branches[name + " x"][row], branches[name + " y"][row],
+                                                    branches[name + " z"][row], network)
+                ends.append(index[vertex])
+            graph.addEdge(ends[0], ends[1], branches["branch length"][row], network)
+        if networks is not None:
+            edges = set(graph.edge_network)
+            for network, n_vertices in zip(networks["network"], networks["vertices"]):
+                if int(network) not in edges:
+                    for i in range(int(n_vertices)):
+                        graph.addVertex(float("nan"), float("nan"), float("nan"), int(network))
+            graph.n_networks = max(graph.n_networks, len(networks["network"]))
+            graph.network_branches = array.array("i", [int(n) for n in networks["branches"]])
+        return(graph)
+
+    def degrees(self):
+        '''
+        Return the degree of every vertex (self loops count twice).
+        '''
+        if self._degrees is None:
+            degrees = array.array("i", [0]) * self.n_vertices
+            for v in self.v1:
+                degrees[v] += 1
+            for v in self.v2:
+                degrees[v] += 1
+            self._degrees = degrees
+        return(self._degrees)
+
+    def csr(self):
+        '''
+        Return the adjacency of the graph in compressed sparse row form.
+
+        Return
+        ------
+        offsets : array.array
+            The neighbours of vertex i are at offsets[i] to offsets[i+1].
+        neighbours : array.array
+            The neighbouring vertex of each entry.
+        edges : array.array
+            The edge leading to the neighbour of each entry.
+        '''
+        if self._csr is None:
+            degrees = self.degrees()
+            offsets = array.array("i", [0]) * (self.n_vertices + 1)
+            for i in range(self.n_vertices):
+                offsets[i + 1] = offsets[i] + degrees[i]
+            fill = array.array("i", offsets[:-1]) if self.n_vertices else array.array("i")
+            neighbours = array.array("i", [0]) * offsets[-1]
+            edges = array.array("i", [0]) * offsets[-1]
+            for e in range(self.n_edges):
+                a = self.v1[e]
+                b = self.v2[e]
+                neighbours[fill[a]] = b
+                edges[fill[a]] = e
+                fill[a] += 1
+                neighbours[fill[b]] = a
+                edges[fill[b]] = e
+                fill[b] += 1
+            self._csr = (offsets, neighbours, edges)
+        return(self._csr)
+
+    def degree_histogram(self):
+        '''
+        Return the number of vertices of each degree (index = degree).
+        '''
+        degrees = self.degrees()
+        histogram = [0] * ((max(degrees) if len(degrees) else 0) + 1)
+        for d in degrees:
+            histogram[d] += 1
+        return(histogram)
+
+    def networkMetrics(self):
+        '''
+        Compute the per-network counts in one pass over the edges and one
+        over the vertices.
+
+        Return
+        ------
+        networks : collections.OrderedDict
+            The network table in the layout of graph_tables. Branches are
+            network_branches if set and the edge counts otherwise. Junctions
+            and end points are the vertices of degree > 2 and 1. A donut is a
+            network with at least one branch and no vertex of degree < 2.
+        '''
+        n = self.n_networks
+        branch_counts = array.array("i", [0]) * n
+        summed = array.array("d", [0.0]) * n
+        for e in range(self.n_edges):
+            network = self.edge_network[e]
+            branch_counts[network] += 1
+            summed[network] += self.length[e]
+
+        vertex_counts = array.array("i", [0]) * n
+        junctions = array.array("i", [0]) * n
+        end_points = array.array("i", [0]) * n
+        low_degree = array.array("i", [0]) * n
+        degrees = self.degrees()
+        for v in range(self.n_vertices):
+            network = self.vertex_network[v]
+            d = degrees[v]
+            vertex_counts[network] += 1
+            if d > 2:
+                junctions[network] += 1
+            elif d == 1:
+                end_points[network] += 1
+                low_degree[network] += 1
+
+        networks = OrderedDict()
+        networks["network"] = list(range(n))
+        if self.network_branches is not None:
+            networks["branches"] = list(self.network_branches)
+        else:
+            networks["branches"] = list(branch_counts)
+        networks["vertices"] = list(vertex_counts)
+        networks["junctions"] = list(junctions)
+        networks["end points"] = list(end_points)
+        networks["summed branch length"] = list(summed)
+        networks["donut"] = [1 if branch_counts[i] > 0 and low_degree[i] == 0 else 0 for i in range(n)]
+        return(networks)
+
+    def branchTable(self):
+        '''
+        Return the branch table in the layout of graph_tables.
+
+        Branches are numbered from 0 within each network in edge order. Each
+        column is computed in its own pass over the edge arrays.
+        '''
+        x, y, z = self.x, self.y, self.z
+        v1, v2 = self.v1, self.v2
+        lengths = list(self.length)
+
+        counters = [0] * self.n_networks
+        numbers = []
+        for network in self.edge_network:
+            numbers.append(counters[network])
+            counters[network] += 1
+
+        ends = [[coordinate[v] for v in vertices] for vertices in [v1, v2] for coordinate in [x, y, z]]
+        distances = [((ax - bx) ** 2 + (ay - by) ** 2 + (az - bz) ** 2) ** 0.5
+                     for ax, ay, az, bx, by, bz in zip(*ends)]
+
+        branches = OrderedDict()
+        branches["network"] = list(self.edge_network)
+        branches["branch"] = numbers
+        branches["v1"] = list(v1)
+        branches["v2"] = list(v2)
+        branches["branch length"] = lengths
+        for column, values in zip(BRANCH_COLUMNS[5:11], ends):
+            branches[column] = values
+        branches["euclidean distance"] = distances
+        branches["tortuosity"] = [length / distance if distance > 0 else float("nan")
+                                  for length, distance in zip(lengths, distances)]
+        return(branches)
+
+    def tables(self):
+        '''
+        Return the branch and network tables (see mina.analysis.graph_tables).
+        '''
+        return(self.branchTable(), self.networkMetrics())
@@ -0,0 +1,172 @@
+import heapq
+import time
+
+from collections import OrderedDict
+
+import mina.statistics
+
+
+# The available topology metrics in the order they are reported
+TOPOLOGY_METRICS = ["cycle rank", "network size", "degree", "diameter"]
+
+# Networks with cycles and more vertices than this get an approximate diameter
+EXACT_DIAMETER_LIMIT = 1000
+
+
+def network_vertices(graph):
+    '''
+    Return the vertex indices of every network of a CompactGraph.
+    '''
+    members = [[] for network in range(graph.n_networks)]
+    for vertex, network in enumerate(graph.vertex_network):
+        members[network].append(vertex)
+    return(members)
+
+
+def cycle_ranks(graph):
+    '''
+    Return the cycle rank (number of independent loops) of every network.
+
+    A network is connected, so its cycle rank is E - V + 1. Summed over all
+    networks this is E - V + C for the whole graph.
+    '''
+    edges = [0] * graph.n_networks
+    vertices = [0] * graph.n_networks
+    for network in graph.edge_network:
+        edges[network] += 1
+    for network in graph.vertex_network:
+        vertices[network] += 1
+    return([e - v + 1 if v > 0 else 0 for e, v in zip(edges, vertices)])
+
+
+def _distances(graph, source):
+    '''
+    Return the branch length distances from one vertex (Dijkstra).
+    '''
+    offsets, neighbours, edges = graph.csr()
+    length = graph.length
+    distances = {source: 0.0}
+    queue = [(0.0, source)]
+    while queue:
+        distance, vertex = heapq.heappop(queue)
+        if distance > distances[vertex]:
+            continue
+        for i in range(offsets[vertex], offsets[vertex + 1]):
+            n = neighbours[i]
+            d = distance + length[edges[i]]
+            if n not in distances or d < distances[n]:
+                distances[n] = d
+                heapq.heappush(queue, (d, n))
+    return(distances)
+
+
+def _farthest(distances):
+    vertex = max(distances, key=lambda v: distances[v])
+    return(vertex, distances[vertex])
+
+
+def diameters(graph, exact_limit=EXACT_DIAMETER_LIMIT):
+    '''
+    Return the diameter of every network: its longest shortest path, in
+    branch length, between two vertices.
+
+    The diameter of a network without loops is found exactly with two
+    traversals (from any vertex to the farthest one, then from there). A
+    network with loops and at most exact_limit vertices is traversed from
+    every vertex. Beyond that, repeated double sweeps give a lower bound of
+    the diameter that is usually exact or very close to it.
+
+    Parameters
+    ----------
+    graph : CompactGraph
+        The graph.
+    exact_limit : int
+        The largest number of vertices of a network with loops for which the
+        diameter is computed exactly.
+
+    Return
+    ------
+    diameters : list of float
+        The diameter of each network (0 for a single vertex).
+    '''
+    ranks = cycle_ranks(graph)
+    result = []
+    for network, members in enumerate(network_vertices(graph)):
+        if len(members) < 2:
+            result.append(0.0)
+            continue
+        if ranks[network] > 0 and len(members) <= exact_limit:
+            result.append(max([_farthest(_distances(graph, v))[1] for v in members]))
+            continue
+        sweeps = 1 if ranks[network] == 0 else 4
+        vertex, diameter = _farthest(_distances(graph, members[0]))
+        for sweep in range(sweeps):
+            vertex, distance = _farthest(_distances(graph, vertex))
+            if distance <= diameter and sweep > 0:
+                break
+            diameter = max(diameter, distance)
+        result.append(diameter)
+    return(result)
+
+
+def topology_metrics(graph, metrics=None):
+    '''
+    Summarize the topology of the networks of a CompactGraph.
+
+    Parameters
+    ----------
+    graph : CompactGraph
+        The graph (see CompactGraph.fromSkeletonResult and fromTables).
+    metrics : list of str
+        The metrics to compute, from TOPOLOGY_METRICS (default all):
+
+        - "cycle rank": the total number of independent loops (E - V + C)
+          and the mean per network.
+        - "network size": the number of networks and the mean, median and
+          maximum number of vertices per network.
+        - "degree": the number of vertices of degree 1, 2, 3 and 4 or more.
+        - "diameter": the mean and maximum network diameter (see
+          diameters). This is by far the most expensive metric.
+
+    Return
+    ------
+    parameters : collections.OrderedDict
+        The metrics followed by the time spent on each of them, as
+        "<metric> time (s)".
+    '''
+    if metrics is None:
+        metrics = TOPOLOGY_METRICS
+    for metric in metrics:
+        if metric not in TOPOLOGY_METRICS:
+            raise ValueError("unknown topology metric %s, choose from %s" % (
+                metric, ", ".join(TOPOLOGY_METRICS)))
+
+    parameters = OrderedDict()
+    timings = OrderedDict()
+    for metric in TOPOLOGY_METRICS:
+        if metric not in metrics:
+            continue
+        start = time.time()
+        if metric == "cycle rank":
+            ranks = cycle_ranks(graph)
+            parameters["independent loops"] = sum(ranks)
+            parameters["network cycle rank mean"] = mina.statistics.mean(ranks) if ranks else float("nan")
+        elif metric == "network size":
+            sizes = mina.statistics.Accumulator([len(m) for m in network_vertices(graph)])
+            parameters["networks"] = sizes.count
+            parameters["network vertices mean"] = sizes.mean()
+            parameters["network vertices median"] = sizes.median()
+            parameters["network vertices max"] = sizes.maximum
+        elif metric == "degree":
+            histogram = graph.degree_histogram() + [0] * 4
+            parameters["degree 1 vertices"] = histogram[1]
+            parameters["degree 2 vertices"] = histogram[2]
+            parameters["degree 3 vertices"] = histogram[3]
+            parameters["degree 4+ vertices"] = sum(histogram[4:])
+        elif metric == "diameter":
+            values = mina.statistics.Accumulator(diameters(graph))
+            parameters["network diameter mean"] = values.mean()
+            parameters["network diameter max"] = values.maximum
+        timings[metric + " time (s)"] = time.time() - start
+    parameters.update(timings)
+    return(parameters)
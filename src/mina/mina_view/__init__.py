@@ -1 +1,3 @@
-from ._mina_view import preview_images, overlay_2D, create_3Dmodel
+from ._mina_view import preview_images, overlay_2D, render_overlay, flatten_overlay, save_overlay_2D, create_3Dmodel
+from ._model import skeleton_lines, skeleton_mesh, surface_triangles, decimate_triangles, surface_mesh, export_model
+from ._preview import PreviewSession, preview_session, clear_preview_sessions
@@ -1,13 +1,18 @@
 from javax.swing import JPanel, JFrame, JLabel, ImageIcon, JTextArea, JScrollPane, JSplitPane, JButton
 from java.awt.event import ComponentListener, ComponentAdapter
 from java.awt import Image, Color, Dimension, Graphics2D, RenderingHints
-from java.awt.image import BufferedImage
+from java.awt.geom import Ellipse2D
+from java.awt.image import BufferedImage, IndexColorModel
+from java.io import File
 from java.lang import Runnable
+from javax.imageio import ImageIO
+import jarray
 
-from ij import IJ, WindowManager
-from ij.gui import ImageRoi, OvalRoi
+from ij import IJ, ImagePlus
+from ij.gui import ImageRoi
 from ij.gui import Overlay
 from ij.plugin import Duplicator
+from ij.process import Blitter, ImageProcessor
 
 from ij3d import Image3DUniverse;
 from org.scijava.vecmath import Point3f;
@@ -15,10 +20,20 @@ from org.scijava.vecmath import Color3f;
 
 from sc.fiji.analyzeSkeleton import AnalyzeSkeleton_;
 
+from ._model import skeleton_mesh, surface_mesh
+from ._preview import PreviewSession, preview_session, downsample
 
-def create_3Dmodel(imp_calibration, binary, skel_result):
+
+def create_3Dmodel(imp_calibration, binary, skel_result, resampling=2, color_by_network=False, decimation=1):
     '''
     Create a 3D model of the stack with its end points, junctions and skeleton.
+
+    The skeleton is added as a single line mesh (see skeleton_mesh) and the
+    surface is meshed after downsampling the stack by the resampling factor
+    and, if decimation is above 1, simplified by vertex clustering (see
+    decimate_triangles), which keeps large stacks responsive. Use
+    export_model to write the same geometry to a file without opening the
+    viewer.
     '''
     
     univ = Image3DUniverse()
@@ -42,75 +57,108 @@ def create_3Dmodel(imp_calibration, binary, skel_result):
         junction_list.append(Point3f(p.x * pixelWidth, p.y * pixelHeight, p.z * pixelDepth))
     univ.addIcospheres(junction_list, Color3f(0, 169, 255), 2, 1*pixelDepth, "junctions")
 
-    # Add the lines in green
-    graphs = skel_result.getGraph()
-    for graph in range(len(graphs)):
-        edges = graphs[graph].getEdges()
-        for edge in range(len(edges)):
-            branch_points = []
-            for p in edges[edge].getSlabs():
-                branch_points.append(Point3f(p.x * pixelWidth, p.y * pixelHeight, p.z * pixelDepth))
-            univ.addLineMesh(branch_points, Color3f(0.0, 255.0, 0.0), "branch-%s-%s"%(graph, edge), True)
+    # Add the lines in green, all branches in one content
+    univ.addCustomMesh(skeleton_mesh(imp_calibration, skel_result, color_by_network), "skeleton")
 
     # Add the surface
-    univ.addMesh(binary)
+    if decimation > 1:
+        univ.addCustomMesh(surface_mesh(imp_calibration, binary, resampling, decimation), "binary")
+    else:
+        univ.addMesh(binary, None, "binary", 128, [True, True, True], resampling)
     univ.getContent("binary").setTransparency(0.5)
         
 
+def _color_layer(ip, color):
+    '''
+    Wraps an 8-bit mask as an image where every non-zero pixel has the given
+    (ARGB) color and zero is transparent, using an IndexColorModel so the
+    pixels are not copied into an RGB buffer.
+    '''
+    def signed(value):
+        return value - 256 if value > 127 else value
+
+    ip = ip.convertToByteProcessor(False)
+    channels = [color.getRed(), color.getGreen(), color.getBlue(), color.getAlpha()]
+    luts = [jarray.array([0] + [signed(c)] * 255, "b") for c in channels]
+    color_model = IndexColorModel(8, 256, luts[0], luts[1], luts[2], luts[3])
+    raster = color_model.createCompatibleWritableRaster(ip.getWidth(), ip.getHeight())
+    raster.setDataElements(0, 0, ip.getWidth(), ip.getHeight(), ip.getPixels())
+    return BufferedImage(color_model, raster, False, None)
+
+
+def _outline(ip):
+    '''
+    Returns the outline of an 8-bit mask: the mask minus its 3x3 minimum.
+    '''
+    mask = ip.convertToByteProcessor(False)
+    outline = mask.duplicate()
+    eroded = mask.duplicate()
+    eroded.filter(ImageProcessor.MIN)
+    outline.copyBits(eroded, 0, 0, Blitter.DIFFERENCE)
+    return outline
+
+
+def render_overlay(binary, skeleton, skel_result, image=None):
+    '''
+    Renders the area in magenta, its outline, the skeleton in green, end points
+    in yellow and junctions in blue into a single ARGB image in one pass.
+
+    Nothing is shown and no global options are changed, so this works
+    headless. If image (a java.awt.Image of the same size) is given, the
+    overlay is drawn on top of it, otherwise the background is transparent.
+    '''
+    binary_ip = binary.getProcessor()
+    width, height = binary_ip.getWidth(), binary_ip.getHeight()
+    layer = BufferedImage(width, height, BufferedImage.TYPE_INT_ARGB)
+    g = layer.createGraphics()
+    if image is not None:
+        g.drawImage(image, 0, 0, None)
+    g.drawImage(_color_layer(binary_ip, Color(255, 0, 255, 26)), 0, 0, None)
+    g.drawImage(_color_layer(_outline(binary_ip), Color(255, 0, 255, 128)), 0, 0, None)
+    g.drawImage(_color_layer(skeleton.getProcessor(), Color(0, 255, 0)), 0, 0, None)
+
+    g.setRenderingHint(RenderingHints.KEY_ANTIALIASING, RenderingHints.VALUE_ANTIALIAS_ON)
+    # add end points in yellow and junctions in bluish
+    for points, color in [(skel_result.getListOfEndPoints(), Color(255, 255, 0, 150)),
+                          (skel_result.getListOfJunctionVoxels(), Color(0, 169, 255, 150))]:
+        g.setColor(color)
+        for p in points:
+            g.fill(Ellipse2D.Double(p.x, p.y, 3.8, 3.8))
+    g.dispose()
+    return layer
+
+
 def overlay_2D(imp, binary, skeleton, skel_result):
     '''
     Adds the overlay to a 2D image. The overlay includes the skeleton in green, area in magenta,
     end points in yellow and junctions in blue.
-    '''
-    binary_outline = Duplicator().run(binary, 1, 1)
-    binary_outline.show()
-    IJ.run("Options...", "black")
-    IJ.run(binary_outline, "Make Binary", "")
-    IJ.run(binary_outline, "Outline", "")
-    
-    IJ.run(skeleton, "Green", "")
-    IJ.run(binary, "Magenta", "")
-    IJ.run(binary_outline, "Magenta", "")
-
-    skeleton_ROI = ImageRoi(0,0,skeleton.getProcessor())
-    skeleton_ROI.setZeroTransparent(True)
-    skeleton_ROI.setOpacity(1.0)
-    binary_ROI = ImageRoi(0,0,binary.getProcessor())
-    binary_ROI.setZeroTransparent(True)
-    binary_ROI.setOpacity(0.10)
-    binary_outline_ROI = ImageRoi(0,0,binary_outline.getProcessor())
-    binary_outline_ROI.setZeroTransparent(True)
-    binary_outline_ROI.setOpacity(0.5)
-
-    binary_outline.changes = False
-    binary_outline.close()
-
-    overlay = Overlay()
-    overlay.add(binary_ROI)
-    overlay.add(binary_outline_ROI)
-    overlay.add(skeleton_ROI)
-
-    # add end points in yellow
-    end_points = skel_result.getListOfEndPoints()
-    for p in end_points:
-        endp_color = Color(255,255,0,150)
-        point_ROI = OvalRoi(p.x, p.y, 3.8, 3.8)
-        point_ROI.setStrokeColor(endp_color)
-        point_ROI.setFillColor(endp_color)
-        overlay.add(point_ROI)  
-    
-    # add junctions in bluish
-    junctions = skel_result.getListOfJunctionVoxels()
-    for junction in junctions:
-        junct_color = Color(0,169,255,150)
-        junction_ROI = OvalRoi(junction.x, junction.y, 3.8, 3.8)
-        junction_ROI.setStrokeColor(junct_color)
-        junction_ROI.setFillColor(junct_color)
-        overlay.add(junction_ROI)
 
+    The overlay is a single image ROI rendered by render_overlay, rather than
+    one ROI per end point and junction.
+    '''
+    overlay = Overlay(ImageRoi(0, 0, render_overlay(binary, skeleton, skel_result)))
     imp.setOverlay(overlay)
-    imp.updateAndDraw()   
-    
+    imp.updateAndDraw()
+
+
+def flatten_overlay(imp, binary, skeleton, skel_result):
+    '''
+    Returns the current plane of an image, as displayed, with the overlay
+    drawn on it as an ARGB BufferedImage.
+    '''
+    ip = imp.getProcessor()
+    if imp.getBitDepth() != 24:
+        ip = ip.convertToByteProcessor(True)
+    return render_overlay(binary, skeleton, skel_result, ip.getBufferedImage())
+
+
+def save_overlay_2D(path, imp, binary, skeleton, skel_result):
+    '''
+    Writes the image with its overlay to a PNG file without displaying
+    anything, e.g. from a batch or headless run.
+    '''
+    ImageIO.write(flatten_overlay(imp, binary, skeleton, skel_result), "png", File(str(path)))
+
 
 def preview_side_by_side(overlay, filtered, table):
     '''
@@ -204,32 +252,66 @@ def prepare_table(params):
     return panel
 
 def preview_images(imp, preprocessing_filters, threshold_image, use_ridge_detection, ridge_detect, rd_max, rd_min, rd_width, rd_length, param_strings, 
-        user_preprocessing, preprocessor_path): 
+        user_preprocessing, preprocessor_path, settings=None, scale=1.0): 
     '''
     preview the image with the preprocessing selected.
+
+    For 2D images the filtered image, the binary and the skeleton are kept
+    in a preview session (see preview_session). If settings are given, a
+    later preview of the same image only recomputes the stages from the
+    first one whose settings changed, e.g. changing the ridge detection
+    reuses the filtered and binary images.
+
+    Parameters
+    ----------
+    settings : dict
+        The settings of the "filtered" (user preprocessor and filters),
+        "binary" (thresholding) and "skeleton" (ridge detection) stages. If
+        None, nothing is reused.
+    scale : float
+        Preview a copy of a 2D image downsampled by this factor. Filter
+        radii are in pixels, so the preview only approximates the full
+        resolution result.
     '''
-        
-    imp_original = Duplicator().run(imp, 1, 1)
-    user_preprocessing(imp, preprocessor_path)
-    preprocessing_filters(imp)
-    imp_filtered = Duplicator().run(imp, 1, 1)
-    binary = threshold_image(imp)
-    if imp.getNSlices() == 1:
+    if imp.getNSlices() > 1:
+        user_preprocessing(imp, preprocessor_path)
+        preprocessing_filters(imp)
+        imp.show()
+        return
+
+    if settings is None:
+        session = PreviewSession(None)
+        settings = {}
+    else:
+        session = preview_session(imp, scale)
+    session.begin()
+
+    imp_original = session.stage("original", scale, lambda: downsample(imp, scale))
+
+    def filter_image():
+        imp_filtered = Duplicator().run(imp_original)
+        imp_filtered.setTitle(imp.getTitle())
+        user_preprocessing(imp_filtered, preprocessor_path)
+        preprocessing_filters(imp_filtered)
+        imp_filtered.hide()
+        return(imp_filtered)
+
+    imp_filtered = session.stage("filtered", settings.get("filtered"), filter_image)
+    binary = session.stage("binary", settings.get("binary"), lambda: threshold_image(imp_filtered))
+
+    def skeletonize():
         if use_ridge_detection:
-            skeleton = ridge_detect(imp, rd_max, rd_min, rd_width, rd_length)
-        else:
-            skeleton = Duplicator().run(binary)
-            IJ.run(skeleton, "Skeletonize (2D/3D)", "")
+            ridges = ridge_detect(imp_filtered, rd_max, rd_min, rd_width, rd_length)
+            return(ridges.skeleton(), ridges)
+        skeleton = Duplicator().run(binary)
+        IJ.run(skeleton, "Skeletonize (2D/3D)", "")
         skel = AnalyzeSkeleton_()
         skel.setup("", skeleton)
-        skel_result = skel.run()
-        overlay_2D(imp_original, binary, skeleton, skel_result)
-        IJ.run(imp_original, "Flatten", "")
-        imp_original = WindowManager.getCurrentImage()
-        table = prepare_table(param_strings)
-        preview_side_by_side(imp_original, imp_filtered, table)
-        imp_original.close()
-    else:
-        imp.show()
+        return(skeleton, skel.run())
 
+    skeleton, skel_result = session.stage("skeleton", settings.get("skeleton"), skeletonize)
+    IJ.showStatus("Preview recomputed: %s" % (", ".join(session.computed) or "nothing"))
 
+    imp_overlay = ImagePlus("overlay", flatten_overlay(imp_original, binary, skeleton, skel_result))
+    table = prepare_table(param_strings)
+    preview_side_by_side(imp_overlay, imp_filtered, table)
@@ -0,0 +1,243 @@
+import os
+
+from java.awt import Color
+
+from customnode import CustomLineMesh, CustomTriangleMesh
+from marchingcubes import MCTriangulator
+from org.scijava.vecmath import Point3f
+from org.scijava.vecmath import Color3f
+
+
+def _network_color(network):
+    '''
+    Returns a distinct color for every network (golden ratio hue steps).
+    '''
+    rgb = Color.getHSBColor((network * 0.618033988749895) % 1.0, 0.8, 1.0)
+    return(Color3f(rgb.getRed() / 255.0, rgb.getGreen() / 255.0, rgb.getBlue() / 255.0))
+
+
+def skeleton_lines(imp_calibration, skel_result, color_by_network=False):
+    '''
+    Collects the slabs of every branch as pairs of points for a single
+    PAIRWISE line mesh.
+
+    Return
+    ------
+    points : list of org.scijava.vecmath.Point3f
+        The calibrated line segments, two points per segment.
+    colors : list of org.scijava.vecmath.Color3f
+        The color of every point: green, or one color per network if
+        color_by_network is True.
+    '''
+    pixelWidth = imp_calibration.pixelWidth
+    pixelHeight = imp_calibration.pixelHeight
+    pixelDepth = imp_calibration.pixelDepth
+
+    green = Color3f(0.0, 1.0, 0.0)
+    points = []
+    colors = []
+    for network, graph in enumerate(skel_result.getGraph()):
+        color = _network_color(network) if color_by_network else green
+        for edge in graph.getEdges():
+            previous = None
+            for p in edge.getSlabs():
+                point = Point3f(p.x * pixelWidth, p.y * pixelHeight, p.z * pixelDepth)
+                if previous is not None:
+                    points.append(previous)
+                    points.append(point)
+                    colors.append(color)
+                    colors.append(color)
+                previous = point
+    return(points, colors)
+
+
+def skeleton_mesh(imp_calibration, skel_result, color_by_network=False):
+    '''
+    Builds the whole skeleton as one CustomLineMesh with per-vertex colors,
+    so the 3D viewer holds a single content instead of one per branch.
+    '''
+    points, colors = skeleton_lines(imp_calibration, skel_result, color_by_network)
+    mesh = CustomLineMesh(points, CustomLineMesh.PAIRWISE, Color3f(0.0, 1.0, 0.0), 0.0)
+    if points:
+        mesh.setColor(colors)
+    return(mesh)
+
+
+def surface_triangles(binary, resampling=2, threshold=128):
+    '''
+    Triangulates the surface of a binary stack with marching cubes.
+
+    Parameters
+    ----------
+    binary : ij.ImagePlus
+        The binary stack (foreground 255).
+    resampling : int
+        The downsampling factor applied in every dimension before meshing.
+        The number of triangles drops roughly with its square.
+    threshold : int
+        The iso-value of the surface.
+
+    Return
+    ------
+    triangles : list of org.scijava.vecmath.Point3f
+        The calibrated corners, three per triangle.
+    '''
+    return(MCTriangulator().getTriangles(binary, threshold, [True, True, True], resampling))
+
+
+def decimate_triangles(triangles, imp_calibration, decimation):
+    '''
+    Simplifies a triangle mesh by vertex clustering.
+
+    The corners falling in the same cell of a grid of decimation voxels are
+    replaced by their mean and the triangles that collapse to a line or a
+    point are dropped, so the number of triangles drops roughly with the
+    square of the decimation.
+
+    Parameters
+    ----------
+    triangles : list of org.scijava.vecmath.Point3f
+        The calibrated corners, three per triangle (see surface_triangles).
+    imp_calibration : ij.measure.Calibration
+        The calibration of the image, used to size the cells.
+    decimation : float
+        The size of the cells in voxels. Values of 1 or less leave the mesh
+        unchanged.
+
+    Return
+    ------
+    triangles : list of org.scijava.vecmath.Point3f
+        The corners of the remaining triangles, three per triangle.
+    '''
+    if decimation <= 1 or len(triangles) == 0:
+        return(triangles)
+    sizes = [decimation * imp_calibration.pixelWidth, decimation * imp_calibration.pixelHeight,
+             decimation * imp_calibration.pixelDepth]
+
+    # Sum the corners of every cell, counting each shared corner once
+    cells = {}
+    sums = {}
+    for p in triangles:
+        key = (p.x, p.y, p.z)
+        if key not in cells:
+            cell = (int(p.x // sizes[0]), int(p.y // sizes[1]), int(p.z // sizes[2]))
+            cells[key] = cell
+            total = sums.setdefault(cell, [0.0, 0.0, 0.0, 0])
+            total[0] += p.x
+            total[1] += p.y
+            total[2] += p.z
+            total[3] += 1
+    means = dict([(cell, Point3f(x / n, y / n, z / n)) for cell, (x, y, z, n) in sums.items()])
+
+    result = []
+    for i in range(0, len(triangles) - 2, 3):
+        corners = [cells[(p.x, p.y, p.z)] for p in triangles[i:i + 3]]
+        if corners[0] != corners[1] and corners[1] != corners[2] and corners[0] != corners[2]:
+            result.extend([means[cell] for cell in corners])
+    return(result)
+
+
+def surface_mesh(imp_calibration, binary, resampling=2, decimation=1):
+    '''
+    Builds the surface of a binary stack as a CustomTriangleMesh, decimated
+    with decimate_triangles. The decimation is in resampled voxels.
+    '''
+    triangles = decimate_triangles(surface_triangles(binary, resampling), imp_calibration,
+                                   decimation * resampling)
+    return(CustomTriangleMesh(triangles, Color3f(1.0, 0.0, 1.0), 0.5))
+
+
+def _write_obj(path, vertices, faces, lines):
+    with open(path, "w") as handle:
+        handle.write("# MiNA 3D model\n")
+        for p in vertices:
+            handle.write("v %f %f %f\n" % (p.x, p.y, p.z))
+        for a, b, c in faces:
+            handle.write("f %d %d %d\n" % (a + 1, b + 1, c + 1))
+        for a, b in lines:
+            handle.write("l %d %d\n" % (a + 1, b + 1))
+
+
+def _write_ply(path, vertices, colors, faces, lines):
+    with open(path, "w") as handle:
+        handle.write("ply\nformat ascii 1.0\ncomment MiNA 3D model\n")
+        handle.write("element vertex %d\n" % len(vertices))
+        handle.write("property float x\nproperty float y\nproperty float z\n")
+        handle.write("property uchar red\nproperty uchar green\nproperty uchar blue\n")
+        handle.write("element face %d\nproperty list uchar int vertex_indices\n" % len(faces))
+        handle.write("element edge %d\nproperty int vertex1\nproperty int vertex2\n" % len(lines))
+        handle.write("end_header\n")
+        for p, c in zip(vertices, colors):
+            handle.write("%f %f %f %d %d %d\n" % (p.x, p.y, p.z, int(c.x * 255), int(c.y * 255), int(c.z * 255)))
+        for a, b, c in faces:
+            handle.write("3 %d %d %d\n" % (a, b, c))
+        for a, b in lines:
+            handle.write("%d %d\n" % (a, b))
+
+
+def export_model(path, imp_calibration, binary, skel_result, resampling=2, color_by_network=False,
+                 decimation=1):
+    '''
+    Writes the surface of a binary stack and its skeleton to a Wavefront
+    (.obj) or PLY (.ply) file without opening the 3D viewer.
+
+    The surface is triangulated with marching cubes at the given resampling
+    factor, optionally decimated (see decimate_triangles), and shared
+    corners are merged. The skeleton is written as line
+    segments (OBJ "l" elements, PLY "edge" elements). PLY files also hold
+    the vertex colors: magenta for the surface and green (or one color per
+    network) for the skeleton.
+
+    Parameters
+    ----------
+    path : str
+        The output file, its extension selects the format.
+    imp_calibration : ij.measure.Calibration
+        The calibration of the image.
+    binary : ij.ImagePlus
+        The binary stack.
+    skel_result : sc.fiji.analyzeSkeleton.SkeletonResult
+        The result of the skeleton analysis.
+    resampling : int
+        The downsampling factor of the surface (see surface_triangles).
+    color_by_network : bool
+        Should every network get its own color?
+    decimation : float
+        The cell size of the surface decimation in resampled voxels (1 for
+        none), e.g. 3 removes about 90% of the triangles.
+    '''
+    path = str(path)
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in [".obj", ".ply"]:
+        raise ValueError("unknown 3D model format %s, use .obj or .ply" % extension)
+
+    vertices = []
+    colors = []
+    index = {}
+    faces = []
+    magenta = Color3f(1.0, 0.0, 1.0)
+    corners = []
+    triangles = decimate_triangles(surface_triangles(binary, resampling), imp_calibration,
+                                   decimation * resampling)
+    for p in triangles:
+        key = (p.x, p.y, p.z)
+        if key not in index:
+            index[key] = len(vertices)
+            vertices.append(p)
+            colors.append(magenta)
+        corners.append(index[key])
+        if len(corners) == 3:
+            faces.append(corners)
+            corners = []
+
+    lines = []
+    points, line_colors = skeleton_lines(imp_calibration, skel_result, color_by_network)
+    for i in range(0, len(points), 2):
+        lines.append((len(vertices), len(vertices) + 1))
+        vertices.extend(points[i:i + 2])
+        colors.extend(line_colors[i:i + 2])
+
+    if extension == ".obj":
+        _write_obj(path, vertices, faces, lines)
+    else:
+        _write_ply(path, vertices, colors, faces, lines)
@@ -0,0 +1,122 @@
+from collections import OrderedDict
+
+from ij import ImagePlus
+from ij.plugin import Duplicator
+
+import mina.cache
+
+
+# The number of images whose preview intermediates are kept in memory
+MAX_SESSIONS = 2
+
+# The preview sessions by image key, most recently used last. Jython keeps
+# imported modules between script runs, so this outlives a single click of
+# the Preview button.
+_SESSIONS = OrderedDict()
+
+
+class PreviewSession():
+    def __init__(self, key):
+        '''
+        Keeps the last result of every preview stage along with the settings
+        that produced it.
+
+        Stages are run in order with stage(). A stage is only recomputed if
+        its settings changed or an earlier stage was recomputed during the
+        same pass, otherwise its previous result is returned. Results are
+        shared between passes, so the compute functions must not modify the
+        results of earlier stages (duplicate them first).
+
+        Example
+        -------
+        >>> session = preview_session(imp)
+        >>> session.begin()
+        >>> filtered = session.stage("filtered", pipeline.dumps(), filter_copy)
+        >>> binary = session.stage("binary", threshold_method, lambda: threshold(filtered))
+        '''
+        self.key = key
+        self._settings = {}
+        self._results = {}
+        self._recomputed = False
+        self.computed = []
+
+    def begin(self):
+        '''
+        Start a new pass through the stages.
+        '''
+        self._recomputed = False
+        self.computed = []
+
+    def stage(self, name, settings, compute):
+        '''
+        Return the result of a stage, computing it only when needed.
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage.
+        settings :
+            Any value comparable with == that determines the result of the
+            stage given the results of the earlier stages.
+        compute : callable
+            Called without arguments to compute the result.
+        '''
+        if self._recomputed or name not in self._results or self._settings[name] != settings:
+            self._results[name] = compute()
+            self._settings[name] = settings
+            self._recomputed = True
+            self.computed.append(name)
+        return(self._results[name])
+
+    def clear(self):
+        '''
+        Drop all intermediates.
+        '''
+        self._settings = {}
+        self._results = {}
+
+
+def preview_session(imp, scale=1.0):
+    '''
+    Return the preview session of an image, creating it if needed.
+
+    Sessions are identified by a hash of the pixels of the image and the
+    scale, so a fresh duplicate of the same image (as made by the GUI for
+    every preview) finds the session of the previous click. Only the
+    MAX_SESSIONS most recently used sessions are kept.
+    '''
+    key = mina.cache.image_key(imp, "preview", scale)
+    session = _SESSIONS.pop(key, None)
+    if session is None:
+        session = PreviewSession(key)
+    _SESSIONS[key] = session
+    while len(_SESSIONS) > MAX_SESSIONS:
+        _SESSIONS.popitem(last=False)
+    return(session)
+
+
+def clear_preview_sessions():
+    '''
+    Drop the intermediates of every preview session.
+    '''
+    _SESSIONS.clear()
+
+
+def downsample(imp, scale):
+    '''
+    Return a copy of the first plane of an image scaled by a factor (<= 1)
+    with bilinear interpolation, with its calibration adjusted.
+    '''
+    imp_plane = Duplicator().run(imp, 1, 1)
+    if scale >= 1.0:
+        return(imp_plane)
+    ip = imp_plane.getProcessor()
+    ip.setInterpolationMethod(ip.BILINEAR)
+    width = max(1, int(round(ip.getWidth() * scale)))
+    height = max(1, int(round(ip.getHeight() * scale)))
+    small = ImagePlus(imp.getTitle(), ip.resize(width, height, True))
+    calibration = imp.getCalibration().copy()
+    calibration.pixelWidth *= float(ip.getWidth()) / width
+    calibration.pixelHeight *= float(ip.getHeight()) / height
+    small.setCalibration(calibration)
+    return(small)
@@ -0,0 +1,2 @@
+from ._memory import heap_used, PeakMemory, estimate_heap, MemoryBudget
+from ._profiler import PROFILE_SUFFIX, Profiler, aggregate_profiles
@@ -0,0 +1,128 @@
+import math
+
+from java.lang.management import ManagementFactory, MemoryType
+from java.util.concurrent import Semaphore
+
+
+def _heap_pools():
+    return([pool for pool in ManagementFactory.getMemoryPoolMXBeans()
+            if pool.getType() == MemoryType.HEAP])
+
+
+def heap_used():
+    '''
+    Return the number of bytes currently used on the JVM heap.
+    '''
+    return(ManagementFactory.getMemoryMXBean().getHeapMemoryUsage().getUsed())
+
+
+class PeakMemory():
+    def __init__(self):
+        '''
+        Context manager measuring the peak heap usage of a block of code.
+
+        The peak usage of every heap pool is reset on entry and summed on
+        exit. The pools may peak at different times, so the result is an
+        upper bound of the true peak. The JVM is shared, so work done by
+        other threads during the block is included.
+
+        Example
+        -------
+        >>> from mina.profiling import PeakMemory
+        >>> with PeakMemory() as memory:
+        ...     binary = threshold_image(imp, ops, "otsu")
+        >>> memory.peak_mb
+        '''
+        self.start = 0
+        self.peak = 0
+        self.peak_mb = 0.0
+
+    def __enter__(self):
+        for pool in _heap_pools():
+            pool.resetPeakUsage()
+        self.start = heap_used()
+        return(self)
+
+    def __exit__(self, *exc):
+        self.peak = sum([pool.getPeakUsage().getUsed() for pool in _heap_pools()])
+        self.peak_mb = self.peak / float(1024 ** 2)
+        return(False)
+
+
+# Bytes per voxel used by the analysis besides the image itself: the binary
+# image and the working images of AnalyzeSkeleton (tagged, visited and
+# labelled skeleton images)
+ANALYSIS_BYTES_PER_VOXEL = 7
+
+
+def estimate_heap(width, height, slices, bytes_per_pixel, in_place=True):
+    '''
+    Estimate the peak heap usage of analyzing an image with
+    mina.analysis.analyze_image.
+
+    The estimate covers the image, the binary image, the skeleton (a copy
+    of the binary unless it is skeletonized in place) and the working images
+    of AnalyzeSkeleton. The skeleton graph and the tables depend on the
+    content of the image rather than its size and are not included.
+
+    Return
+    ------
+    bytes : int
+        The estimated peak usage in bytes.
+    '''
+    extra = ANALYSIS_BYTES_PER_VOXEL + (0 if in_place else 1)
+    return(width * height * slices * (bytes_per_pixel + extra))
+
+
+class MemoryBudget():
+    def __init__(self, limit):
+        '''
+        A heap budget shared by concurrent analyses.
+
+        Every analysis acquires its estimated peak usage (see estimate_heap)
+        before it starts and releases it when done, so the images analyzed at
+        the same time never add up to more than the limit. Workers wait until
+        enough of the budget is free, in the order they asked for it. An image
+        that needs more than the whole budget is refused.
+
+        Parameters
+        ----------
+        limit : int
+            The budget in bytes.
+
+        Example
+        -------
+        >>> from mina.profiling import MemoryBudget, estimate_heap
+        >>> budget = MemoryBudget(4 * 1024 ** 3)
+        >>> reserved = budget.acquire(estimate_heap(2048, 2048, 64, 2))
+        >>> try:
+        ...     analyze(imp)
+        ... finally:
+        ...     budget.release(reserved)
+        '''
+        self.limit = limit
+        self._semaphore = Semaphore(self._megabytes(limit), True)
+
+    def _megabytes(self, size):
+        return(int(math.ceil(size / float(1024 ** 2))))
+
+    def acquire(self, size):
+        '''
+        Wait until size bytes of the budget are free and reserve them.
+
+        Return
+        ------
+        size : int
+            The reserved size, to pass to release.
+        '''
+        if size > self.limit:
+            raise MemoryError("an estimated %.0f MB of heap is needed, more than the limit of %.0f MB"
+                              % (size / float(1024 ** 2), self.limit / float(1024 ** 2)))
+        self._semaphore.acquire(self._megabytes(size))
+        return(size)
+
+    def release(self, size):
+        '''
+        Return a reservation made with acquire to the budget.
+        '''
+        self._semaphore.release(self._megabytes(size))
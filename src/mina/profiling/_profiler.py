@@ -0,0 +1,181 @@
+import glob
+import json
+import os
+import time
+
+from collections import OrderedDict
+
+from ._memory import PeakMemory
+
+
+PROFILE_SUFFIX = ".profile.json"
+
+
+class _Stage():
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.memory = None
+
+    def __enter__(self):
+        if self.profiler.memory:
+            self.memory = PeakMemory().__enter__()
+        self.start = time.time()
+        return(self)
+
+    def __exit__(self, *exc):
+        seconds = time.time() - self.start
+        peak = None
+        if self.memory is not None:
+            self.memory.__exit__(*exc)
+            peak = self.memory.peak
+        self.profiler.record(self.name, seconds, peak)
+        return(False)
+
+
+class Profiler():
+    def __init__(self, memory=True):
+        '''
+        Records the time and peak heap usage of the stages of an analysis.
+
+        A stage that is entered several times (e.g. once per frame) adds up
+        its time and keeps its highest peak. The peak heap usage is measured
+        with PeakMemory, which covers the whole JVM, so it should be disabled
+        when several images are analyzed concurrently.
+
+        Parameters
+        ----------
+        memory : bool
+            Should the peak heap usage of every stage be measured?
+
+        Example
+        -------
+        >>> from mina.profiling import Profiler
+        >>> profiler = Profiler()
+        >>> with profiler.stage("thresholding"):
+        ...     binary = threshold_image(imp, ops, "otsu")
+        >>> profiler.parameters()
+        OrderedDict([('thresholding time (s)', 0.42), ('thresholding peak heap (MB)', 310.5)])
+        '''
+        self.memory = memory
+        self.stages = OrderedDict()
+
+    def stage(self, name):
+        '''
+        Return a context manager recording a stage.
+        '''
+        return(_Stage(self, name))
+
+    def record(self, name, seconds, peak=None):
+        '''
+        Add a measurement of a stage (peak in bytes, or None).
+        '''
+        if name not in self.stages:
+            self.stages[name] = {"time (s)": 0.0, "peak heap (MB)": None, "calls": 0}
+        stage = self.stages[name]
+        stage["time (s)"] += seconds
+        stage["calls"] += 1
+        if peak is not None:
+            stage["peak heap (MB)"] = max(stage["peak heap (MB)"] or 0.0, peak / float(1024 ** 2))
+
+    def total(self):
+        '''
+        Return the time spent in all stages.
+        '''
+        return(sum([stage["time (s)"] for stage in self.stages.values()]))
+
+    def parameters(self, stages=None):
+        '''
+        Return the measurements as columns for a results row, as
+        "<stage> time (s)" and "<stage> peak heap (MB)".
+
+        Parameters
+        ----------
+        stages : list of str
+            The stages to report, in order. Stages that were not run are
+            reported as 0, so that every row of a table has the same
+            columns. Defaults to the recorded stages.
+        '''
+        if stages is None:
+            stages = list(self.stages.keys())
+        parameters = OrderedDict()
+        for name in stages:
+            stage = self.stages.get(name, {"time (s)": 0.0, "peak heap (MB)": None})
+            parameters["%s time (s)" % name] = stage["time (s)"]
+            if stage["peak heap (MB)"] is not None or (self.memory and name not in self.stages):
+                parameters["%s peak heap (MB)" % name] = stage["peak heap (MB)"] or 0.0
+        return(parameters)
+
+    def summary(self):
+        '''
+        Return a one line description of the stages, slowest first.
+        '''
+        stages = sorted(self.stages.items(), key=lambda item: -item[1]["time (s)"])
+        parts = []
+        for name, stage in stages:
+            if stage["peak heap (MB)"] is None:
+                parts.append("%s %.2f s" % (name, stage["time (s)"]))
+            else:
+                parts.append("%s %.2f s (%.0f MB)" % (name, stage["time (s)"], stage["peak heap (MB)"]))
+        return(", ".join(parts))
+
+    def dumps(self):
+        return(json.dumps(self.stages))
+
+    @classmethod
+    def loads(cls, text):
+        profiler = cls()
+        profiler.stages = json.loads(text, object_pairs_hook=OrderedDict)
+        return(profiler)
+
+    def save(self, path):
+        '''
+        Write the measurements to a JSON file.
+        '''
+        with open(str(path), "w") as handle:
+            handle.write(self.dumps())
+
+
+def aggregate_profiles(profiles):
+    '''
+    Summarize the profiles of many images, e.g. all images of a batch.
+
+    Parameters
+    ----------
+    profiles : iterable of Profiler or str, or str or java.io.File
+        The profiles or the paths of their files (e.g. those saved by one
+        batch), or a directory holding the "*.profile.json" files to
+        summarize all of them.
+
+    Return
+    ------
+    summary : collections.OrderedDict
+        For every stage, slowest first in total: the number of images, the
+        total, mean and maximum time and the maximum peak heap usage (nan
+        if not measured).
+    '''
+    if isinstance(profiles, type("")) or not hasattr(profiles, "__iter__"):
+        profiles = sorted(glob.glob(os.path.join(str(profiles), "*" + PROFILE_SUFFIX)))
+    loaded = []
+    for profiler in profiles:
+        if isinstance(profiler, type("")):
+            with open(profiler) as handle:
+                profiler = Profiler.loads(handle.read())
+        loaded.append(profiler)
+    profiles = loaded
+
+    stages = OrderedDict()
+    for profiler in profiles:
+        for name, stage in profiler.stages.items():
+            stages.setdefault(name, []).append(stage)
+
+    summary = OrderedDict()
+    for name in sorted(stages, key=lambda name: -sum([s["time (s)"] for s in stages[name]])):
+        times = [stage["time (s)"] for stage in stages[name]]
+        peaks = [stage["peak heap (MB)"] for stage in stages[name] if stage["peak heap (MB)"] is not None]
+        summary[name] = OrderedDict([("images", len(times)),
+                                     ("total time (s)", sum(times)),
+                                     ("mean time (s)", sum(times) / len(times)),
+                                     ("max time (s)", max(times)),
+                                     ("max peak heap (MB)", max(peaks) if peaks else float("nan"))])
+    return(summary)
@@ -0,0 +1 @@
+from ._ridges import RidgeResult, ridge_parameters, detect_ridges
@@ -0,0 +1,203 @@
+import math
+
+from ij import ImagePlus, ImageStack
+from ij.process import ByteProcessor
+
+from de.biomedical_imaging.ij.steger import LineDetector, OverlapOption
+from sc.fiji.analyzeSkeleton import Point
+
+import mina.concurrency
+import mina.graph
+
+
+def ridge_parameters(line_width, high_contrast, low_contrast):
+    '''
+    Convert the line width and contrasts of the Ridge Detection dialog into
+    the sigma and hessian thresholds of its line detector, as the plugin
+    does for bright lines on a dark background.
+
+    Return
+    ------
+    sigma : float
+        The scale of the gaussian derivatives.
+    upper, lower : float
+        The upper and lower thresholds of the second derivative.
+    '''
+    half_width = line_width / 2.0
+    sigma = line_width / (2 * math.sqrt(3)) + 0.5
+
+    def threshold(contrast):
+        value = abs(-2 * contrast * half_width / (math.sqrt(2 * math.pi) * sigma ** 3) *
+                    math.exp(-half_width ** 2 / (2 * sigma ** 2)))
+        return(math.floor(value * 100 + 0.5) / 100)
+
+    return(sigma, threshold(high_contrast), threshold(low_contrast))
+
+
+class RidgeResult():
+    def __init__(self, width, height, slices=1):
+        '''
+        The lines found by detect_ridges.
+
+        Every line is a branch running between its two end points, the line
+        detector splitting lines where they meet. The lines can be measured
+        directly as a graph (see graph), rasterized (see skeleton), and the
+        end points and junctions of the graph are available with the
+        getListOfEndPoints and getListOfJunctionVoxels methods of a
+        SkeletonResult, so the result can be drawn with mina_view.
+
+        Attributes
+        ----------
+        lines : list of tuple
+            The slice index (0-based) and the x and y coordinates of every
+            line, in pixels.
+        '''
+        self.width = width
+        self.height = height
+        self.slices = slices
+        self.lines = []
+        self._graph = None
+
+    def graph(self, calibration=None, tolerance=1.5):
+        '''
+        Return the lines as a mina.graph.CompactGraph.
+
+        Line ends of the same slice closer than tolerance pixels are joined
+        into one vertex, networks are the connected groups of lines and the
+        branch length is the calibrated length of each line.
+
+        Parameters
+        ----------
+        calibration : ij.measure.Calibration
+            The calibration of the image. If None, lengths are in pixels.
+        tolerance : float
+            The largest distance between joined line ends, in pixels.
+        '''
+        if calibration is None:
+            sx = sy = sz = 1.0
+        else:
+            sx, sy, sz = calibration.pixelWidth, calibration.pixelHeight, calibration.pixelDepth
+
+        lines = [line for line in self.lines if len(line[1]) > 1]
+
+        # Join the line ends with a grid of tolerance sized cells
+        cells = {}
+        positions = []
+        ends = []
+        for z, xs, ys in lines:
+            for x, y in [(xs[0], ys[0]), (xs[-1], ys[-1])]:
+                cx, cy = int(x // tolerance), int(y // tolerance)
+                vertex = None
+                for nx in (cx - 1, cx, cx + 1):
+                    for ny in (cy - 1, cy, cy + 1):
+                        for candidate in cells.get((nx, ny, z), []):
+                            px, py, pz = positions[candidate]
+                            if (px - x) ** 2 + (py - y) ** 2 <= tolerance ** 2:
+                                vertex = candidate
+                if vertex is None:
+                    vertex = len(positions)
+                    positions.append((x, y, z))
+                    cells.setdefault((cx, cy, z), []).append(vertex)
+                ends.append(vertex)
+
+        # Networks are the connected groups of vertices
+        parents = list(range(len(positions)))
+
+        def root(v):
+            while parents[v] != v:
+                parents[v] = parents[parents[v]]
+                v = parents[v]
+            return(v)
+
+        for i in range(len(lines)):
+            parents[root(ends[2 * i])] = root(ends[2 * i + 1])
+        networks = {}
+        graph = mina.graph.CompactGraph()
+        for v, (x, y, z) in enumerate(positions):
+            network = networks.setdefault(root(v), len(networks))
+            graph.addVertex(x * sx, y * sy, z * sz, network)
+        for i, (z, xs, ys) in enumerate(lines):
+            length = sum([math.sqrt(((xs[j+1] - xs[j]) * sx) ** 2 + ((ys[j+1] - ys[j]) * sy) ** 2)
+                          for j in range(len(xs) - 1)])
+            graph.addEdge(ends[2 * i], ends[2 * i + 1], length)
+        self._graph = (graph, positions)
+        return(graph)
+
+    def _points(self, selected):
+        if self._graph is None:
+            self.graph()
+        graph, positions = self._graph
+        degrees = graph.degrees()
+        return([Point(int(round(x)), int(round(y)), int(z))
+                for v, (x, y, z) in enumerate(positions) if selected(degrees[v])])
+
+    def getListOfEndPoints(self):
+        return(self._points(lambda degree: degree == 1))
+
+    def getListOfJunctionVoxels(self):
+        return(self._points(lambda degree: degree > 2))
+
+    def skeleton(self):
+        '''
+        Return the lines drawn one pixel wide in an 8-bit image (255 on 0).
+        '''
+        planes = [ByteProcessor(self.width, self.height) for z in range(self.slices)]
+        for ip in planes:
+            ip.setValue(255)
+        for z, xs, ys in self.lines:
+            ip = planes[z]
+            for j in range(len(xs) - 1):
+                ip.drawLine(int(round(xs[j])), int(round(ys[j])), int(round(xs[j+1])), int(round(ys[j+1])))
+        stack = ImageStack(self.width, self.height)
+        for ip in planes:
+            stack.addSlice(ip)
+        return(ImagePlus("skeleton", stack))
+
+
+def detect_ridges(imp, line_width, high_contrast, low_contrast, min_length, workers=None):
+    '''
+    Detect the ridges (lines) of every slice of the current channel and frame
+    with the line detector of the Ridge Detection plugin.
+
+    The detector is called directly on an 8-bit copy of each plane, so no
+    window is opened or looked up by title and the image is not modified.
+    The slices are processed concurrently, each by its own detector.
+
+    Parameters
+    ----------
+    imp : ij.ImagePlus
+        The image.
+    line_width : float
+        The width of the lines in pixels.
+    high_contrast, low_contrast : float
+        The contrast of the lines on the 8-bit scale (see ridge_parameters).
+    min_length : float
+        The minimum length of a line in pixels.
+    workers : int
+        The number of worker threads. Defaults to the number of processors.
+
+    Return
+    ------
+    result : RidgeResult
+        The lines of every slice.
+
+    Example
+    -------
+    >>> from mina.ridges import detect_ridges
+    >>> ridges = detect_ridges(imp, 1, 75, 5, 3)
+    >>> branches, networks = ridges.graph(imp.getCalibration()).tables()
+    '''
+    sigma, upper, lower = ridge_parameters(float(line_width), float(high_contrast), float(low_contrast))
+    stack = imp.getStack()
+    channel, frame = imp.getChannel(), imp.getFrame()
+
+    def detect(z):
+        ip = stack.getProcessor(imp.getStackIndex(channel, z+1, frame)).convertToByteProcessor(True)
+        lines = LineDetector().detectLines(ip, sigma, upper, lower, float(min_length), 0.0,
+                                           False, False, False, False, OverlapOption.NONE)
+        return([(z, list(line.getXCoordinates()), list(line.getYCoordinates())) for line in lines])
+
+    result = RidgeResult(imp.getWidth(), imp.getHeight(), imp.getNSlices())
+    for lines in mina.concurrency.map_parallel(detect, range(imp.getNSlices()), workers):
+        result.lines.extend(lines)
+    return(result)
@@ -1 +1,4 @@
 from ._statistics import mean, median, stdev
+from ._selection import select, select_ranks, quantiles
+from ._accumulator import Accumulator
+from ._sketch import QuantileSketch, merge_sketches
@@ -0,0 +1,198 @@
+import array
+
+from ._selection import quantiles
+
+
+class Accumulator():
+    def __init__(self, data=None, keep_values=True):
+        '''
+        Construct a single-pass accumulator of summary statistics.
+
+        The count, mean and population variance are updated with Welford's
+        algorithm, so values can be added one at a time (e.g. while walking a
+        skeleton graph) without storing them. Accumulators can be merged, which
+        allows summaries to be computed per image or per worker and combined.
+
+        Parameters
+        ----------
+        data : iterable of numeric type
+            Optional initial values.
+        keep_values : bool
+            Should the values be kept (as a compact array of doubles) so that
+            exact medians and quantiles can be computed? If False, only the
+            moments, minimum and maximum are available.
+
+        Example
+        -------
+        >>> from mina.statistics import Accumulator
+        >>> acc = Accumulator([1, 3, 5])
+        >>> acc.add(7.5)
+        >>> acc.mean()
+        4.125
+        >>> acc.merge(Accumulator([2]))
+        >>> acc.count
+        5
+        '''
+        self.count = 0
+        self.total = 0.0
+        self.minimum = float("nan")
+        self.maximum = float("nan")
+        self._mean = 0.0
+        self._m2 = 0.0
+        self.keep_values = keep_values
+        self.values = array.array("d") if keep_values else None
+        if data is not None:
+            self.extend(data)
+
+    def add(self, x):
+        '''
+        Add a single value.
+        '''
+        x = float(x)
+        self.count += 1
+        self.total += x
+        delta = x - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (x - self._mean)
+        if self.count == 1:
+            self.minimum = x
+            self.maximum = x
+        elif x < self.minimum:
+            self.minimum = x
+        elif x > self.maximum:
+            self.maximum = x
+        if self.keep_values:
+            self.values.append(x)
+
+    def extend(self, data):
+        '''
+        Add every value of an iterable.
+        '''
+        for x in data:
+            self.add(x)
+
+    def merge(self, other):
+        '''
+        Combine the values summarized by another Accumulator into this one.
+
+        The moments are combined with the parallel algorithm of Chan et al.
+        Values are only kept if both accumulators keep them.
+
+        Parameters
+        ----------
+        other : Accumulator
+            The accumulator to merge. It is left unchanged.
+        '''
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.minimum = other.minimum
+            self.maximum = other.maximum
+        else:
+            self.minimum = min(self.minimum, other.minimum)
+            self.maximum = max(self.maximum, other.maximum)
+
+        count = self.count + other.count
+        delta = other._mean - self._mean
+        self._m2 += other._m2 + delta ** 2.0 * self.count * other.count / count
+        self._mean += delta * other.count / count
+        self.count = count
+        self.total += other.total
+
+        if self.keep_values and other.keep_values:
+            self.values.extend(other.values)
+        else:
+            self.keep_values = False
+            self.values = None
+
+    def mean(self):
+        '''
+        Return the mean or "nan" if no values were added.
+        '''
+        if self.count == 0:
+            return(float("nan"))
+        return(self._mean)
+
+    def variance(self):
+        '''
+        Return the population variance or "nan" if no values were added.
+        '''
+        if self.count == 0:
+            return(float("nan"))
+        return(self._m2 / self.count)
+
+    def stdev(self):
+        '''
+        Return the population standard deviation or "nan" if no values were
+        added.
+        '''
+        return(self.variance() ** 0.5)
+
+    def median(self):
+        '''
+        Return the exact median of the kept values or "nan" if empty.
+        '''
+        return(self.quantile(0.5))
+
+    def quantile(self, q):
+        '''
+        Return the q-th quantile (0 <= q <= 1) of the kept values.
+
+        Quantiles are linearly interpolated between the closest ranks, so
+        q=0.5 matches mina.statistics.median.
+
+        Parameters
+        ----------
+        q : float
+            The quantile to compute.
+
+        Return
+        ------
+        value : float
+            The quantile or "nan" if no values were added.
+        '''
+        return(self.quantiles([q])[0])
+
+    def quantiles(self, qs):
+        '''
+        Return several quantiles of the kept values with a single selection.
+
+        Parameters
+        ----------
+        qs : iterable of float
+            The quantiles to compute, each between 0 and 1.
+
+        Return
+        ------
+        values : list of float
+            The quantile for each q or "nan" if no values were added.
+        '''
+        if not self.keep_values:
+            raise ValueError("values were not kept, quantiles are unavailable")
+        return(quantiles(self.values, qs))
+
+    def toDict(self):
+        '''
+        Return the state of the accumulator as a JSON serializable dict.
+        '''
+        state = {"count": self.count, "total": self.total, "mean": self._mean,
+                 "m2": self._m2, "minimum": self.minimum, "maximum": self.maximum}
+        if self.keep_values:
+            state["values"] = list(self.values)
+        return(state)
+
+    @classmethod
+    def fromDict(cls, state):
+        '''
+        Construct an Accumulator from a dict returned by toDict.
+        '''
+        acc = cls(keep_values="values" in state)
+        acc.count = state["count"]
+        acc.total = state["total"]
+        acc._mean = state["mean"]
+        acc._m2 = state["m2"]
+        acc.minimum = state["minimum"]
+        acc.maximum = state["maximum"]
+        if acc.keep_values:
+            acc.values.extend(state["values"])
+        return(acc)
@@ -0,0 +1,156 @@
+import math
+
+
+def select(data, k):
+    '''
+    Return the k-th smallest value (0-based) of numeric data.
+
+    Uses introselect: quickselect with a median-of-three pivot that falls back
+    to sorting if the partitioning degrades. The data is not modified and no
+    full sort is performed.
+
+    Parameters
+    ----------
+    data : sequence of numeric type
+        The data to select from.
+    k : int
+        The rank of the value to return.
+
+    Return
+    ------
+    value : numeric type
+        The k-th smallest value.
+
+    Example
+    -------
+    >>> from mina.statistics import select
+    >>> select([5, 1, 4, 2, 3], 1)
+    2
+    '''
+    n = len(data)
+    if k < 0 or k >= n:
+        raise IndexError("rank %s is out of range for %s values" % (k, n))
+    return(select_ranks(data, [k])[k])
+
+
+def select_ranks(data, ranks):
+    '''
+    Return the values at several ranks of numeric data in a single pass.
+
+    One or two ranks (a median or a single interpolated quantile) are found
+    by selection: each partitioning step copies the values below and above
+    its pivot into two new, smaller lists and only recurses into the sides
+    that still contain a requested rank. For more ranks the partitioning
+    costs more than it saves, so the data is sorted once and every rank is
+    read from the sorted copy. The data itself is not modified.
+
+    Parameters
+    ----------
+    data : sequence of numeric type
+        The data to select from.
+    ranks : iterable of int
+        The 0-based ranks to select.
+
+    Return
+    ------
+    values : dict
+        The value at each requested rank.
+    '''
+    ranks = sorted(set(ranks))
+    values = {}
+    if len(data) == 0 or len(ranks) == 0:
+        return(values)
+    if len(ranks) > 2:
+        data = sorted(data)
+        for rank in ranks:
+            values[rank] = data[rank]
+        return(values)
+    depth = 2 * int(math.log(len(data), 2) + 1)
+    _select(list(data), ranks, values, 0, depth)
+    return(values)
+
+
+def _select(data, ranks, values, offset, depth):
+    while True:
+        n = len(data)
+        if n <= 32 or depth <= 0:
+            data = sorted(data)
+            for rank in ranks:
+                values[rank + offset] = data[rank]
+            return
+        depth -= 1
+
+        pivot = sorted([data[0], data[n // 2], data[-1]])[1]
+        lower = [x for x in data if x < pivot]
+        upper = [x for x in data if x > pivot]
+        n_lower = len(lower)
+        n_equal = n - n_lower - len(upper)
+
+        left = []
+        right = []
+        for rank in ranks:
+            if rank < n_lower:
+                left.append(rank)
+            elif rank < n_lower + n_equal:
+                values[rank + offset] = pivot
+            else:
+                right.append(rank - n_lower - n_equal)
+
+        if left and right:
+            _select(lower, left, values, offset, depth)
+        if right:
+            data, ranks, offset = upper, right, offset + n_lower + n_equal
+        elif left:
+            data, ranks = lower, left
+        else:
+            return
+
+
+def quantiles(data, qs=(0.25, 0.5, 0.75)):
+    '''
+    Compute several quantiles of numeric data in one call.
+
+    All the ranks needed by the requested quantiles are found in one call to
+    select_ranks, so a single quantile is selected without sorting and
+    several quantiles cost one sort. Quantiles are linearly interpolated
+    between the closest ranks, so q=0.5 matches median.
+
+    Parameters
+    ----------
+    data : sequence of numeric type
+        The data to compute the quantiles from.
+    qs : iterable of float
+        The quantiles to compute, each between 0 and 1.
+
+    Return
+    ------
+    values : list of float
+        The quantile for each q or "nan" if the set is empty.
+
+    Example
+    -------
+    >>> from mina.statistics import quantiles
+    >>> quantiles([1, 2, 3, 4, 5], [0.05, 0.25, 0.5, 0.75, 0.95])
+    [1.2, 2.0, 3.0, 4.0, 4.8]
+    '''
+    qs = list(qs)
+    for q in qs:
+        if q < 0 or q > 1:
+            raise ValueError("quantiles must be between 0 and 1, not %s" % q)
+    n = len(data)
+    if n == 0:
+        return([float("nan")] * len(qs))
+
+    positions = [q * (n - 1) for q in qs]
+    ranks = set()
+    for position in positions:
+        ranks.add(int(math.floor(position)))
+        ranks.add(int(math.ceil(position)))
+    values = select_ranks(data, ranks)
+
+    result = []
+    for position in positions:
+        lower = values[int(math.floor(position))]
+        upper = values[int(math.ceil(position))]
+        result.append(lower + (upper - lower) * (position - math.floor(position)))
+    return(result)
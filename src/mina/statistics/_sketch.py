@@ -0,0 +1,252 @@
+import json
+import math
+import random
+
+
+class QuantileSketch():
+    def __init__(self, k=200, data=None, seed=None):
+        '''
+        Construct a mergeable KLL quantile sketch.
+
+        The sketch keeps a hierarchy of compactors holding at most about 3k
+        values in total, however many values are added. Each compaction sorts
+        a full level and promotes every other value (with double the weight)
+        to the next level. The rank error is roughly 1.7/k with high
+        probability, i.e. about 1% for the default k=200. Count, minimum and
+        maximum are exact.
+
+        Parameters
+        ----------
+        k : int
+            The size of the top compactor. Larger values are more accurate and
+            use proportionally more memory.
+        data : iterable of numeric type
+            Optional initial values.
+        seed : int
+            Seed of the random number generator used by compactions, for
+            reproducible sketches.
+
+        Example
+        -------
+        >>> from mina.statistics import QuantileSketch
+        >>> sketch = QuantileSketch(data=range(1000))
+        >>> other = QuantileSketch(data=range(1000, 2000))
+        >>> sketch.merge(other)
+        >>> sketch.count
+        2000
+        >>> round(sketch.quantile(0.5), -2)
+        1000.0
+        '''
+        self.k = int(k)
+        self.count = 0
+        self.minimum = float("nan")
+        self.maximum = float("nan")
+        self.compactors = [[]]
+        self._random = random.Random(seed)
+        self._size = 0
+        self._max_size = self._capacity(0)
+        if data is not None:
+            self.extend(data)
+
+    def _capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return(int(math.ceil(self.k * (2.0 / 3.0) ** depth)) + 1)
+
+    def _grow(self):
+        self.compactors.append([])
+        self._max_size = sum([self._capacity(level) for level in range(len(self.compactors))])
+
+    def _compress(self):
+        for level in range(len(self.compactors)):
+            if len(self.compactors[level]) >= self._capacity(level):
+                if level + 1 >= len(self.compactors):
+                    self._grow()
+                items = sorted(self.compactors[level])
+                # keep the odd one out at this level
+                if len(items) % 2 == 1:
+                    self.compactors[level] = [items.pop()]
+                else:
+                    self.compactors[level] = []
+                offset = self._random.randint(0, 1)
+                self.compactors[level + 1].extend(items[offset::2])
+                self._size = sum([len(c) for c in self.compactors])
+                if self._size < self._max_size:
+                    break
+
+    def add(self, x):
+        '''
+        Add a single value.
+        '''
+        x = float(x)
+        if self.count == 0:
+            self.minimum = x
+            self.maximum = x
+        elif x < self.minimum:
+            self.minimum = x
+        elif x > self.maximum:
+            self.maximum = x
+        self.count += 1
+        self.compactors[0].append(x)
+        self._size += 1
+        if self._size >= self._max_size:
+            self._compress()
+
+    def extend(self, data):
+        '''
+        Add every value of an iterable.
+        '''
+        for x in data:
+            self.add(x)
+
+    def merge(self, other):
+        '''
+        Combine another sketch (e.g. from another image) into this one.
+
+        Parameters
+        ----------
+        other : QuantileSketch
+            The sketch to merge. It is left unchanged.
+        '''
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.minimum = other.minimum
+            self.maximum = other.maximum
+        else:
+            self.minimum = min(self.minimum, other.minimum)
+            self.maximum = max(self.maximum, other.maximum)
+        self.count += other.count
+
+        while len(self.compactors) < len(other.compactors):
+            self._grow()
+        for level, items in enumerate(other.compactors):
+            self.compactors[level].extend(items)
+        self._size = sum([len(c) for c in self.compactors])
+        while self._size >= self._max_size:
+            self._compress()
+
+    def _weighted(self):
+        items = []
+        for level, compactor in enumerate(self.compactors):
+            weight = 2 ** level
+            items.extend([(x, weight) for x in compactor])
+        items.sort()
+        return(items)
+
+    def quantile(self, q):
+        '''
+        Return the approximate q-th quantile (0 <= q <= 1).
+
+        Return
+        ------
+        value : float
+            The quantile or "nan" if the sketch is empty.
+        '''
+        return(self.quantiles([q])[0])
+
+    def quantiles(self, qs):
+        '''
+        Return several approximate quantiles at once.
+
+        Parameters
+        ----------
+        qs : iterable of float
+            The quantiles to compute, each between 0 and 1.
+
+        Return
+        ------
+        values : list of float
+            The quantile for each q or "nan" if the sketch is empty.
+        '''
+        qs = list(qs)
+        for q in qs:
+            if q < 0 or q > 1:
+                raise ValueError("quantiles must be between 0 and 1, not %s" % q)
+        if self.count == 0:
+            return([float("nan")] * len(qs))
+
+        items = self._weighted()
+        total = float(sum([weight for x, weight in items]))
+        result = []
+        for q in qs:
+            if q == 0:
+                result.append(self.minimum)
+                continue
+            if q == 1:
+                result.append(self.maximum)
+                continue
+            cumulative = 0
+            value = items[-1][0]
+            for x, weight in items:
+                cumulative += weight
+                if cumulative >= q * total:
+                    value = x
+                    break
+            result.append(value)
+        return(result)
+
+    def median(self):
+        '''
+        Return the approximate median or "nan" if the sketch is empty.
+        '''
+        return(self.quantile(0.5))
+
+    def toDict(self):
+        '''
+        Return the state of the sketch as a JSON serializable dict.
+        '''
+        return({"k": self.k, "count": self.count, "minimum": self.minimum,
+                "maximum": self.maximum, "compactors": self.compactors})
+
+    @classmethod
+    def fromDict(cls, state):
+        '''
+        Construct a QuantileSketch from a dict returned by toDict.
+        '''
+        sketch = cls(state["k"])
+        sketch.count = state["count"]
+        sketch.minimum = state["minimum"]
+        sketch.maximum = state["maximum"]
+        sketch.compactors = [[]]
+        for level in range(1, len(state["compactors"])):
+            sketch._grow()
+        sketch.compactors = [list(c) for c in state["compactors"]]
+        sketch._size = sum([len(c) for c in sketch.compactors])
+        return(sketch)
+
+    def dumps(self):
+        '''
+        Serialize the sketch to a JSON string.
+        '''
+        return(json.dumps(self.toDict()))
+
+    @classmethod
+    def loads(cls, text):
+        '''
+        Construct a QuantileSketch from a JSON string returned by dumps.
+        '''
+        return(cls.fromDict(json.loads(text)))
+
+
+def merge_sketches(sketches):
+    '''
+    Merge several quantile sketches into a new one.
+
+    Parameters
+    ----------
+    sketches : iterable of QuantileSketch
+        The sketches to merge. They are left unchanged.
+
+    Return
+    ------
+    merged : QuantileSketch
+        A sketch summarizing all of the values.
+    '''
+    merged = None
+    for sketch in sketches:
+        if merged is None:
+            merged = QuantileSketch(sketch.k)
+        merged.merge(sketch)
+    if merged is None:
+        merged = QuantileSketch()
+    return(merged)
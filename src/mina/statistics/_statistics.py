@@ -1,3 +1,4 @@
+from ._selection import select_ranks
 
 
 def mean(data):
@@ -57,21 +58,22 @@ def median(data):
 
     Notes
     -----
-    This implementation is adapted from the statistics module of the CPython
+    The interpolation is adapted from the statistics module of the CPython
     standard library implementation. It can be viewed on GitHub at https://githu
     b.com/python/cpython/blob/30afc91f5e70cf4748ffac77a419ba69ebca6f6a/Lib/stati
-    stics.py#L364. Rather than raise a specific error on an empty set, it simply
-    returns a "nan" float.
+    stics.py#L364. Rather than sort the data, the middle value(s) are found by
+    selection in linear time (see mina.statistics.select_ranks). Rather than
+    raise a specific error on an empty set, it simply returns a "nan" float.
     '''
-    data = sorted(data)
     n = len(data)
     if n == 0:
         return(float("nan"))
     if n % 2 == 1:
-        return data[n // 2]
+        return select_ranks(data, [n // 2])[n // 2]
     else:
         i = n // 2
-        return (data[i - 1] + data[i]) / 2.0
+        values = select_ranks(data, [i - 1, i])
+        return (values[i - 1] + values[i]) / 2.0
 
 
 def stdev(data):
@@ -0,0 +1,2 @@
+from ._networks import SyntheticNetworks, synthetic_networks
+from ._render import render_networks
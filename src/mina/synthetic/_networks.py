@@ -0,0 +1,227 @@
+import math
+import random
+
+import mina.graph
+
+
+class SyntheticNetworks():
+    def __init__(self, width, height, depth=1, thickness=3.0):
+        '''
+        Synthetic mitochondrial networks with a known skeleton graph.
+
+        The networks are made of straight tubules (segments) of the given
+        thickness. The ground truth is a mina.graph.CompactGraph in pixel
+        units holding one vertex per end point and junction and one edge per
+        branch, so its tables can be compared directly with those measured
+        on a rendering of the segments (see render_networks).
+
+        Use synthetic_networks to generate random networks.
+
+        Attributes
+        ----------
+        graph : mina.graph.CompactGraph
+            The ground truth graph. A donut is a single vertex with an edge to
+            itself.
+        segments : list of tuple
+            The tubules to draw as (x1, y1, z1, x2, y2, z2) in pixels.
+        '''
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.thickness = thickness
+        self.graph = mina.graph.CompactGraph()
+        self.segments = []
+
+    def truth(self):
+        '''
+        Return the ground truth counts and lengths.
+
+        Return
+        ------
+        truth : dict
+            The number of networks, branches, junctions (vertices of degree
+            > 2), end points (degree 1) and donuts and the summed branch
+            length in pixels.
+        '''
+        networks = self.graph.networkMetrics()
+        return({"networks": self.graph.n_networks,
+                "branches": self.graph.n_edges,
+                "junctions": sum(networks["junctions"]),
+                "end points": sum(networks["end points"]),
+                "donuts": sum(networks["donut"]),
+                "summed branch length": sum(self.graph.length)})
+
+
+def _direction(rng, is_3D):
+    '''
+    Return a random unit vector, kept within 30 degrees of the xy plane in 3D.
+    '''
+    azimuth = rng.uniform(0, 2 * math.pi)
+    elevation = rng.uniform(-math.pi / 6, math.pi / 6) if is_3D else 0.0
+    return((math.cos(azimuth) * math.cos(elevation), math.sin(azimuth) * math.cos(elevation),
+            math.sin(elevation)))
+
+
+def _rotate(direction, angle):
+    '''
+    Rotate a direction around the z axis.
+    '''
+    dx, dy, dz = direction
+    c, s = math.cos(angle), math.sin(angle)
+    return((dx * c - dy * s, dx * s + dy * c, dz))
+
+
+def _distance(point, segment):
+    '''
+    Return the distance between a point and a segment.
+    '''
+    a, b = segment[:3], segment[3:]
+    ab = [j - i for i, j in zip(a, b)]
+    norm = sum([v * v for v in ab])
+    t = 0.0
+    if norm > 0:
+        t = min(1.0, max(0.0, sum([(p - i) * v for p, i, v in zip(point, a, ab)]) / norm))
+    return(math.sqrt(sum([(p - i - t * v) ** 2 for p, i, v in zip(point, a, ab)])))
+
+
+def _clear(origin, end, segments, clearance):
+    '''
+    Is a new segment from origin further than clearance from the given
+    segments, apart from where it starts?
+    '''
+    length = math.sqrt(sum([(e - o) ** 2 for o, e in zip(origin, end)]))
+    steps = int(length)
+    for i in range(steps + 1):
+        t = i / float(max(steps, 1))
+        if t * length < clearance:
+            continue
+        point = [o + t * (e - o) for o, e in zip(origin, end)]
+        for segment in segments:
+            if _distance(point, segment) < clearance:
+                return(False)
+    return(True)
+
+
+def synthetic_networks(width, height, depth=1, networks=16, branches=9, branch_density=0.6,
+                       donuts=2, branch_length=(12.0, 30.0), thickness=3.0, seed=0):
+    '''
+    Generate random tree-like networks and donuts with a known skeleton.
+
+    The image is divided into a grid of cells holding one network or donut
+    each, so networks never touch. A tree starts at an end point and every
+    new vertex either splits into two branches (a junction) with probability
+    branch_density or ends. Sibling branches are 60 to 120 degrees apart
+    and at least three tubule thicknesses long, so the junctions stay
+    distinct once the tubules are drawn. Branches that would leave their
+    cell or come within two thicknesses of another branch of the tree are
+    turned or, failing that, not added.
+
+    Parameters
+    ----------
+    width, height, depth : int
+        The size of the image in pixels. A depth of 1 gives a 2D image.
+    networks : int
+        The number of tree networks.
+    branches : int
+        The maximum number of branches per tree.
+    branch_density : float
+        The probability (0-1) that a vertex splits.
+    donuts : int
+        The number of donuts (rings without branches).
+    branch_length : tuple of float
+        The range of the branch lengths in pixels.
+    thickness : float
+        The diameter of the tubules in pixels.
+    seed : int
+        The seed of the random generator, for reproducible networks.
+
+    Return
+    ------
+    networks : SyntheticNetworks
+        The segments to draw and the ground truth graph.
+
+    Example
+    -------
+    >>> from mina.synthetic import synthetic_networks
+    >>> networks = synthetic_networks(512, 512, networks=20, donuts=4)
+    >>> networks.truth()["donuts"]
+    4
+    '''
+    rng = random.Random(seed)
+    result = SyntheticNetworks(width, height, depth, thickness)
+    graph = result.graph
+    is_3D = depth > 1
+    margin = thickness + 1.0
+    min_length = max(branch_length[0], 3.0 * thickness)
+    max_length = max(branch_length[1], min_length)
+
+    cells = networks + donuts
+    columns = max(1, int(math.ceil(math.sqrt(cells * float(width) / height))))
+    rows = max(1, int(math.ceil(cells / float(columns))))
+    cell_width, cell_height = width / float(columns), height / float(rows)
+    order = list(range(columns * rows))
+    rng.shuffle(order)
+
+    def inside(point, bounds):
+        x0, y0, x1, y1 = bounds
+        return(x0 + margin <= point[0] <= x1 - margin and y0 + margin <= point[1] <= y1 - margin and
+               (not is_3D or margin <= point[2] <= depth - 1 - margin))
+
+    for n, cell in enumerate(order[:cells]):
+        x0, y0 = (cell % columns) * cell_width, (cell // columns) * cell_height
+        bounds = (x0, y0, x0 + cell_width, y0 + cell_height)
+        z = (depth - 1) / 2.0
+
+        if n >= networks:
+            # A donut in the middle of its cell
+            radius = min(cell_width, cell_height) / 2.0 - margin
+            radius = rng.uniform(max(2.0 * thickness, radius / 2.0), radius)
+            if radius < 2.0 * thickness:
+                continue
+            cx, cy = x0 + cell_width / 2.0, y0 + cell_height / 2.0
+            sides = max(12, int(2 * math.pi * radius / 2.0))
+            ring = [(cx + radius * math.cos(2 * math.pi * i / sides),
+                     cy + radius * math.sin(2 * math.pi * i / sides), z) for i in range(sides + 1)]
+            for a, b in zip(ring[:-1], ring[1:]):
+                result.segments.append(a + b)
+            vertex = graph.addVertex(ring[0][0], ring[0][1], z, graph.n_networks)
+            graph.addEdge(vertex, vertex, sum([math.sqrt((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2)
+                                               for a, b in zip(ring[:-1], ring[1:])]))
+            continue
+
+        # A tree grown from an end point in its cell
+        tree = []
+
+        def place(origin, direction):
+            for attempt in range(8):
+                length = rng.uniform(min_length, max_length)
+                end = tuple([o + d * length for o, d in zip(origin, direction)])
+                if inside(end, bounds) and _clear(origin, end, tree, 2.0 * thickness):
+                    tree.append(origin + end)
+                    return((end, length, direction))
+                direction = _rotate(direction, rng.uniform(-math.pi / 2, math.pi / 2))
+            return(None)
+
+        start = (rng.uniform(x0 + margin, x0 + cell_width - margin),
+                 rng.uniform(y0 + margin, y0 + cell_height - margin), z)
+        first = place(start, _direction(rng, is_3D))
+        if first is None or branches < 1:
+            continue
+        network = graph.n_networks
+        root = graph.addVertex(start[0], start[1], start[2], network)
+        queue = [(root, start, [first])]
+        n_branches = 1
+        while queue:
+            parent, origin, children = queue.pop(0)
+            for end, length, direction in children:
+                vertex = graph.addVertex(end[0], end[1], end[2], network)
+                graph.addEdge(parent, vertex, length, network)
+                result.segments.append(origin + end)
+                # Split into two branches, or end here if either does not fit
+                if n_branches + 2 <= branches and rng.random() < branch_density:
+                    spread = rng.uniform(math.pi / 6, math.pi / 3)
+                    split = [place(end, _rotate(direction, spread)), place(end, _rotate(direction, -spread))]
+                    if None not in split:
+                        queue.append((vertex, end, split))
+                        n_branches += 2
+    return(result)
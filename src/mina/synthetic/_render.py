@@ -0,0 +1,93 @@
+import math
+
+from ij import ImagePlus, ImageStack
+from ij.plugin import GaussianBlur3D
+from ij.plugin.filter import GaussianBlur
+from ij.process import ByteProcessor, ImageProcessor
+
+
+def _ball(radius, is_3D):
+    '''
+    Return the integer offsets within radius of the origin (a disc in 2D).
+    '''
+    r = int(math.ceil(radius))
+    depth = range(-r, r + 1) if is_3D else [0]
+    return([(dx, dy, dz) for dz in depth for dy in range(-r, r + 1) for dx in range(-r, r + 1)
+            if dx * dx + dy * dy + dz * dz <= radius * radius])
+
+
+def render_networks(networks, signal=1000.0, background=100.0, noise=30.0, blur=1.0, seed=0):
+    '''
+    Draw synthetic networks as a 16-bit fluorescence image.
+
+    The tubules are drawn as discs (2D) or balls (3D) of the network
+    thickness every half pixel along each segment, blurred with a gaussian
+    and corrupted by gaussian noise.
+
+    Parameters
+    ----------
+    networks : SyntheticNetworks
+        The networks to draw (see synthetic_networks).
+    signal : float
+        The intensity of the tubules above the background.
+    background : float
+        The background intensity.
+    noise : float
+        The standard deviation of the noise.
+    blur : float
+        The sigma of the gaussian blur in pixels (0 for none).
+    seed : int
+        The seed of the noise.
+
+    Return
+    ------
+    imp : ij.ImagePlus
+        The image, with a pixel size of 1 in every dimension.
+    footprint : int
+        The number of pixels (voxels) covered by the tubules before blurring,
+        the ground truth of the mitochondrial footprint.
+    '''
+    width, height, depth = networks.width, networks.height, networks.depth
+    is_3D = depth > 1
+    ball = _ball(networks.thickness / 2.0, is_3D)
+
+    masks = [ByteProcessor(width, height) for z in range(depth)]
+    planes = [mask.getPixels() for mask in masks]
+    for x1, y1, z1, x2, y2, z2 in networks.segments:
+        length = math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2 + (z2 - z1) ** 2)
+        steps = max(1, int(math.ceil(length * 2)))
+        for i in range(steps + 1):
+            t = i / float(steps)
+            cx = int(round(x1 + t * (x2 - x1)))
+            cy = int(round(y1 + t * (y2 - y1)))
+            cz = int(round(z1 + t * (z2 - z1)))
+            for dx, dy, dz in ball:
+                x, y, z = cx + dx, cy + dy, cz + dz
+                if 0 <= x < width and 0 <= y < height and 0 <= z < depth:
+                    planes[z][y * width + x] = -1
+
+    footprint = sum([mask.getHistogram()[255] for mask in masks])
+
+    stack = ImageStack(width, height)
+    for mask in masks:
+        ip = mask.convertToFloatProcessor()
+        ip.multiply(signal / 255.0)
+        ip.add(background)
+        stack.addSlice(ip)
+    imp = ImagePlus("synthetic networks", stack)
+    if blur > 0:
+        if is_3D:
+            GaussianBlur3D.blur(imp, blur, blur, blur)
+        else:
+            GaussianBlur().blurGaussian(imp.getProcessor(), blur, blur, 0.01)
+
+    ImageProcessor.setRandomSeed(seed)
+    result = ImageStack(width, height)
+    for z in range(depth):
+        ip = stack.getProcessor(z + 1)
+        if noise > 0:
+            ip.noise(noise)
+        result.addSlice(ip.convertToShortProcessor(False))
+    imp = ImagePlus("synthetic networks", result)
+    imp.setDimensions(1, depth, 1)
+    return(imp, footprint)
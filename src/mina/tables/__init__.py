@@ -1,2 +1,3 @@
 from ._simplesheet import SimpleSheet
+from ._sinks import CsvSink, ColumnarSink, SheetSink, MultiSink, openSink, readColumnar, readCsv, readTable
 from ._utilities import commentToDict, repeatDictValues
@@ -1,5 +1,4 @@
-import ij.measure.ResultsTable
-import ij.WindowManager
+import collections
 
 
 class SimpleSheet():
@@ -21,6 +20,11 @@ class SimpleSheet():
         # Record the window title
         self.title = title
 
+        # ImageJ is only imported once a table is created, so the rest of
+        # mina.tables can be used outside of Fiji
+        import ij.measure.ResultsTable
+        import ij.WindowManager
+
         # Get the ResultsTable if the window exists or create a new one
         if title in list(ij.WindowManager.getNonImageTitles()):
             self.rt = ij.WindowManager.getWindow(title).getTextPanel(
@@ -62,7 +66,8 @@ class SimpleSheet():
         and if the order does matter, OrderedDict from the collections module
         can be used. The values are to be lists of the same length. If you need
         to expand a dict with single values by repeating them to the length of
-        the other dicts to be written, see the repeatRow method.
+        the other dicts to be written, see the repeatRow method. The rows are
+        appended with writeColumns.
 
         Parameters
         ----------
@@ -75,28 +80,75 @@ class SimpleSheet():
         >>> my_table = SimpleSheet("My Analysis")
         >>> my_table.writeRow({"Column A": 1, "Column B": 2}, {"Column C": 3})
         '''
-        # Count the rows in each column
-        rows = []
+        self.writeColumns(*args)
+
+    def writeColumns(self, *args):
+        '''
+        Append columns of data to the table with one call per column.
+
+        Numeric columns are handed over as whole double arrays rather than one
+        cell at a time, which is much faster for large tables. An empty table
+        is filled with setValues, otherwise the rows are added and the new
+        values of each column are copied into the array backing it, so
+        appending takes time proportional to the rows added and never reads
+        the existing rows back. Columns holding any non-numeric value are
+        written cell by cell. Columns are created in argument order and those
+        new to the table are filled with 0 for the existing rows, as
+        ResultsTable does for writeRow.
+
+        Parameters
+        ----------
+        args : dicts or collections.OrderedDicts
+            The columns of data to be added. The values are to be lists of the
+            same length.
+
+        Example
+        -------
+        >>> from mina.utilities import SimpleSheet
+        >>> my_table = SimpleSheet("My Analysis")
+        >>> my_table.writeColumns({"Column A": [1, 2], "Column B": [3, 4]})
+        '''
+        import jarray
+        from java.lang import System
+
+        rows = _countRows(args)
+        offset = self.rt.size()
+        if rows == 0:
+            return
+
+        columns = []
         for arg in args:
             for key, value in arg.items():
-                if isinstance(value, list):
-                    rows.append(len(value))
-                else:
-                    raise TypeError("A list was expected, but a %s was provided"
-                                    % type(value))
+                is_numeric = all(isinstance(x, (int, float)) or type(x).__name__ == "long" for x in value)
+                columns.append((key, value, is_numeric))
 
-        # Ensure the rows in each column are equal in length
-        if len(set(rows)) != 1:
-            raise Exception("columns do not contain the same number of rows!")
+        if offset == 0:
+            # setValues grows an empty table, so every numeric column is one call
+            for key, value, is_numeric in columns:
+                if is_numeric:
+                    self.rt.setValues(key, jarray.array(value, "d"))
+                else:
+                    self.rt.getFreeColumn(key)
         else:
-            rows = rows[0]
+            for row in range(rows):
+                self.rt.incrementCounter()
+            arrays = _columnArrays(self.rt)
+            for key, value, is_numeric in columns:
+                index = self.rt.getColumnIndex(key)
+                if index == self.rt.COLUMN_NOT_FOUND:
+                    index = self.rt.getFreeColumn(key)
+                if not is_numeric:
+                    continue
+                if arrays is not None and arrays[index] is not None:
+                    System.arraycopy(jarray.array(value, "d"), 0, arrays[index], offset, rows)
+                else:
+                    for row in range(rows):
+                        self.rt.setValue(index, offset + row, float(value[row]))
 
-        # Add everything to the table one row at a time
-        for row in range(rows):
-            self.rt.incrementCounter()
-            for arg in args:
-                for key, value in arg.items():
-                    self.rt.addValue(key, value[row])
+        for key, value, is_numeric in columns:
+            if not is_numeric:
+                for row in range(rows):
+                    self.rt.setValue(key, offset + row, value[row])
 
     def getRow(self, index):
         '''
@@ -167,8 +219,92 @@ class SimpleSheet():
                 data.append(value)
         return(data)
 
+    def getColumns(self, *columns):
+        '''
+        Retrieve several columns at once, reading numeric data in bulk.
+
+        Each column is fetched as a single double array. Only cells that are
+        not numbers (e.g. text) are read individually as strings.
+
+        Parameters
+        ----------
+        columns : str
+            The column names of the data to fetch. If none are given, all of
+            the columns are returned.
+
+        Return
+        ------
+        data : collections.OrderedDict
+            A list of values for each column.
+
+        Example
+        -------
+        >>> from mina.utilities import SimpleSheet
+        >>> my_table = SimpleSheet("My Analysis")
+        >>> my_table.writeColumns({"Column A": [1, 2], "Column B": ["a", "b"]})
+        >>> my_table.getColumns("Column A", "Column B")
+        OrderedDict([(u'Column A', [1.0, 2.0]), (u'Column B', [u'a', u'b'])])
+        '''
+        if len(columns) == 0:
+            columns = list(self.rt.getHeadings())
+
+        data = collections.OrderedDict()
+        for column in columns:
+            index = self.rt.getColumnIndex(column)
+            if index == self.rt.COLUMN_NOT_FOUND:
+                raise KeyError("column %s does not exist" % column)
+            values = list(self.rt.getColumnAsDoubles(index))
+            for row, value in enumerate(values):
+                if value != value:
+                    value = self.rt.getStringValue(index, row)
+                    try:
+                        values[row] = float(value)
+                    except:
+                        values[row] = value
+            data[column] = values
+        return(data)
+
     def updateDisplay(self):
         '''
         Updates the display with the added items.
         '''
         self.rt.show(self.title)
+
+
+def _columnArrays(rt):
+    '''
+    Return the arrays backing the numeric columns of a ResultsTable, or None
+    if they cannot be accessed.
+
+    ResultsTable can only set a whole column (from the first row) or a
+    single cell, so appending a block of rows in one call needs its arrays.
+    '''
+    import java.lang
+
+    cls = rt.getClass()
+    while cls is not None and cls.getName() != "ij.measure.ResultsTable":
+        cls = cls.getSuperclass()
+    try:
+        field = cls.getDeclaredField("columns")
+        field.setAccessible(True)
+        return(field.get(rt))
+    except (Exception, java.lang.Exception):
+        return(None)
+
+
+def _countRows(args):
+    '''
+    Return the number of rows in dicts of columns, ensuring they are equal.
+    '''
+    rows = []
+    for arg in args:
+        for key, value in arg.items():
+            if isinstance(value, list):
+                rows.append(len(value))
+            else:
+                raise TypeError("A list was expected, but a %s was provided"
+                                % type(value))
+
+    if len(set(rows)) > 1:
+        raise Exception("columns do not contain the same number of rows!")
+    return(rows[0] if rows else 0)
@@ -0,0 +1,484 @@
+import array
+import collections
+import csv
+import json
+import os
+import sys
+import time
+
+
+_COLUMNAR_MAGIC = b"MINACOL1\n"
+
+
+def _columns(args):
+    '''
+    Merge dict-like rows into a single OrderedDict preserving key order.
+    '''
+    row = collections.OrderedDict()
+    for arg in args:
+        for key, value in arg.items():
+            row[key] = value
+    return(row)
+
+
+def _rowsFromColumns(args):
+    '''
+    Split dicts of equally long lists into a list of row OrderedDicts.
+    '''
+    columns = _columns(args)
+    lengths = set()
+    for key, value in columns.items():
+        if not isinstance(value, list):
+            raise TypeError("A list was expected, but a %s was provided"
+                            % type(value))
+        lengths.add(len(value))
+    if len(lengths) > 1:
+        raise Exception("columns do not contain the same number of rows!")
+
+    rows = []
+    for index in range(lengths.pop() if lengths else 0):
+        rows.append(collections.OrderedDict(
+            [(key, value[index]) for key, value in columns.items()]))
+    return(rows)
+
+
+def _isNumber(value):
+    return(isinstance(value, (int, float)) and not isinstance(value, bool)
+           or type(value).__name__ == "long")
+
+
+class _BufferedSink():
+    '''
+    Shared buffering logic for the on-disk sinks.
+
+    Rows are kept in memory until flush_every rows are pending or
+    flush_interval seconds have passed since the last flush.
+    '''
+    def __init__(self, flush_every=100, flush_interval=10.0):
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.columns = None
+        self.rows_written = 0
+        self._pending = []
+        self._last_flush = time.time()
+
+    def writeRow(self, *args):
+        '''
+        Append a row built from one or more dict-like structures.
+
+        The columns of the sink are fixed by the first row written (or by the
+        header of an existing file). Missing values are left empty and unknown
+        columns raise a ValueError since an append-only file cannot grow new
+        columns.
+        '''
+        row = _columns(args)
+        if self.columns is None:
+            self.columns = list(row.keys())
+            self._start()
+        unknown = [key for key in row if key not in self.columns]
+        if unknown:
+            raise ValueError("columns %s are not part of the sink (%s)"
+                             % (unknown, ", ".join(self.columns)))
+        self._pending.append(row)
+        if (len(self._pending) >= self.flush_every or
+                time.time() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def writeRows(self, *args):
+        '''
+        Append rows from dict-like structures holding equally long lists.
+        '''
+        for row in _rowsFromColumns(args):
+            self.writeRow(row)
+
+    def flush(self):
+        '''
+        Write all pending rows to disk.
+        '''
+        if self._pending:
+            self._write(self._pending)
+            self.rows_written += len(self._pending)
+            self._pending = []
+        self._last_flush = time.time()
+
+    def close(self):
+        '''
+        Flush the pending rows and close the file.
+        '''
+        self.flush()
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CsvSink(_BufferedSink):
+    def __init__(self, path, delimiter=None, flush_every=100, flush_interval=10.0):
+        '''
+        Construct a sink streaming rows to a delimited text file.
+
+        If the file exists already, rows are appended below its header.
+
+        Parameters
+        ----------
+        path : str
+            The file to write. Files ending in ".tsv" or ".txt" are tab
+            delimited unless a delimiter is given.
+        delimiter : str
+            The column delimiter.
+        flush_every : int
+            The number of buffered rows that triggers a write.
+        flush_interval : float
+            The number of seconds after which buffered rows are written.
+
+        Example
+        -------
+        >>> from mina.tables import CsvSink
+        >>> with CsvSink("morphology.csv") as sink:
+        ...     sink.writeRow({"Column A": 1, "Column B": 2})
+        '''
+        _BufferedSink.__init__(self, flush_every, flush_interval)
+        self.path = str(path)
+        if delimiter is None:
+            if os.path.splitext(self.path)[1].lower() in (".tsv", ".txt"):
+                delimiter = "\t"
+            else:
+                delimiter = ","
+        self.delimiter = delimiter
+
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with _openText(self.path, "r") as handle:
+                self.columns = next(csv.reader(handle, delimiter=self.delimiter))
+
+    def _start(self):
+        with _openText(self.path, "w") as handle:
+            csv.writer(handle, delimiter=self.delimiter).writerow(
+                [_encode(column) for column in self.columns])
+
+    def _write(self, rows):
+        with _openText(self.path, "a") as handle:
+            writer = csv.writer(handle, delimiter=self.delimiter)
+            for row in rows:
+                writer.writerow([_encode(row.get(column, ""))
+                                 for column in self.columns])
+
+
+class ColumnarSink(_BufferedSink):
+    def __init__(self, path, flush_every=1000, flush_interval=10.0):
+        '''
+        Construct a sink streaming rows to a compact columnar binary file.
+
+        Each flush appends a block holding one JSON header line followed by
+        every column: numeric columns as little-endian doubles and other
+        columns as a JSON encoded list. Use readColumnar to load the file.
+
+        Parameters
+        ----------
+        path : str
+            The file to write. Rows are appended if it exists already.
+        flush_every : int
+            The number of buffered rows that triggers a write.
+        flush_interval : float
+            The number of seconds after which buffered rows are written.
+        '''
+        _BufferedSink.__init__(self, flush_every, flush_interval)
+        self.path = str(path)
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            blocks = _readColumnarBlocks(self.path)
+            if blocks:
+                self.columns = list(blocks[0].keys())
+
+    def _start(self):
+        with open(self.path, "wb") as handle:
+            handle.write(_COLUMNAR_MAGIC)
+
+    def _write(self, rows):
+        types = []
+        data = []
+        for column in self.columns:
+            values = [row.get(column, float("nan")) for row in rows]
+            if all(_isNumber(value) for value in values):
+                types.append("d")
+                values = array.array("d", values)
+                if sys.byteorder != "little":
+                    values.byteswap()
+                data.append(_arrayBytes(values))
+            else:
+                types.append("s")
+                values = [value if isinstance(value, (type(u""), str)) else
+                          _encode(value) for value in values]
+                data.append(json.dumps(values).encode("utf-8") + b"\n")
+
+        header = {"rows": len(rows), "columns": self.columns, "types": types}
+        with open(self.path, "ab") as handle:
+            handle.write(json.dumps(header).encode("utf-8") + b"\n")
+            for block in data:
+                handle.write(block)
+
+
+class SheetSink():
+    def __init__(self, title, update_every=100, update_interval=2.0):
+        '''
+        Construct a throttled view writing rows to a SimpleSheet window.
+
+        The window is only redrawn every update_every rows or update_interval
+        seconds instead of after every row.
+
+        Parameters
+        ----------
+        title : str
+            The window title of the ResultsTable.
+        update_every : int
+            The number of rows after which the display is updated.
+        update_interval : float
+            The number of seconds after which the display is updated.
+        '''
+        from ._simplesheet import SimpleSheet
+        self.sheet = SimpleSheet(title)
+        self.update_every = update_every
+        self.update_interval = update_interval
+        self._pending = 0
+        self._last_update = time.time()
+
+    def writeRow(self, *args):
+        self.sheet.writeRow(*args)
+        self._pending += 1
+        if (self._pending >= self.update_every or
+                time.time() - self._last_update >= self.update_interval):
+            self.flush()
+
+    def writeRows(self, *args):
+        self.sheet.writeRows(*args)
+        self._pending += 1
+        self.flush()
+
+    def flush(self):
+        '''
+        Update the display with the rows written since the last update.
+        '''
+        if self._pending:
+            self.sheet.updateDisplay()
+            self._pending = 0
+        self._last_update = time.time()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class MultiSink():
+    def __init__(self, *sinks):
+        '''
+        Construct a sink forwarding every row to several sinks.
+
+        Example
+        -------
+        >>> from mina.tables import MultiSink, CsvSink, SheetSink
+        >>> sink = MultiSink(CsvSink("morphology.csv"), SheetSink("Mito Morphology"))
+        '''
+        self.sinks = list(sinks)
+
+    def writeRow(self, *args):
+        for sink in self.sinks:
+            sink.writeRow(*args)
+
+    def writeRows(self, *args):
+        for sink in self.sinks:
+            sink.writeRows(*args)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def openSink(path, **kwargs):
+    '''
+    Open a sink for a file, choosing the format from its extension.
+
+    Files ending in ".mcol" use the ColumnarSink, everything else the
+    CsvSink (tab delimited for ".tsv" and ".txt").
+
+    Parameters
+    ----------
+    path : str or java.io.File
+        The file to write.
+    kwargs :
+        Passed on to the sink constructor.
+
+    Return
+    ------
+    sink : CsvSink or ColumnarSink
+        The opened sink.
+    '''
+    path = str(path)
+    if os.path.splitext(path)[1].lower() == ".mcol":
+        return(ColumnarSink(path, **kwargs))
+    return(CsvSink(path, **kwargs))
+
+
+def readColumnar(path):
+    '''
+    Read a file written by ColumnarSink.
+
+    Parameters
+    ----------
+    path : str
+        The file to read.
+
+    Return
+    ------
+    data : collections.OrderedDict
+        A list of values for each column.
+    '''
+    data = collections.OrderedDict()
+    for block in _readColumnarBlocks(path):
+        for key, values in block.items():
+            data.setdefault(key, []).extend(values)
+    return(data)
+
+
+def readCsv(path, delimiter=None):
+    '''
+    Read a delimited text file, such as those written by CsvSink.
+
+    Parameters
+    ----------
+    path : str
+        The file to read.
+    delimiter : str
+        The column delimiter. Defaults to a tab for ".tsv" and ".txt" files
+        and a comma otherwise.
+
+    Return
+    ------
+    data : collections.OrderedDict
+        A list of values for each column. Cells holding a number are
+        converted to int or float and empty cells to None.
+    '''
+    path = str(path)
+    if delimiter is None:
+        if os.path.splitext(path)[1].lower() in (".tsv", ".txt"):
+            delimiter = "\t"
+        else:
+            delimiter = ","
+    data = collections.OrderedDict()
+    with _openText(path, "r") as handle:
+        reader = csv.reader(handle, delimiter=delimiter)
+        columns = next(reader, [])
+        values = [[] for column in columns]
+        for row in reader:
+            for index in range(len(columns)):
+                values[index].append(_decode(row[index]) if index < len(row) else None)
+    for column, column_values in zip(columns, values):
+        data[column] = column_values
+    return(data)
+
+
+def readTable(path):
+    '''
+    Read a results file written by openSink, choosing the reader from its
+    extension (readColumnar for ".mcol", readCsv otherwise).
+
+    Only the standard library is used, so results can be aggregated outside
+    of Fiji, e.g. with mina.statistics in CPython.
+
+    Example
+    -------
+    >>> from mina.tables import readTable
+    >>> from mina.statistics import median
+    >>> results = readTable("morphology.csv")
+    >>> median(results["mitochondrial footprint"])
+    '''
+    path = str(path)
+    if os.path.splitext(path)[1].lower() == ".mcol":
+        return(readColumnar(path))
+    return(readCsv(path))
+
+
+def _readColumnarBlocks(path):
+    blocks = []
+    with open(path, "rb") as handle:
+        if handle.read(len(_COLUMNAR_MAGIC)) != _COLUMNAR_MAGIC:
+            raise ValueError("%s is not a MiNA columnar file" % path)
+        while True:
+            line = handle.readline()
+            if not line:
+                break
+            header = json.loads(line.decode("utf-8"))
+            block = collections.OrderedDict()
+            for column, kind in zip(header["columns"], header["types"]):
+                if kind == "d":
+                    values = array.array("d")
+                    _arrayExtend(values, handle.read(8 * header["rows"]))
+                    if sys.byteorder != "little":
+                        values.byteswap()
+                    block[column] = list(values)
+                else:
+                    block[column] = json.loads(handle.readline().decode("utf-8"))
+            blocks.append(block)
+    return(blocks)
+
+
+def _arrayBytes(values):
+    if hasattr(values, "tobytes"):
+        return(values.tobytes())
+    return(values.tostring())
+
+
+def _arrayExtend(values, data):
+    if hasattr(values, "frombytes"):
+        values.frombytes(data)
+    else:
+        values.fromstring(data)
+
+
+def _encode(value):
+    '''
+    Convert a cell value to a str suitable for the csv module.
+    '''
+    if value is None:
+        return("")
+    if isinstance(value, float):
+        return(repr(value))
+    if sys.version_info[0] < 3 and isinstance(value, unicode):
+        return(value.encode("utf-8"))
+    return(str(value))
+
+
+def _decode(cell):
+    '''
+    Convert a cell read by the csv module back to a number where possible.
+    '''
+    if cell == "":
+        return(None)
+    try:
+        return(int(cell))
+    except ValueError:
+        pass
+    try:
+        return(float(cell))
+    except ValueError:
+        return(cell)
+
+
+def _openText(path, mode):
+    if sys.version_info[0] < 3:
+        return(open(path, mode + "b"))
+    return(open(path, mode, newline=""))
@@ -0,0 +1,2 @@
+from ._tiled import TILE_DEPTH, TILE_OVERLAP, read_tile, analyze_tiled
+from ._trace import trace_skeleton
@@ -0,0 +1,164 @@
+from collections import OrderedDict
+
+from ij import ImagePlus, ImageStack
+from java.awt import Rectangle
+
+import mina.analysis
+
+from ._trace import trace_skeleton
+
+
+# The default number of slices of a block core and margin read around it
+TILE_DEPTH = 64
+TILE_OVERLAP = 16
+
+
+def _tile_ranges(size, tile, overlap):
+    '''
+    Return (core start, core end, read start, read end) along one axis.
+    '''
+    ranges = []
+    for start in range(0, size, tile):
+        end = min(start + tile, size)
+        ranges.append((start, end, max(0, start - overlap), min(size, end + overlap)))
+    return(ranges)
+
+
+def read_tile(imp, x_range, y_range, z_range, frame=1):
+    '''
+    Read a block of the current channel into a new ImagePlus.
+
+    Only the planes of the block are read, so this works on virtual stacks
+    without loading the rest of the image.
+
+    Parameters
+    ----------
+    imp : ij.ImagePlus
+        The (possibly virtual) image.
+    x_range, y_range, z_range : tuple of int
+        The start (inclusive) and end (exclusive) of the block along each
+        axis, with z starting at 0.
+    frame : int
+        The frame to read from (starting at 1).
+
+    Return
+    ------
+    tile : ij.ImagePlus
+        The block with the calibration of the image.
+    '''
+    stack = imp.getStack()
+    width = x_range[1] - x_range[0]
+    height = y_range[1] - y_range[0]
+    planes = ImageStack(width, height)
+    for z in range(z_range[0], z_range[1]):
+        ip = stack.getProcessor(imp.getStackIndex(imp.getChannel(), z+1, frame))
+        ip.setRoi(Rectangle(x_range[0], y_range[0], width, height))
+        planes.addSlice(ip.crop())
+        ip.resetRoi()
+    tile = ImagePlus("tile", planes)
+    tile.setCalibration(imp.getCalibration())
+    return(tile)
+
+
+def analyze_tiled(imp, ops, threshold_method, tile_size=1024, tile_depth=TILE_DEPTH, overlap=TILE_OVERLAP,
+                  tables=False):
+    '''
+    Analyze an image too large for memory one overlapping block at a time.
+
+    The threshold level is computed once from a histogram streamed over the
+    whole channel (see mina.analysis.channel_histogram), so every block is
+    binarized with the same global level. Each block is read with a margin
+    of overlap pixels on every side, thresholded and skeletonized, and only
+    the skeleton voxels of its core (the block without the margin) are kept.
+    The skeleton voxels of all blocks are then traced as a single graph (see
+    trace_skeleton), so branches and networks crossing block borders are
+    stitched back together.
+
+    The skeleton of a block core matches the skeleton of the whole image as
+    long as the overlap is larger than the thickest mitochondria (see
+    benchmarks/pipeline_benchmark.py, which compares both). Only one block is
+    held as an image, but every skeleton voxel is kept as a tuple in a set
+    (roughly 100 bytes each in Jython) and traced in Jython, so for skeletons
+    of hundreds of millions of voxels the voxel set, not the block, bounds
+    the memory and the tracing dominates the time.
+
+    Parameters
+    ----------
+    imp : ij.ImagePlus
+        The image, typically opened as a virtual stack. The current channel
+        and first frame are analyzed.
+    ops : net.imagej.ops.OpService
+        The op service used to compute the threshold level.
+    threshold_method : str
+        The name of the threshold op (e.g. "otsu").
+    tile_size : int
+        The width and height of the block cores in pixels.
+    tile_depth : int
+        The number of slices of the block cores.
+    overlap : int
+        The margin read around every block core, in pixels and slices.
+    tables : bool
+        Should the branch and network tables be returned as well?
+
+    Return
+    ------
+    parameters : collections.OrderedDict
+        The threshold level, the number of blocks, the mitochondrial footprint
+        and the graph parameters (see mina.analysis.graph_summary). If tables
+        is True, a tuple of the parameters, branches and networks is returned
+        instead.
+    '''
+    calibration = imp.getCalibration()
+    scale = (calibration.pixelWidth, calibration.pixelHeight, calibration.pixelDepth)
+    slices = imp.getNSlices()
+
+    level = mina.analysis.threshold_level(mina.analysis.channel_histogram(imp), ops, threshold_method)
+
+    voxels = set()
+    foreground = 0
+    blocks = 0
+    z_overlap = overlap if slices > 1 else 0
+    for z_core in _tile_ranges(slices, tile_depth, z_overlap):
+        for y_core in _tile_ranges(imp.getHeight(), tile_size, overlap):
+            for x_core in _tile_ranges(imp.getWidth(), tile_size, overlap):
+                blocks += 1
+                x0, x1, x_read, x_end = x_core
+                y0, y1, y_read, y_end = y_core
+                z0, z1, z_read, z_end = z_core
+                tile = read_tile(imp, (x_read, x_end), (y_read, y_end), (z_read, z_end))
+                binary = mina.analysis.apply_threshold(tile, level)
+                tile.flush()
+
+                # Count the foreground of the core only
+                core = Rectangle(x0 - x_read, y0 - y_read, x1 - x0, y1 - y0)
+                binary_stack = binary.getStack()
+                for z in range(z0, z1):
+                    ip = binary_stack.getProcessor(z - z_read + 1)
+                    ip.setRoi(core)
+                    foreground += ip.getHistogram()[255]
+                    ip.resetRoi()
+
+                # The binary is not needed anymore, skeletonize it in place
+                skeleton = mina.analysis.skeletonize(binary, in_place=True)
+                skel_result = mina.analysis.analyze_skeleton(skeleton)
+                for points in [skel_result.getListOfEndPoints(), skel_result.getListOfJunctionVoxels(),
+                               skel_result.getListOfSlabVoxels()]:
+                    for p in points:
+                        x, y, z = p.x + x_read, p.y + y_read, p.z + z_read
+                        if x0 <= x < x1 and y0 <= y < y1 and z0 <= z < z1:
+                            voxels.add((x, y, z))
+                binary.flush()
+
+    footprint = foreground * scale[0] * scale[1]
+    if slices > 1:
+        footprint *= scale[2]
+
+    branches, networks = trace_skeleton(voxels, scale)
+
+    parameters = OrderedDict([("threshold level", level),
+                              ("blocks", blocks),
+                              ("mitochondrial footprint", footprint)])
+    parameters.update(mina.analysis.graph_summary(branches, networks))
+    if tables:
+        return((parameters, branches, networks))
+    return(parameters)
@@ -0,0 +1,142 @@
+from collections import deque
+
+import mina.graph
+
+
+# The 26 neighbours of a voxel (the 8 in-plane neighbours for 2D skeletons)
+_OFFSETS = [(dx, dy, dz) for dz in (-1, 0, 1) for dy in (-1, 0, 1) for dx in (-1, 0, 1)
+            if (dx, dy, dz) != (0, 0, 0)]
+
+
+def _scan_order(voxel):
+    return((voxel[2], voxel[1], voxel[0]))
+
+
+def trace_skeleton(voxels, scale=(1.0, 1.0, 1.0)):
+    '''
+    Build the branch and network tables of a skeleton given as a voxel set.
+
+    This is the counterpart of AnalyzeSkeleton for skeletons that are never
+    held as a single image (see analyze_tiled). Voxels with fewer than two
+    neighbours are end points, voxels with more than two are junctions and
+    touching junction voxels form a single vertex. Branches are traced from
+    every vertex along the slab voxels (exactly two neighbours) to the next
+    vertex. Closed loops without any junction get a vertex at their first
+    voxel.
+
+    Parameters
+    ----------
+    voxels : set of tuple of int
+        The (x, y, z) coordinates of the skeleton voxels.
+    scale : tuple of float
+        The size of a voxel along x, y and z, used for branch lengths and
+        vertex coordinates.
+
+    Return
+    ------
+    branches, networks : collections.OrderedDict
+        The tables in the same layout as mina.analysis.graph_tables. Branch
+        lengths follow the voxel path from vertex to vertex.
+    '''
+    voxels = set(voxels)
+
+    def neighbours(voxel):
+        x, y, z = voxel
+        return([n for n in [(x + dx, y + dy, z + dz) for dx, dy, dz in _OFFSETS] if n in voxels])
+
+    def distance(a, b):
+        return(sum([((p - q) * s) ** 2.0 for p, q, s in zip(a, b, scale)]) ** 0.5)
+
+    ordered = sorted(voxels, key=_scan_order)
+    degree = dict([(voxel, len(neighbours(voxel))) for voxel in ordered])
+
+    # Group touching junction voxels into vertices, end points are on their own
+    vertex_of = {}
+    vertices = []
+    for voxel in ordered:
+        if degree[voxel] == 2 or voxel in vertex_of:
+            continue
+        cluster = [voxel]
+        vertex_of[voxel] = len(vertices)
+        if degree[voxel] > 2:
+            queue = deque([voxel])
+            while queue:
+                for n in neighbours(queue.popleft()):
+                    if degree[n] > 2 and n not in vertex_of:
+                        vertex_of[n] = len(vertices)
+                        cluster.append(n)
+                        queue.append(n)
+        vertices.append(cluster)
+
+    edges = []
+    visited = set()
+    seen_pairs = set()
+
+    def trace_from(vertex):
+        for start in vertices[vertex]:
+            for n in neighbours(start):
+                if n in vertex_of:
+                    # two vertices touching without any slab in between
+                    pair = frozenset([start, n])
+                    if vertex_of[n] != vertex and pair not in seen_pairs:
+                        seen_pairs.add(pair)
+                        edges.append((vertex, vertex_of[n], distance(start, n)))
+                    continue
+                if n in visited:
+                    continue
+                visited.add(n)
+                previous, current = start, n
+                length = distance(start, n)
+                while True:
+                    following = [m for m in neighbours(current) if m != previous]
+                    if current == n:
+                        # a slab touching its vertex twice is a spur, not a loop
+                        following = [m for m in following if vertex_of.get(m) != vertex]
+                    if not following:
+                        break
+                    step = following[0]
+                    length += distance(current, step)
+                    if step in vertex_of:
+                        edges.append((vertex, vertex_of[step], length))
+                        break
+                    if step in visited:
+                        break
+                    visited.add(step)
+                    previous, current = current, step
+
+    for vertex in range(len(vertices)):
+        trace_from(vertex)
+
+    # Loops made only of slab voxels
+    for voxel in ordered:
+        if degree[voxel] == 2 and voxel not in visited and voxel not in vertex_of:
+            vertex_of[voxel] = len(vertices)
+            vertices.append([voxel])
+            trace_from(vertex_of[voxel])
+
+    # Networks are the connected components of the vertex graph
+    adjacency = [[] for vertex in vertices]
+    for v1, v2, length in edges:
+        adjacency[v1].append(v2)
+        adjacency[v2].append(v1)
+    network_of = [None] * len(vertices)
+    n_networks = 0
+    for vertex in sorted(range(len(vertices)), key=lambda v: _scan_order(vertices[v][0])):
+        if network_of[vertex] is not None:
+            continue
+        network_of[vertex] = n_networks
+        queue = deque([vertex])
+        while queue:
+            for n in adjacency[queue.popleft()]:
+                if network_of[n] is None:
+                    network_of[n] = n_networks
+                    queue.append(n)
+        n_networks += 1
+
+    graph = mina.graph.CompactGraph()
+    for vertex, cluster in enumerate(vertices):
+        graph.addVertex(*([p * s for p, s in zip(cluster[0], scale)] + [network_of[vertex]]))
+    for v1, v2, length in edges:
+        graph.addEdge(v1, v2, length)
+    graph.n_networks = n_networks
+    return(graph.tables())
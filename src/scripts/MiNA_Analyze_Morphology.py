@@ -38,45 +38,60 @@
 
 #@ Boolean preview_preprocessing
 
-import mina.statistics 
+import mina.analysis
+import mina.cache
+import mina.graph
 import mina.tables 
 import mina.filters 
+import mina.profiling
+import mina.ridges
 from mina import mina_view
 
+import os
+import sys
+import time
 import warnings
 
 from collections import OrderedDict
 
+from java.awt import GraphicsEnvironment
+
 from ij import IJ
+from ij import Prefs
 from ij import WindowManager
-from ij.measure import Measurements
 from ij.plugin import Duplicator
 
-from net.imglib2.img.display.imagej import ImageJFunctions
-
-from sc.fiji.analyzeSkeleton import AnalyzeSkeleton_;
-
 # Helper functions..............................................................
 def ridge_detect(imp, rd_max, rd_min, rd_width, rd_length):
-    title = imp.getTitle()
-    IJ.run(imp, "8-bit", "");
-    IJ.run(imp, "Ridge Detection", "line_width=%s high_contrast=%s low_contrast=%s make_binary method_for_overlap_resolution=NONE minimum_line_length=%s maximum=0" % (rd_width, rd_max, rd_min, rd_length))
-    IJ.run(imp, "Remove Overlay", "")
-    skel = WindowManager.getImage(title + " Detected segments")
-    IJ.run(skel, "Skeletonize (2D/3D)", "")
-    skel.hide()
-    return(skel)
-    
+    # The line detector is called directly, so the image is not modified and no window is opened
+    return(mina.ridges.detect_ridges(imp, rd_width, rd_max, rd_min, rd_length))
 
-def preprocessing_filters(imp):
-    filter_dict = {order_median : (lambda:mina.filters.median(imp, median_radius), use_median), 
-                   order_unsharp: (lambda:mina.filters.unsharp(imp, unsharp_radius, unsharp_weight), use_unsharp), 
-                   order_clahe:   (lambda:mina.filters.clahe(imp, clahe_block, clahe_bins, clahe_slope, clahe_mask), use_clahe)}
 
-    for i in range(3):
-        pre_filter, use_filter = filter_dict[i]
+def preprocessing_pipeline():
+    stages = [(order_median, use_median, "median", {"radius": median_radius}),
+              (order_unsharp, use_unsharp, "unsharp", {"radius": unsharp_radius, "weight": unsharp_weight}),
+              (order_clahe, use_clahe, "clahe", {"block": clahe_block, "bins": clahe_bins,
+                                                 "slope": clahe_slope, "mask": clahe_mask})]
+
+    pipeline = mina.filters.Pipeline()
+    for order, use_filter, name, parameters in sorted(stages, key=lambda stage: int(stage[0])):
         if use_filter:
-            pre_filter()
+            pipeline.add(name, **parameters)
+    return pipeline
+
+
+def preprocessing_filters(imp):
+    try:
+        return PIPELINE.run(imp)
+    except ValueError as e:
+        # A CLAHE mask that is not open or does not match the image
+        IJ.error("CLAHE", str(e))
+        sys.exit(0)
+
+
+def preprocess_frame(imp):
+    # Frames are already analyzed concurrently, so each one is filtered in its worker thread
+    return PIPELINE.run(imp, workers=1)
 
 
 def user_preprocessing(imp, preprocessor_path):
@@ -91,30 +106,181 @@ def user_preprocessing(imp, preprocessor_path):
 
 
 def threshold_image(imp):
-    # Create and ImgPlus copy of the ImagePlus for thresholding with ops...
     status.showStatus("Determining threshold level...")
-    slices = imp.getNSlices()
-    frames = imp.getNFrames()
-    if imp.getRoi() != None:
-        ROI_pos = (imp.getRoi().getBounds().x, imp.getRoi().getBounds().y)
-    else:
-        ROI_pos = (0, 0)
+    return mina.analysis.threshold_image(imp, ops, threshold_method)
+
+
+# The preprocessing pipeline is defined once from the GUI settings
+PIPELINE = preprocessing_pipeline()
+
+
+def cache_key(imp, preprocessor_path):
+    # Everything that changes the binary or the skeleton is part of the key
+    preprocessor = None
+    if preprocessor_path != None and preprocessor_path.exists():
+        preprocessor = [preprocessor_path.getCanonicalPath(), preprocessor_path.lastModified()]
+    ridge = None
+    if use_ridge_detection and imp.getNSlices() == 1:
+        ridge = [rd_max, rd_min, rd_width, rd_length, str(imp.getRoi())]
+    return mina.cache.image_key(imp, "MiNA_Analyze_Morphology", preprocessor, PIPELINE.dumps(),
+                                threshold_method, ridge)
 
+
+def topology_metrics():
+    # Topology metrics are enabled with a preference since the GUI has no field for them, e.g.
+    # call("ij.Prefs.set", "mina.topology.metrics", "cycle rank, network size, degree, diameter");
+    setting = Prefs.get("mina.topology.metrics", "")
+    return [metric.strip() for metric in setting.split(",") if metric.strip() in mina.graph.TOPOLOGY_METRICS]
+
+
+def analyze_single(imp, imp_original, output_parameters, user_comment, profiler, cache=None, key=None, entry=None):
+    imp_title = output_parameters["image title"]
     imp_calibration = imp.getCalibration()
-    imp_channel = Duplicator().run(imp, imp.getChannel(), imp.getChannel(), 1, slices, 1, frames)
-    img = ImageJFunctions.wrap(imp_channel)
 
-    # Determine the threshold value if not manual...
-    binary_img = ops.run("threshold.%s"%threshold_method, img)
-    binary = ImageJFunctions.wrap(binary_img, 'binary')
-    binary.setCalibration(imp_calibration)
-    binary.setDimensions(1, slices, 1)
-    return binary
+    if entry is not None:
+        # Reuse the intermediates of a previous run with the same settings
+        status.showStatus("Loading cached intermediates...")
+        binary = entry["binary"]
+        skeleton = entry["skeleton"]
+        output_parameters["mitochondrial footprint"] = entry["footprint"]
+        branches, networks = entry["branches"], entry["networks"]
+        skel_result = entry["skel_result"]
+        if imp.getNSlices() > 1:
+            # The 3D model needs the full skeleton graph
+            with profiler.stage("skeleton analysis"):
+                skel_result = mina.analysis.analyze_skeleton(skeleton)
+        with profiler.stage("graph metrics"):
+            graph = mina.graph.CompactGraph.fromTables(branches, networks)
+            output_parameters.update(mina.analysis.graph_summary(branches, networks))
+    else:
+        # Determine the threshold value if not manual...
+        with profiler.stage("thresholding"):
+            binary = threshold_image(imp)
+
+        # Get the total_area
+        with profiler.stage("footprint"):
+            output_parameters["mitochondrial footprint"] = mina.analysis.mitochondrial_footprint(binary)
+
+        if use_ridge_detection and (imp.getNSlices() == 1):
+            # Generate ridges using Ridge Detection if selected, measuring the detected lines directly.
+            # Like the binary, they only cover the ROI since imp is cropped to its bounds (see run).
+            with profiler.stage("skeletonization"):
+                skel_result = ridge_detect(imp, rd_max, rd_min, rd_width, rd_length)
+                skeleton = skel_result.skeleton()
+
+            status.showStatus("Computing graph based parameters...")
+            with profiler.stage("graph metrics"):
+                graph = skel_result.graph(imp_calibration)
+        else:
+            # Generate skeleton from masked binary otherwise
+            with profiler.stage("skeletonization"):
+                skeleton = mina.analysis.skeletonize(binary)
+
+            # Analyze the skeleton...
+            status.showStatus("Analyzing skeleton...")
+            with profiler.stage("skeleton analysis"):
+                skel_result = mina.analysis.analyze_skeleton(skeleton)
+
+            status.showStatus("Computing graph based parameters...")
+            with profiler.stage("graph metrics"):
+                graph = mina.graph.CompactGraph.fromSkeletonResult(skel_result, imp_calibration)
+
+        with profiler.stage("graph metrics"):
+            branches, networks = graph.tables()
+            output_parameters.update(mina.analysis.graph_summary(branches, networks))
+
+        if cache is not None:
+            with profiler.stage("cache"):
+                cache.put(key, output_parameters["mitochondrial footprint"], branches, networks,
+                          skel_result, binary, skeleton)
+
+    topology = topology_metrics()
+    if topology:
+        status.showStatus("Computing topology metrics...")
+        with profiler.stage("topology"):
+            output_parameters.update(mina.graph.topology_metrics(graph, topology))
+
+    with profiler.stage("table writes"):
+        # Create/append results to a ResultsTable...
+        morphology_tbl = mina.tables.SimpleSheet("Mito Morphology")
+        morphology_tbl.writeRow(output_parameters, mina.tables.commentToDict(user_comment))
+        morphology_tbl.updateDisplay()
+
+        # Append the per-branch and per-network rows in bulk...
+        for title, table in [("Mito Branches", branches), ("Mito Networks", networks)]:
+            n_rows = len(table["network"])
+            if n_rows > 0:
+                graph_tbl = mina.tables.SimpleSheet(title)
+                graph_tbl.writeColumns(mina.tables.repeatDictValues(OrderedDict([("image title", imp_title)]), n_rows), table)
+                graph_tbl.updateDisplay()
+
+    with profiler.stage("rendering"):
+        render(imp, imp_original, imp_title, imp_calibration, binary, skeleton, skel_result)
+
+
+def render(imp, imp_original, imp_title, imp_calibration, binary, skeleton, skel_result):
+	# Create overlays on the original ImagePlus and display them if 2D...
+    if imp.getNSlices() == 1:
+        mina_view.overlay_2D(imp_original, binary, skeleton, skel_result)
+
+    # Generate a 3D model if a stack
+    if imp.getNSlices() > 1:
+        # The surface resampling and an optional export directory are set with preferences, e.g.
+        # call("ij.Prefs.set", "mina.model.resampling", "4");
+        # call("ij.Prefs.set", "mina.model.decimation", "3");
+        # call("ij.Prefs.set", "mina.model.directory", "/path/to/models");
+        resampling = max(1, int(Prefs.get("mina.model.resampling", 2)))
+        decimation = max(1.0, float(Prefs.get("mina.model.decimation", 1)))
+        model_directory = Prefs.get("mina.model.directory", "")
+        if model_directory != "":
+            status.showStatus("Exporting 3D model...")
+            mina_view.export_model(os.path.join(model_directory, os.path.splitext(imp_title)[0] + ".ply"),
+                                   imp_calibration, binary, skel_result, resampling, decimation=decimation)
+        if not GraphicsEnvironment.isHeadless():
+            mina_view.create_3Dmodel(imp_calibration, binary, skel_result, resampling, decimation=decimation)
+
+
+def analyze_time_lapse(imp, output_parameters, user_comment, profiler):
+    # Ridge detection, overlays and 3D models are not available frame by frame
+    status.showStatus("Analyzing %s frames..." % imp.getNFrames())
+    settings = OrderedDict([(key, value) for key, value in output_parameters.items()
+                            if not isinstance(value, type)])
+
+    # Filters are applied frame by frame in the workers, see mina.analysis.analyze_frames
+    preprocess = preprocess_frame if len(PIPELINE) > 0 else None
+
+    # Rows are written in frame order as soon as every earlier frame is done
+    morphology_tbl = mina.tables.SimpleSheet("Mito Morphology")
+    comment = mina.tables.commentToDict(user_comment)
+    pending = {}
+    next_frame = 1
+    done = 0
+    with profiler.stage("frames"):
+        for row in mina.analysis.analyze_frames(imp, ops, threshold_method, preprocess):
+            done += 1
+            status.showProgress(done, imp.getNFrames())
+            pending[row["frame"]] = row
+            if next_frame in pending:
+                while next_frame in pending:
+                    morphology_tbl.writeRow(settings, pending.pop(next_frame), comment)
+                    next_frame += 1
+                morphology_tbl.updateDisplay()
 
 
 # The run function..............................................................
 def run(imp_original, preprocessor_path, postprocessor_path, threshold_method, user_comment):
-    imp = Duplicator().run(imp_original, imp_original.getChannel(), imp_original.getChannel(), 1, imp_original.getNSlices(), 1, imp_original.getNFrames())
+    # Preprocessing modifies the image, so it gets a copy. Otherwise the analysis only reads
+    # the image and works on a view of the channel instead. Both are cropped to the ROI bounds.
+    # Time-lapses are only copied for a user preprocessor, the filters are applied per frame.
+    has_preprocessor = preprocessor_path != None and preprocessor_path.exists()
+    time_lapse = imp_original.getNFrames() > 1
+    if has_preprocessor or (len(PIPELINE) > 0 and not time_lapse):
+        imp = Duplicator().run(imp_original, imp_original.getChannel(), imp_original.getChannel(), 1, imp_original.getNSlices(), 1, imp_original.getNFrames())
+        imp.setTitle(imp_original.getTitle())
+    elif time_lapse:
+        imp = imp_original
+    else:
+        imp = mina.analysis.channel_view(imp_original)
 
     output_parameters = OrderedDict([("image title", ""),
                                      ("preprocessor path", float),
@@ -128,6 +294,8 @@ def run(imp_original, preprocessor_path, postprocessor_path, threshold_method, u
                                      ("mitochondrial footprint", float),
                                      ("branch length mean", float),
                                      ("branch length median", float),
+                                     ("branch length 1st quartile", float),
+                                     ("branch length 3rd quartile", float),
                                      ("branch length stdev", float),
                                      ("summed branch lengths mean", float),
                                      ("summed branch lengths median", float),
@@ -137,10 +305,25 @@ def run(imp_original, preprocessor_path, postprocessor_path, threshold_method, u
                                      ("network branches stdev", float),
                                      ("donuts", int)])
 
+    # Time and peak heap usage of every stage, see mina.profiling.Profiler
+    profiler = mina.profiling.Profiler()
+
+    # Look up the intermediates of a previous run if a cache is configured
+    cache = key = entry = None
+    if imp.getNFrames() == 1:
+        cache = mina.cache.default_cache()
+    if cache is not None:
+        with profiler.stage("cache"):
+            key = cache_key(imp, preprocessor_path)
+            entry = cache.get(key)
+
     # Perform any preprocessing steps...
-    status.showStatus("Preprocessing image...")
-    user_preprocessing(imp, preprocessor_path)
-    preprocessing_filters(imp)
+    if entry is None:
+        status.showStatus("Preprocessing image...")
+        with profiler.stage("preprocessing"):
+            user_preprocessing(imp, preprocessor_path)
+            if not time_lapse:
+                preprocessing_filters(imp)
 
     # Store all of the analysis parameters in the table
     if preprocessor_path.exists():
@@ -165,119 +348,33 @@ def run(imp_original, preprocessor_path, postprocessor_path, threshold_method, u
     imp_title = imp.getTitle()
     output_parameters["image title"] = imp_title
     
-    # Determine the threshold value if not manual...
-    binary = threshold_image(imp)
-
-    imp_calibration = imp.getCalibration()
-    # Get the total_area
-    if binary.getNSlices() == 1:
-        area = binary.getStatistics(Measurements.AREA).area
-        area_fraction = binary.getStatistics(Measurements.AREA_FRACTION).areaFraction
-        output_parameters["mitochondrial footprint"] =  area * area_fraction / 100.0
+    if imp.getNFrames() > 1:
+        analyze_time_lapse(imp, output_parameters, user_comment, profiler)
     else:
-        mito_footprint = 0.0
-        for slice in range(1, binary.getNSlices()+1):
-            binary.setSliceWithoutUpdate(slice)
-            area = binary.getStatistics(Measurements.AREA).area
-            area_fraction = binary.getStatistics(Measurements.AREA_FRACTION).areaFraction
-            mito_footprint += area * area_fraction / 100.0
-        output_parameters["mitochondrial footprint"] = mito_footprint * imp_calibration.pixelDepth
-
-    # Generate skeleton from masked binary ...
-    if use_ridge_detection and (imp.getNSlices() == 1):
-        # Generate ridges using Ridge Detection if selected
-        skeleton = ridge_detect(imp, rd_max, rd_min, rd_width, rd_length)
-        # Crop and clear it if there is a ROI
-        if imp.getRoi() != None:
-            skeleton.setRoi(imp.getRoi())
-            skeleton = Duplicator().crop(skeleton)
-    else:
-        # Generate skeleton from masked binary otherwise
-        skeleton = Duplicator().run(binary)
-        IJ.run(skeleton, "Skeletonize (2D/3D)", "")
-
-    # Analyze the skeleton...
-    status.showStatus("Setting up skeleton analysis...")
-    skel = AnalyzeSkeleton_()
-    skel.setup("", skeleton)
-    status.showStatus("Analyzing skeleton...")
-    skel_result = skel.run()
-
-    status.showStatus("Computing graph based parameters...")
-    branch_lengths = []
-    summed_lengths = []
-    graphs = skel_result.getGraph()
-
-    num_donuts = 0
-    for graph in graphs:
-        summed_length = 0.0
-        edges = graph.getEdges()
-        vertices = {}
-        for edge in edges:
-            length = edge.getLength()
-            branch_lengths.append(length)
-            summed_length += length
-
-            # keep track of the number of times a vertex appears in edges in a given graph
-            for vertex in [edge.getV1(), edge.getV2()]:
-                if vertex in vertices:
-                    vertices[vertex] += 1
-                else:
-                    vertices[vertex] = 1
-
-        is_donut = True
-        # donut_arms = 0
-        for k in vertices:
-            # if a vertex appeared less than twice
-            if vertices[k] <= 1:
-                # donut_arms += 1
-                # if donut_arms > 1:
-                is_donut = False
-                break
-
-        if is_donut and len(edges) >= 1:
-            num_donuts += 1
-
-        summed_lengths.append(summed_length)
-
-    output_parameters["donuts"] = num_donuts
-
-    output_parameters["branch length mean"] = mina.statistics.mean(branch_lengths)
-    output_parameters["branch length median"] = mina.statistics.median(branch_lengths)
-    output_parameters["branch length stdev"] = mina.statistics.stdev(branch_lengths)
-
-    output_parameters["summed branch lengths mean"] = mina.statistics.mean(summed_lengths)
-    output_parameters["summed branch lengths median"] = mina.statistics.median(summed_lengths)
-    output_parameters["summed branch lengths stdev"] = mina.statistics.stdev(summed_lengths)
-
-    branches = list(skel_result.getBranches())
-    output_parameters["network branches mean"] = mina.statistics.mean(branches)
-    output_parameters["network branches median"] = mina.statistics.median(branches)
-    output_parameters["network branches stdev"] = mina.statistics.stdev(branches)
-
-    # Create/append results to a ResultsTable...
-    morphology_tbl = mina.tables.SimpleSheet("Mito Morphology")
-    morphology_tbl.writeRow(output_parameters, mina.tables.commentToDict(user_comment))
-    morphology_tbl.updateDisplay()
-
-	# Create overlays on the original ImagePlus and display them if 2D...
-    if imp.getNSlices() == 1:
-        mina_view.overlay_2D(imp_original, binary, skeleton, skel_result)
-
-    # Generate a 3D model if a stack
-    if imp.getNSlices() > 1:
-        mina_view.create_3Dmodel(imp_calibration, binary, skel_result)
+        analyze_single(imp, imp_original, output_parameters, user_comment, profiler, cache, key, entry)
 
     # Perform any postprocessing steps...
     status.showStatus("Running postprocessing...")
     if postprocessor_path != None:
         if postprocessor_path.exists():
-            postprocessor_thread = scripts.run(postprocessor_path, True)
-            postprocessor_thread.get()
+            with profiler.stage("postprocessing"):
+                postprocessor_thread = scripts.run(postprocessor_path, True)
+                postprocessor_thread.get()
 
     else:
         warnings.warn("Postprocessing file not found. Defaulting to None")
 
+    # Log the stage profile and save it only when asked to, e.g.
+    # call("ij.Prefs.set", "mina.profile.log", "true");
+    # call("ij.Prefs.set", "mina.profile.directory", "/path/to/profiles");
+    if Prefs.get("mina.profile.log", False):
+        IJ.log("MiNA: %s stage profile: %s" % (imp_title, profiler.summary()))
+    profile_directory = Prefs.get("mina.profile.directory", "")
+    if profile_directory != "":
+        # The time of the run keeps images with the same title apart
+        stamp = time.strftime("%Y%m%d-%H%M%S") + "-%03d" % (time.time() * 1000 % 1000)
+        profiler.save(os.path.join(profile_directory, "%s.%s%s" % (imp_title, stamp, mina.profiling.PROFILE_SUFFIX)))
+
     status.showStatus("Done analysis!")
 
 # Run the script...
@@ -285,7 +382,17 @@ if (__name__=="__main__") or (__name__=="__builtin__"):
     if preview_preprocessing:
         # preview preprocessing filters but do not run the analysis 
         param_table = [median_string, unsharp_string, clahe_string, ridge_string, thresh_string]
+        # Intermediates of the last preview are reused for the stages whose settings did not change.
+        # A downsampled preview is enabled with a preference, e.g.
+        # call("ij.Prefs.set", "mina.preview.scale", "0.5");
+        preprocessor = None
+        if preprocessor_path != None and preprocessor_path.exists():
+            preprocessor = [preprocessor_path.getCanonicalPath(), preprocessor_path.lastModified()]
+        settings = {"filtered": [preprocessor, PIPELINE.dumps()],
+                    "binary": threshold_method,
+                    "skeleton": [use_ridge_detection, rd_max, rd_min, rd_width, rd_length] if use_ridge_detection else False}
+        scale = min(1.0, max(0.05, float(Prefs.get("mina.preview.scale", 1.0))))
         mina_view.preview_images(imp, preprocessing_filters, threshold_image, use_ridge_detection, ridge_detect, rd_max, rd_min, rd_width, rd_length, param_table,
-            user_preprocessing, preprocessor_path)
+            user_preprocessing, preprocessor_path, settings, scale)
     else:
         run(imp, preprocessor_path, postprocessor_path, threshold_method, user_comment)
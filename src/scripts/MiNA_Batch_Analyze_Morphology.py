@@ -0,0 +1,120 @@
+#@ File(label="Image directory:", style="directory") image_directory
+#@ String(label="File pattern:", value="*.tif;*.tiff") file_pattern
+#@ Boolean(label="Include sub-directories:", value=False) recursive
+#@ String(label = "Thresholding Op:", value="otsu", choices={"huang", "ij1", "intermodes", "isoData", "li", "maxEntropy", "maxLikelihood", "mean", "minError", "minimum", "moments", "otsu", "percentile", "renyiEntropy", "rosin", "shanbhag", "triangle", "yen"}) threshold_method
+#@ File(label="Preprocessing pipeline file (optional):", required=False) pipeline_path
+#@ Integer(label="Worker threads (0 = all processors):", value=0, min=0) workers
+#@ String(label="User comment: ", value="") user_comment
+#@ File(label="Results file (.csv, .tsv or .mcol):", style="save", required=False) results_path
+#@ Boolean(label="Show results table:", value=True) show_table
+#@ Boolean(label="Export branch and network tables next to the results file:", value=False) export_tables
+#@ File(label="Branch length sketch directory (optional):", style="directory", required=False) sketch_directory
+#@ File(label="Intermediate cache directory (optional):", style="directory", required=False) cache_directory
+#@ Integer(label="Cache size limit (MB):", value=2048, min=1) cache_size
+#@ Integer(label="Block size for images larger than memory (0 = off):", value=0, min=0) tile_size
+#@ String(label="Topology metrics (any of: cycle rank, network size, degree, diameter):", value="", required=False) topology_metrics
+#@ File(label="Stage profile directory (optional):", style="directory", required=False) profile_directory
+#@ Integer(label="Heap limit for images analyzed at once (MB, 0 = off):", value=0, min=0) memory_limit
+
+#@ OpService ops
+#@ StatusService status
+
+import mina.batch
+import mina.cache
+import mina.graph
+import mina.filters
+import mina.profiling
+import mina.tables
+
+from ij import IJ
+
+import json
+import os
+import time
+
+
+# The run function..............................................................
+def run(image_directory, file_pattern, threshold_method, workers, user_comment):
+    status.showStatus("Finding images...")
+    paths = mina.batch.find_images(image_directory, file_pattern, recursive)
+    if len(paths) == 0:
+        status.showStatus("No images matching %s were found." % file_pattern)
+        return
+
+    pipeline = None
+    if pipeline_path is not None and pipeline_path.exists():
+        pipeline = mina.filters.Pipeline.load(pipeline_path)
+
+    status.showStatus("Analyzing %s images..." % len(paths))
+    start = time.time()
+    sinks = []
+    if results_path is not None and str(results_path) != "":
+        sinks.append(mina.tables.openSink(results_path))
+    if show_table or len(sinks) == 0:
+        sinks.append(mina.tables.SheetSink("Mito Morphology Batch"))
+
+    branch_sink = network_sink = None
+    if export_tables and results_path is not None and str(results_path) != "":
+        root, extension = os.path.splitext(str(results_path))
+        branch_sink = mina.tables.openSink(root + "_branches" + extension)
+        network_sink = mina.tables.openSink(root + "_networks" + extension)
+
+    sketches = None
+    if sketch_directory is not None and str(sketch_directory) != "":
+        sketches = str(sketch_directory)
+
+    topology = [metric.strip() for metric in (topology_metrics or "").split(",") if metric.strip() != ""]
+    unknown = [metric for metric in topology if metric not in mina.graph.TOPOLOGY_METRICS]
+    if len(unknown) > 0:
+        status.showStatus("Unknown topology metrics: %s" % ", ".join(unknown))
+        return
+
+    profiles = None
+    if profile_directory is not None and str(profile_directory) != "":
+        profiles = str(profile_directory)
+
+    cache = None
+    if cache_directory is not None and str(cache_directory) != "":
+        cache = mina.cache.IntermediateCache(cache_directory, cache_size * 1024 ** 2)
+
+    with mina.tables.MultiSink(*sinks) as sink:
+        rows = mina.batch.run_batch(paths, ops, threshold_method, workers, preprocess=pipeline, sink=sink,
+                                    extra_columns=mina.tables.commentToDict(user_comment),
+                                    branch_sink=branch_sink, network_sink=network_sink,
+                                    sketch_directory=sketches, cache=cache,
+                                    tile_size=tile_size or None, topology=topology,
+                                    profile_directory=profiles,
+                                    memory_limit=memory_limit * 1024 ** 2 or None)
+    for table_sink in [branch_sink, network_sink]:
+        if table_sink is not None:
+            table_sink.close()
+
+    if sketches is not None:
+        # Only the sketches of this batch, not those left in the directory by earlier runs
+        paths_written = [mina.batch.sidecar_path(sketches, row["image path"], mina.batch.SKETCH_SUFFIX)
+                         for row in rows if row["error"] == ""]
+        summary = mina.batch.aggregate_sketches(paths_written)
+        IJ.log("Experiment-wide branch lengths (the %s images of this batch):" % len(paths_written))
+        for key, value in summary.items():
+            IJ.log("  %s: %s" % (key, value))
+
+    if profiles is not None:
+        # Only the profiles of this batch, every image saves one even if it failed
+        paths_written = [mina.batch.sidecar_path(profiles, row["image path"], mina.profiling.PROFILE_SUFFIX)
+                         for row in rows]
+        summary = mina.profiling.aggregate_profiles(paths_written)
+        with open(os.path.join(profiles, "batch-profile.json"), "w") as handle:
+            handle.write(json.dumps(summary, indent=1))
+        IJ.log("Time per stage (the %s images of this batch):" % len(paths_written))
+        for stage, values in summary.items():
+            IJ.log("  %s: %.2f s total, %.2f s mean, %.2f s max over %s images, peak heap %.0f MB"
+                   % (stage, values["total time (s)"], values["mean time (s)"], values["max time (s)"],
+                      values["images"], values["max peak heap (MB)"]))
+
+    failed = len([row for row in rows if row["error"] != ""])
+    status.showStatus("Done batch analysis of %s images in %.1f s (%s failed)!"
+                      % (len(rows), time.time() - start, failed))
+
+# Run the script...
+if (__name__=="__main__") or (__name__=="__builtin__"):
+    run(image_directory, file_pattern, threshold_method, workers, user_comment)
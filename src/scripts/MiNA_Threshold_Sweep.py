@@ -0,0 +1,52 @@
+#@ ImagePlus imp
+#@ String(label="Thresholding Ops (comma separated):", value="huang, ij1, intermodes, isoData, li, maxEntropy, maxLikelihood, mean, minError, minimum, moments, otsu, percentile, renyiEntropy, rosin, shanbhag, triangle, yen") threshold_methods
+#@ File(label="Preprocessing pipeline file (optional):", required=False) pipeline_path
+#@ Integer(label="Worker threads (0 = all processors):", value=0, min=0) workers
+#@ String(label="User comment: ", value="") user_comment
+
+#@ OpService ops
+#@ StatusService status
+
+import mina.analysis
+import mina.filters
+import mina.tables
+
+from collections import OrderedDict
+
+from ij.plugin import Duplicator
+
+import time
+
+
+# The run function..............................................................
+def run(imp, threshold_methods, workers, user_comment):
+    methods = [method.strip() for method in threshold_methods.split(",") if method.strip() != ""]
+    unknown = [method for method in methods if method not in mina.analysis.THRESHOLD_METHODS]
+    if len(unknown) > 0:
+        status.showStatus("Unknown thresholding ops: %s" % ", ".join(unknown))
+        return
+
+    pipeline = None
+    if pipeline_path is not None and pipeline_path.exists():
+        pipeline = mina.filters.Pipeline.load(pipeline_path)
+
+    # The sweep works on a copy of the current channel and time point
+    frame = imp.getFrame()
+    imp_copy = Duplicator().run(imp, imp.getChannel(), imp.getChannel(), 1, imp.getNSlices(), frame, frame)
+
+    status.showStatus("Comparing %s thresholding ops..." % len(methods))
+    start = time.time()
+    rows = mina.analysis.threshold_sweep(imp_copy, ops, methods, preprocess=pipeline, workers=workers)
+
+    sweep_tbl = mina.tables.SimpleSheet("Mito Threshold Sweep")
+    image = OrderedDict([("image title", imp.getTitle())])
+    comment = mina.tables.commentToDict(user_comment)
+    for row in rows:
+        sweep_tbl.writeRow(image, row, comment)
+    sweep_tbl.updateDisplay()
+
+    status.showStatus("Done comparing %s thresholding ops in %.1f s!" % (len(methods), time.time() - start))
+
+# Run the script...
+if (__name__=="__main__") or (__name__=="__builtin__"):
+    run(imp, threshold_methods, workers, user_comment)